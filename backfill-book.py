@@ -0,0 +1,106 @@
+import os
+import json
+import argparse
+import threading
+
+from ocr_engine import create_ocr_engine, EagerOCRQueue, OCR_WORKERS
+from ocr_cache import CachedOCREngine
+from book_backfill import book_chapters, find_stale_sections, backfill_sections
+from book_journal import OCR_FIELDS, journal_path
+from book_store import load_book, save_book
+
+
+def ocr_fields(section):
+    return json.dumps({field: section.get(field) for field in OCR_FIELDS}, sort_keys=True)
+
+
+def merge_into_file(json_file_path, data, targets, originals):
+    """Copies the backfilled sections into the book as it is on disk now, then saves it without tearing it.
+
+    Only sections this run changed are copied, and only while their image lists still match, so anything
+    written to the file in the meantime is kept.
+    """
+    on_disk = load_book(json_file_path)
+    disk_chapters = book_chapters(on_disk)
+    for chapter_idx, section_idx in targets:
+        section = book_chapters(data)[chapter_idx]["sections"][section_idx]
+        if ocr_fields(section) == originals[(chapter_idx, section_idx)]:
+            continue
+        try:
+            disk_section = disk_chapters[chapter_idx]["sections"][section_idx]
+        except IndexError:
+            continue
+        if (disk_section.get("images", []) != section.get("images", [])
+                or disk_section.get("code_images", []) != section.get("code_images", [])):
+            continue
+        for field in OCR_FIELDS:
+            if field in section:
+                disk_section[field] = section[field]
+    save_book(json_file_path, on_disk)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="OCR sections of a book JSON whose text is missing or was extracted with other OCR settings."
+    )
+    parser.add_argument("json_file", help="Book JSON (or .db book store) written by screenshot-book.py, ss.py, "
+                                          "ss-book-gen.py or ingest-book.py")
+    parser.add_argument("--workers", type=int, default=OCR_WORKERS, help=f"OCR workers (default: {OCR_WORKERS})")
+    parser.add_argument("--all", action="store_true", help="Re-OCR every section, not just missing or stale ones")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the sections that would be OCR'd")
+    args = parser.parse_args()
+
+    # A journal means a capture session has the book open, or crashed before folding its changes in. Either
+    # way its replay would later overwrite whatever is merged here
+    if not args.dry_run and os.path.exists(journal_path(args.json_file)):
+        parser.error(f"{journal_path(args.json_file)} exists: the book is open in a capture session or one "
+                     f"crashed with it open. Quit that session, or resume the book with 'existing' once so the "
+                     f"journal is replayed, then run this again")
+
+    data = load_book(args.json_file)
+
+    ocr_engine = CachedOCREngine(create_ocr_engine(workers=args.workers))
+    if args.all:
+        targets = [
+            (chapter_idx, section_idx)
+            for chapter_idx, chapter in enumerate(book_chapters(data))
+            for section_idx, section in enumerate(chapter.get("sections", []))
+            if section.get("images") or section.get("code_images")
+        ]
+    else:
+        targets = find_stale_sections(data, ocr_engine.config_key)
+
+    chapters = book_chapters(data)
+    print(f"{len(targets)} sections need OCR in {args.json_file}")
+    for chapter_idx, section_idx in targets:
+        section = chapters[chapter_idx]["sections"][section_idx]
+        images = len(section.get("images", [])) + len(section.get("code_images", []))
+        print(f"  {chapters[chapter_idx]['chapter_name']} / {section['section_name']} ({images} images)")
+    if args.dry_run or not targets:
+        ocr_engine.shutdown()
+        return
+
+    originals = {
+        (chapter_idx, section_idx): ocr_fields(chapters[chapter_idx]["sections"][section_idx])
+        for chapter_idx, section_idx in targets
+    }
+    lock = threading.Lock()
+    cancelled = threading.Event()
+    completed = False
+    try:
+        filled = backfill_sections(
+            data, lock, EagerOCRQueue(ocr_engine), ocr_engine.config_key, targets,
+            save=lambda *_: merge_into_file(args.json_file, data, targets, originals),
+            cancelled=cancelled
+        )
+        completed = True
+        print(f"\nBackfilled {filled} of {len(targets)} sections")
+    except KeyboardInterrupt:
+        cancelled.set()
+        print("\nInterrupted; sections finished so far are saved.")
+    finally:
+        ocr_engine.shutdown(wait=completed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import os
+import time
+import argparse
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+from ocr_engine import ProcessPoolOCREngine
+from screen_capture import create_capture_backend, CAPTURE_BACKEND, CAPTURE_BACKENDS
+
+
+def run_now(fn):
+    fn()
+
+
+def print_result(label, latencies, errors):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{label:<24} {len(latencies):>4} shots  median {statistics.median(latencies) * 1000:>7.1f} ms  "
+          f"p95 {p95 * 1000:>7.1f} ms  ({errors} errors)")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure capture-to-text latency: screenshots handed to OCR in memory, with the file written "
+                    "in the background, against writing the PNG first and OCR'ing it from disk. On Linux, run "
+                    "under Xvfb, e.g. `xvfb-run -s '-screen 0 1920x1080x24' python bench-capture.py`."
+    )
+    parser.add_argument("--shots", type=int, default=10, help="Screenshots per route (default: 10)")
+    parser.add_argument("--backend", choices=sorted(CAPTURE_BACKENDS), default=CAPTURE_BACKEND,
+                        help=f"Capture backend (default: {CAPTURE_BACKEND})")
+    args = parser.parse_args()
+
+    backend = create_capture_backend(args.backend)
+    engine = ProcessPoolOCREngine(workers=1)
+    writer = ThreadPoolExecutor(max_workers=1)
+    with tempfile.TemporaryDirectory() as directory:
+        def path(route, idx):
+            return os.path.join(directory, f"{route}-{idx}.png")
+
+        try:
+            # Warm the worker so process start-up isn't billed to either route
+            warm = backend.capture(path("warm", 0))
+            warm.write_later(run_now)
+            engine.submit(warm.path).result()
+
+            in_memory, in_memory_errors = [], 0
+            for idx in range(args.shots):
+                start = time.perf_counter()
+                buffer = backend.capture(path("memory", idx))
+                future = engine.submit(buffer.path, 0, None, buffer)
+                buffer.write_later(writer.submit)
+                in_memory_errors += future.result()["error"] is not None
+                in_memory.append(time.perf_counter() - start)
+                buffer.release()
+
+            on_disk, on_disk_errors = [], 0
+            for idx in range(args.shots):
+                start = time.perf_counter()
+                buffer = backend.capture(path("disk", idx))
+                buffer.write_later(run_now)
+                on_disk_errors += engine.submit(buffer.path).result()["error"] is not None
+                on_disk.append(time.perf_counter() - start)
+        finally:
+            writer.shutdown()
+            engine.shutdown()
+
+    print(f"Capture-to-text latency, {args.backend} backend\n")
+    print_result("in memory", in_memory, in_memory_errors)
+    print_result("write, then OCR file", on_disk, on_disk_errors)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+import argparse
+
+from ocr_engine import (SerialOCREngine, ProcessPoolOCREngine, BulkOCREngine, OCR_WORKERS, OCR_BACKEND,
+                        OCR_BACKENDS, benchmark)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp')
+
+
+def find_images(directory, limit=None):
+    image_paths = []
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                image_paths.append(os.path.join(root, name))
+    image_paths.sort()
+    return image_paths[:limit] if limit else image_paths
+
+
+def print_result(label, result):
+    print(f"{label:<24} {result['images']:>6} images  {result['seconds']:>8.2f}s  "
+          f"{result['images_per_sec']:>8.2f} images/sec  ({result['errors']} errors)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare serial OCR against the process-pool OCR engine.")
+    parser.add_argument("directory", nargs="?", default="./screenshots-images-2",
+                        help="Directory to search for images (default: ./screenshots-images-2)")
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N images")
+    parser.add_argument("--workers", type=int, default=OCR_WORKERS, help=f"Pool size (default: {OCR_WORKERS})")
+    parser.add_argument("--backend", choices=sorted(OCR_BACKENDS), default=OCR_BACKEND,
+                        help=f"OCR backend (default: {OCR_BACKEND})")
+    parser.add_argument("--bulk", action="store_true",
+                        help="Also compare one tesseract run per image against one list-file run per worker")
+    args = parser.parse_args()
+
+    image_paths = find_images(args.directory, args.limit)
+    if not image_paths:
+        print(f"No images found in {args.directory}")
+        return
+
+    print(f"Benchmarking OCR on {len(image_paths)} images from {args.directory} ({args.backend} backend)\n")
+
+    serial = benchmark(SerialOCREngine(backend=args.backend), image_paths)
+    print_result("serial", serial)
+
+    engine = ProcessPoolOCREngine(workers=args.workers, backend=args.backend)
+    try:
+        # Warm the pool so process start-up isn't billed to the measured run
+        list(engine.map(image_paths[:args.workers]))
+        pooled = benchmark(engine, image_paths)
+    finally:
+        engine.shutdown()
+    print_result(f"process pool ({args.workers} workers)", pooled)
+
+    if serial["images_per_sec"] > 0:
+        print(f"\nSpeed-up: {pooled['images_per_sec'] / serial['images_per_sec']:.2f}x")
+
+    if args.bulk:
+        bench_bulk(image_paths, args.workers)
+
+
+def bench_bulk(image_paths, workers):
+    # Both sides use the tesseract CLI with the same settings; only the number of tesseract runs differs
+    print(f"\nBulk OCR: {workers} tesseract runs instead of {len(image_paths)}\n")
+    engine = ProcessPoolOCREngine(workers=workers, backend="pytesseract", triage=False)
+    try:
+        list(engine.map(image_paths[:workers]))
+        per_image = benchmark(engine, image_paths)
+    finally:
+        engine.shutdown()
+    print_result("per-image tesseract", per_image)
+
+    engine = BulkOCREngine(workers=workers)
+    try:
+        bulk = benchmark(engine, image_paths)
+    finally:
+        engine.shutdown()
+    print_result("bulk tesseract", bulk)
+
+    if per_image["images_per_sec"] > 0:
+        print(f"\nSpeed-up: {bulk['images_per_sec'] / per_image['images_per_sec']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from PIL import Image, ImageDraw, ImageFont
+
+from ocr_engine import SerialOCREngine, OCR_BACKEND, OCR_BACKENDS
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp')
+
+SAMPLE_WORDS = (
+    "the quick brown fox jumps over lazy dog market price supply demand court judgement "
+    "section chapter index value function return result python screenshot library"
+).split()
+
+
+def normalize(text):
+    return " ".join(text.split())
+
+
+def character_error_rate(reference, hypothesis):
+    reference, hypothesis = normalize(reference), normalize(hypothesis)
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_char in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_char in enumerate(hypothesis, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_char != hyp_char)
+            ))
+        previous = current
+    return previous[-1] / len(reference)
+
+
+def make_synthetic_screenshots(directory, count, seed=0):
+    """Renders Retina-sized pages with window chrome and wide margins; returns (image, truth) pairs."""
+    rng = random.Random(seed)
+    font = ImageFont.load_default(size=34)
+    samples = []
+    for idx in range(count):
+        lines = [" ".join(rng.choice(SAMPLE_WORDS) for _ in range(rng.randint(5, 9))) for _ in range(rng.randint(6, 14))]
+        img = Image.new("RGBA", (2880, 1800), (246, 244, 240, 255))
+        draw = ImageDraw.Draw(img)
+        draw.rectangle((0, 0, 2880, 56), fill=(222, 222, 222, 255))
+        for offset, colour in enumerate([(255, 95, 86, 255), (255, 189, 46, 255), (39, 201, 63, 255)]):
+            draw.ellipse((24 + offset * 40, 16, 48 + offset * 40, 40), fill=colour)
+        for line_no, line in enumerate(lines):
+            draw.text((640, 300 + line_no * 70), line, fill=(40, 40, 40, 255), font=font)
+        path = os.path.join(directory, f"synthetic_{idx}.png")
+        img.save(path)
+        samples.append((path, "\n".join(lines)))
+    return samples
+
+
+def load_labelled_images(directory):
+    """Images with a matching .txt file holding the expected text."""
+    samples = []
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        truth_path = os.path.join(directory, stem + ".txt")
+        if ext.lower() in IMAGE_EXTENSIONS and os.path.isfile(truth_path):
+            with open(truth_path, 'r', encoding='utf-8') as f:
+                samples.append((os.path.join(directory, name), f.read()))
+    return samples
+
+
+def run(label, engine, samples):
+    start = time.perf_counter()
+    results = list(engine.map([path for path, _ in samples]))
+    elapsed = time.perf_counter() - start
+    errors = sum(1 for result in results if result["error"])
+    rates = [character_error_rate(truth, result["text"] or "") for (_, truth), result in zip(samples, results)]
+    mean_cer = sum(rates) / len(rates)
+    print(f"{label:<20} {elapsed:>8.2f}s  {len(samples) / elapsed:>7.2f} images/sec  "
+          f"CER {mean_cer * 100:>6.2f}%  ({errors} errors)")
+    return elapsed, mean_cer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OCR time and character error rate with and without preprocessing.")
+    parser.add_argument("directory", nargs="?", default=None,
+                        help="Directory of images, each with a matching .txt ground truth file. "
+                             "Synthetic screenshots are generated when omitted.")
+    parser.add_argument("--synthetic", type=int, default=10, help="Number of synthetic screenshots (default: 10)")
+    parser.add_argument("--backend", choices=sorted(OCR_BACKENDS), default=OCR_BACKEND,
+                        help=f"OCR backend (default: {OCR_BACKEND})")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.directory:
+            samples = load_labelled_images(args.directory)
+            source = args.directory
+        else:
+            samples = make_synthetic_screenshots(tmp_dir, args.synthetic)
+            source = "synthetic screenshots"
+        if not samples:
+            print(f"No labelled images found in {args.directory}")
+            return
+
+        print(f"Benchmarking preprocessing on {len(samples)} images from {source} ({args.backend} backend)\n")
+        raw_seconds, raw_cer = run("without preprocess", SerialOCREngine(args.backend, preprocess=False), samples)
+        pre_seconds, pre_cer = run("with preprocess", SerialOCREngine(args.backend, preprocess=True), samples)
+
+    if pre_seconds > 0:
+        print(f"\nSpeed-up: {raw_seconds / pre_seconds:.2f}x, "
+              f"CER change: {(pre_cer - raw_cer) * 100:+.2f} points")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import threading
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from ocr_engine import OCR_ENGINE
+from image_triage import triage_record
+
+OCR_ERROR_PREFIX = "Error extracting text from image "
+
+
+def book_chapters(data: dict) -> list:
+    """Chapters of a book in either layout: {"New item": {"chapters": ...}} or {"chapters": ...}."""
+    return data.get("New item", data).get("chapters", [])
+
+
+def section_needs_ocr(section: dict, config_key: str) -> bool:
+    """True when a section's text is missing, or was extracted with different OCR settings."""
+    if not section.get("images") and not section.get("code_images"):
+        return False
+    if "ocr_config" in section:
+        return section["ocr_config"] != config_key
+    # Books written before the OCR settings were recorded: only fill in text that never arrived
+    return bool((section.get("images") and not section.get("extracted-text"))
+                or (section.get("code_images") and not section.get("extracted-code")))
+
+
+def find_stale_sections(data: dict, config_key: str,
+                        skip: Optional[Tuple[int, int]] = None) -> List[Tuple[int, int]]:
+    """(chapter_index, section_index) of every section that needs OCR, except `skip`."""
+    return [
+        (chapter_idx, section_idx)
+        for chapter_idx, chapter in enumerate(book_chapters(data))
+        for section_idx, section in enumerate(chapter.get("sections", []))
+        if (chapter_idx, section_idx) != skip and section_needs_ocr(section, config_key)
+    ]
+
+
+def _extract_texts(results: Iterator[dict]) -> Tuple[str, list, dict, dict]:
+    texts, errors, triage, escalated = [], [], {}, {}
+    for result in results:
+        if result["error"] is None:
+            texts.append(result["text"])
+            if "profile" in result:
+                triage[result["path"]] = triage_record(result)
+            if "escalation" in result:
+                escalated[result["path"]] = result["escalation"]
+        else:
+            errors.append(f"{OCR_ERROR_PREFIX}{result['path']}: {result['error']}")
+    return "\n".join(texts), errors, triage, escalated
+
+
+def backfill_sections(data: dict, lock: threading.Lock, ocr_queue, config_key: str,
+                      targets: List[Tuple[int, int]], save: Callable[[int, int, dict], None],
+                      log: Callable[[str], None] = print,
+                      cancelled: Optional[threading.Event] = None) -> int:
+    """OCRs the target sections and merges their text into `data`; returns how many were filled in.
+
+    Every target's images are queued up front so the OCR workers stay busy across sections. Results are
+    merged under `lock` one section at a time, and `save(chapter_index, section_index, section)` is called
+    with the lock still held. A section whose images changed while it was being OCR'd is left alone. Once
+    `cancelled` is set, images still queued are dropped so they don't hold up OCR the program still needs.
+    """
+    jobs = []
+    with lock:
+        chapters = book_chapters(data)
+        for chapter_idx, section_idx in targets:
+            section = chapters[chapter_idx]["sections"][section_idx]
+            jobs.append((
+                section,
+                list(section.get("images", [])),
+                list(section.get("code_images", [])),
+                dict(section.get("scroll_overlaps", {}))
+            ))
+
+    if OCR_ENGINE == "eager":
+        for section, image_paths, code_image_paths, scroll_overlaps in jobs:
+            for image_type, paths in (("images", image_paths), ("code_images", code_image_paths)):
+                for path in paths:
+                    # Lowest class, so screenshots captured meanwhile are OCR'd first
+                    ocr_queue.enqueue(path, scroll_overlaps.get(path, 0), image_type, priority="backfill")
+
+    def discard_from(start):
+        for _, image_paths, code_image_paths, _ in jobs[start:]:
+            ocr_queue.discard(image_paths + code_image_paths)
+
+    filled = 0
+    for idx, ((chapter_idx, section_idx), (section, image_paths, code_image_paths, scroll_overlaps)) in \
+            enumerate(zip(targets, jobs)):
+        if cancelled is not None and cancelled.is_set():
+            discard_from(idx)
+            break
+        if OCR_ENGINE == "bulk":
+            results = list(ocr_queue.collect(image_paths + code_image_paths, scroll_overlaps))
+            image_results, code_results = results[:len(image_paths)], results[len(image_paths):]
+        else:
+            image_results = ocr_queue.collect(image_paths, scroll_overlaps, "images")
+            code_results = ocr_queue.collect(code_image_paths, scroll_overlaps, "code_images")
+        text, text_errors, text_triage, text_escalated = _extract_texts(image_results)
+        code, code_errors, code_triage, code_escalated = _extract_texts(code_results)
+
+        with lock:
+            if cancelled is not None and cancelled.is_set():
+                discard_from(idx + 1)
+                break
+            if section.get("images", []) != image_paths or section.get("code_images", []) != code_image_paths:
+                log(f"Skipped backfill of section '{section['section_name']}': its images changed meanwhile")
+                continue
+            failed = bool(text_errors or code_errors)
+            # A partial read only fills in text that never arrived; it never replaces a complete earlier one
+            if not failed or not section.get("extracted-text"):
+                section["extracted-text"] = text
+            if not failed or not section.get("extracted-code"):
+                section["extracted-code"] = code
+            section.setdefault("ocr_triage", {}).update(text_triage)
+            section["ocr_triage"].update(code_triage)
+            if text_escalated or code_escalated:
+                section.setdefault("ocr_escalated", {}).update(text_escalated)
+                section["ocr_escalated"].update(code_escalated)
+            section["ocr_seconds_saved"] = round(
+                sum(entry["seconds_saved"] or 0 for entry in section["ocr_triage"].values()), 3
+            )
+            # Every image was read again, so this run's OCR errors replace those of earlier runs
+            if "errors" in section or failed:
+                section["errors"] = [
+                    error for error in section.get("errors", []) if not error.startswith(OCR_ERROR_PREFIX)
+                ] + text_errors + code_errors
+            if not failed:
+                section["ocr_config"] = config_key
+            save(chapter_idx, section_idx, section)
+        filled += 1
+        if failed:
+            log(f"Backfill of section '{section['section_name']}' failed for {len(text_errors) + len(code_errors)} "
+                f"images; any earlier text was kept and it will be tried again next time")
+        else:
+            log(f"Backfilled OCR for section '{section['section_name']}' "
+                f"({len(image_paths) + len(code_image_paths)} images)")
+    return filled
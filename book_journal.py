@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import threading
+from typing import List, Optional
+
+from book_backfill import book_chapters
+
+# On by default; set BOOK_JOURNAL=0 to go back to saving only the full JSON
+BOOK_JOURNAL = os.environ.get("BOOK_JOURNAL", "1") == "1"
+# Journal lines are written and fsynced together at most this often
+JOURNAL_SYNC_MS = int(os.environ.get("JOURNAL_SYNC_MS", "200"))
+# With the journal on, the full JSON only needs rewriting this often
+JOURNAL_COMPACT_MS = int(os.environ.get("JOURNAL_COMPACT_MS", "30000"))
+# Everything OCR writes into a section
+OCR_FIELDS = ("extracted-text", "extracted-code", "ocr_triage", "ocr_seconds_saved", "ocr_escalated", "ocr_config",
+              "errors")
+
+
+def journal_path(json_file_path: str) -> str:
+    return json_file_path + '.journal.jsonl'
+
+
+# --- Events -----------------------------------------------------------------------------------------
+# Each event carries the values it sets, so replaying one that is already in the snapshot changes nothing.
+
+def chapter_created(chapter_index: int, chapter: dict) -> dict:
+    return {"type": "chapter_created", "chapter_index": chapter_index, "chapter": chapter}
+
+
+def section_created(chapter_index: int, section_index: int, section: dict) -> dict:
+    return {"type": "section_created", "chapter_index": chapter_index, "section_index": section_index,
+            "section": section}
+
+
+def image_added(chapter_index: int, section_index: int, image_type: str, path: str,
+                image_hash: Optional[str]) -> dict:
+    return {"type": "image_added", "chapter_index": chapter_index, "section_index": section_index,
+            "image_type": image_type, "path": path, "hash": image_hash}
+
+
+def duplicate_flagged(chapter_index: int, section_index: int, duplicate: dict) -> dict:
+    return {"type": "duplicate_flagged", "chapter_index": chapter_index, "section_index": section_index,
+            "duplicate": duplicate}
+
+
+def scroll_overlap(chapter_index: int, section_index: int, path: str, crop_top: int) -> dict:
+    return {"type": "scroll_overlap", "chapter_index": chapter_index, "section_index": section_index,
+            "path": path, "crop_top": crop_top}
+
+
+def image_verified(chapter_index: int, section_index: int, path: str, error: Optional[str] = None) -> dict:
+    return {"type": "image_verified", "chapter_index": chapter_index, "section_index": section_index,
+            "path": path, "error": error}
+
+
+def ocr_completed(chapter_index: int, section_index: int, section: dict) -> dict:
+    return {"type": "ocr_completed", "chapter_index": chapter_index, "section_index": section_index,
+            "fields": {field: section[field] for field in OCR_FIELDS if field in section}}
+
+
+def apply_event(data: dict, event: dict):
+    """Replays one journal event onto the book."""
+    chapters = book_chapters(data)
+    kind = event["type"]
+    if kind == "chapter_created":
+        if len(chapters) == event["chapter_index"]:
+            chapters.append(event["chapter"])
+        return
+    chapter = chapters[event["chapter_index"]]
+    if kind == "section_created":
+        if len(chapter["sections"]) == event["section_index"]:
+            chapter["sections"].append(event["section"])
+        return
+
+    section = chapter["sections"][event["section_index"]]
+    if kind == "image_added":
+        images = section.setdefault(event["image_type"], [])
+        if event["path"] not in images:
+            images.append(event["path"])
+        if event["hash"]:
+            section.setdefault("image_hashes", {})[event["path"]] = event["hash"]
+        section["status"] = "images testing in progress"
+    elif kind == "duplicate_flagged":
+        duplicates = section.setdefault("duplicate_images", [])
+        if all(entry["path"] != event["duplicate"]["path"] for entry in duplicates):
+            duplicates.append(event["duplicate"])
+    elif kind == "scroll_overlap":
+        section.setdefault("scroll_overlaps", {})[event["path"]] = event["crop_top"]
+    elif kind == "image_verified":
+        if event["error"] is None:
+            if not section.get("errors"):
+                section["status"] = "images tested ok"
+        else:
+            errors = section.setdefault("errors", [])
+            if event["error"] not in errors:
+                errors.append(event["error"])
+            section["status"] = "errors encountered"
+    elif kind == "ocr_completed":
+        section.update(event["fields"])
+    else:
+        raise ValueError(f"Unknown journal event '{kind}'")
+
+
+def read_journal(json_file_path: str) -> List[dict]:
+    """Events in the journal, in order. A line cut off by a crash ends the journal."""
+    events = []
+    try:
+        with open(journal_path(json_file_path), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+    except FileNotFoundError:
+        pass
+    return events
+
+
+def recover_book(json_file_path: str, data: dict) -> int:
+    """Replays changes the last session journaled but never compacted into the JSON; returns how many."""
+    events = read_journal(json_file_path)
+    for event in events:
+        apply_event(data, event)
+    return len(events)
+
+
+class BookJournal:
+    """Append-only log of book changes, written and fsynced in small groups by a background thread."""
+
+    def __init__(self, json_file_path: str, reset: bool = False, sync_ms: int = JOURNAL_SYNC_MS):
+        self.path = journal_path(json_file_path)
+        self.sync_interval = max(sync_ms, 0) / 1000.0
+        self.syncs = 0
+        self._buffer = []
+        self._closed = False
+        self._condition = threading.Condition()
+        # Held while the file itself is being written or compacted
+        self._file_lock = threading.Lock()
+        if reset and os.path.exists(self.path):
+            os.remove(self.path)
+        # Events left by the last session were replayed into the book and count as the first ones here
+        existing = read_journal(json_file_path)
+        self._rewrite([json.dumps(event) + '\n' for event in existing])
+        self.seq = self.synced_seq = len(existing)
+        # Sequence number of the first line in the file
+        self.first_seq = 1
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._run, name="book-journal", daemon=True)
+        self._thread.start()
+
+    def append(self, event: dict) -> int:
+        """Queues an event and returns its sequence number. Serialised now, so later changes don't leak in."""
+        line = json.dumps(event) + '\n'
+        with self._condition:
+            self.seq += 1
+            self._buffer.append((self.seq, line))
+            self._condition.notify()
+            return self.seq
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._buffer and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                # Let events arriving close together share one fsync
+                deadline = time.monotonic() + self.sync_interval
+                while not self._closed and time.monotonic() < deadline:
+                    self._condition.wait(deadline - time.monotonic())
+            self.sync()
+
+    def sync(self):
+        with self._file_lock:
+            with self._condition:
+                pending, self._buffer = self._buffer, []
+            if not pending:
+                return
+            self._file.write(''.join(line for _, line in pending))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.synced_seq = pending[-1][0]
+            self.syncs += 1
+
+    def mark(self) -> int:
+        """Sequence number of the latest event; call it while the snapshot being compacted into is taken."""
+        with self._condition:
+            return self.seq
+
+    def _rewrite(self, lines: List[str]):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def compact(self, upto_seq: int):
+        """Drops events up to `upto_seq` once the snapshot JSON containing them is safely on disk."""
+        self.sync()
+        with self._file_lock:
+            if upto_seq < self.first_seq:
+                return
+            self._file.close()
+            with open(self.path, 'r', encoding='utf-8') as f:
+                kept = [line for seq, line in enumerate(f, self.first_seq) if seq > upto_seq]
+            self._rewrite(kept)
+            self.first_seq = upto_seq + 1
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.sync()
+        with self._file_lock:
+            self._file.close()
+            # Everything was compacted into the JSON; nothing is left to recover
+            if self.first_seq > self.synced_seq:
+                os.remove(self.path)
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Callable, Optional
+
+from book_journal import JOURNAL_COMPACT_MS
+from book_store import BookStore, is_store_path
+from session_metrics import session_metrics
+
+# Minimum time between two writes of the book JSON; changes made in between go out together
+PERSIST_INTERVAL_MS = int(os.environ.get("PERSIST_INTERVAL_MS", "500"))
+
+
+def _snapshot(value):
+    """A copy of JSON-shaped data: dicts and lists are copied, strings and numbers shared, since they never change."""
+    if isinstance(value, dict):
+        return {key: _snapshot(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_snapshot(item) for item in value]
+    return value
+
+
+class BookPersister:
+    """Writes the book JSON in the background, at most once per interval, however often it changes.
+
+    Callers mark the book dirty while holding the shared lock. The writer thread only holds the lock for a
+    structural copy of the book (several times faster than an indented dump); encoding and writing happen
+    after the lock is released. Files are written to a temporary name and renamed over the
+    book, so a crash never leaves a half-written JSON behind.
+
+    With a journal, every change is also appended to it as it happens, and each full write compacts the
+    journal down to the changes made since its snapshot.
+
+    A path ending in .db is saved to a BookStore instead, where only the sections that changed are rewritten.
+    """
+
+    def __init__(self, path: str, lock: threading.Lock, get_data: Callable[[], dict],
+                 interval_ms: Optional[int] = None, journal=None):
+        self.path = path
+        self.lock = lock
+        self.get_data = get_data
+        self.journal = journal
+        self._store = BookStore(path) if is_store_path(path) else None
+        if interval_ms is None:
+            # The journal already keeps every change safe, so the full JSON can be written far less often
+            interval_ms = JOURNAL_COMPACT_MS if journal is not None else PERSIST_INTERVAL_MS
+        self.interval = max(interval_ms, 0) / 1000.0
+        self.started = time.perf_counter()
+        self.writes = 0
+        self.marks = 0
+        self.bytes_written = 0
+        self.write_seconds = 0.0
+        self._dirty = False
+        self._closed = False
+        self._last_write = 0.0
+        self._condition = threading.Condition()
+        # Serialises writes so flush() and the writer thread never rename over each other
+        self._write_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="book-persister", daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self):
+        """Schedules a write. Cheap enough to call with the shared lock held."""
+        with self._condition:
+            self._dirty = True
+            self.marks += 1
+            self._condition.notify()
+
+    def record(self, event: dict):
+        """Journals one change (see book_journal) and schedules a write. Call it with the shared lock held."""
+        if self.journal is not None:
+            self.journal.append(event)
+        self.mark_dirty()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._dirty and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                # Give later changes a chance to join this write
+                delay = self._last_write + self.interval - time.perf_counter()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    if self._closed:
+                        return
+            self._write()
+
+    def _write(self):
+        with self._write_lock:
+            with self._condition:
+                if not self._dirty:
+                    return
+                self._dirty = False
+            with self.lock:
+                snapshot = _snapshot(self.get_data())
+                journal_seq = self.journal.mark() if self.journal is not None else None
+            start = time.perf_counter()
+            temp_path = self.path + '.tmp'
+            try:
+                if self._store is not None:
+                    written = self._store.save(snapshot)
+                else:
+                    encoded = json.dumps(snapshot, indent=4).encode('utf-8')
+                    with open(temp_path, 'wb') as f:
+                        f.write(encoded)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(temp_path, self.path)
+                    written = len(encoded)
+                if journal_seq is not None:
+                    self.journal.compact(journal_seq)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Error saving {self.path}: {e}")
+                session_metrics.increment("persist_errors")
+                with self._condition:
+                    self._dirty = True
+                return
+            finally:
+                self._last_write = time.perf_counter()
+            self.write_seconds += self._last_write - start
+            session_metrics.observe("persist", self._last_write - start)
+            self.bytes_written += written
+            self.writes += 1
+
+    def flush(self):
+        """Writes any pending changes now, in the calling thread. Must not be called with the shared lock held."""
+        self._write()
+
+    def close(self):
+        """Writes pending changes and stops the writer thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+        if self.journal is not None:
+            self.journal.close()
+        if self._store is not None:
+            self._store.close()
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "writes": self.writes,
+            "changes": self.marks,
+            "bytes": self.bytes_written,
+            "bytes_per_sec": self.bytes_written / elapsed if elapsed > 0 else 0.0,
+            "write_seconds": self.write_seconds
+        }
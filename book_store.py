@@ -0,0 +1,389 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+# Format new books are saved in: "json" (one JSON file) or "sqlite" (a .db file queried per section)
+BOOK_STORE = os.environ.get("BOOK_STORE", "json")
+BOOK_STORE_SUFFIX = ".db"
+
+# Section fields kept in their own tables; everything else stays as JSON on the section row
+IMAGE_FIELDS = ("images", "code_images")
+TEXT_FIELDS = ("extracted-text", "extracted-code", "gpt-processed-text")
+# Per-image section fields kept only on the image rows (hash and crop_top), rebuilt from them on export.
+# Entries for paths that aren't among the section's images have no row, so they stay with the section's JSON
+IMAGE_MAP_FIELDS = {"image_hashes": "hash", "scroll_overlaps": "crop_top"}
+SECTION_COLUMNS = ("section_id", "section_name", "section_path", "status")
+CHAPTER_COLUMNS = ("chapter_id", "chapter_name", "chapter_path")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS book (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chapters (
+    chapter_index INTEGER PRIMARY KEY,
+    chapter_id,
+    chapter_name TEXT,
+    chapter_path TEXT,
+    fields TEXT NOT NULL,
+    extra TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sections (
+    chapter_index INTEGER NOT NULL,
+    section_index INTEGER NOT NULL,
+    section_id,
+    section_name TEXT,
+    section_path TEXT,
+    status TEXT,
+    fields TEXT NOT NULL,
+    extra TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (chapter_index, section_index)
+);
+CREATE INDEX IF NOT EXISTS sections_by_id ON sections (section_id);
+CREATE INDEX IF NOT EXISTS sections_by_status ON sections (status);
+CREATE TABLE IF NOT EXISTS images (
+    chapter_index INTEGER NOT NULL,
+    section_index INTEGER NOT NULL,
+    image_type TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    hash TEXT,
+    crop_top INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chapter_index, section_index, image_type, position)
+);
+CREATE INDEX IF NOT EXISTS images_by_path ON images (path);
+CREATE TABLE IF NOT EXISTS texts (
+    chapter_index INTEGER NOT NULL,
+    section_index INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    text TEXT,
+    PRIMARY KEY (chapter_index, section_index, kind)
+);
+"""
+# Stores created while texts.text was NOT NULL are copied into the current table once; a JSON book can hold
+# null texts (an LLM reply with no content), and those have to round-trip
+NULLABLE_TEXTS = """
+ALTER TABLE texts RENAME TO texts_not_null;
+""" + SCHEMA[SCHEMA.index("CREATE TABLE IF NOT EXISTS texts"):] + """
+INSERT INTO texts SELECT * FROM texts_not_null;
+DROP TABLE texts_not_null;
+"""
+
+
+def is_store_path(path: str) -> bool:
+    return path.endswith(BOOK_STORE_SUFFIX)
+
+
+def book_suffix() -> str:
+    """File extension new books get under the configured BOOK_STORE."""
+    return BOOK_STORE_SUFFIX if BOOK_STORE == "sqlite" else ".json"
+
+
+def _split(record: dict, columns: Tuple[str, ...], own_tables: Tuple[str, ...]) -> Tuple[list, str, str]:
+    """Column values, the field order and the leftover fields of a chapter or section, as stored."""
+    extra = {key: value for key, value in record.items() if key not in columns and key not in own_tables}
+    return [record.get(column) for column in columns], json.dumps(list(record)), json.dumps(extra)
+
+
+def _join(fields: str, columns: dict, extra: str, tables: dict) -> dict:
+    """Rebuilds a chapter or section with its fields in their original order."""
+    values = dict(json.loads(extra), **columns, **tables)
+    return {key: values[key] for key in json.loads(fields) if key in values}
+
+
+class BookStore:
+    """A book in SQLite: chapters, sections, images and texts in indexed tables.
+
+    Chapters and sections are addressed by position, like the journal events. `save()` takes the same
+    nested dict the capture programs keep in memory and only rewrites sections that changed since the last
+    save; `export()` gives that dict back. Readers can instead query just the rows they need.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Shared by the persister's writer thread and whoever flushes on exit; the lock keeps them apart
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # A commit must be on disk before the session journal is compacted on top of it
+            self._conn.execute("PRAGMA synchronous=FULL")
+            self._conn.executescript(SCHEMA)
+            text_not_null = self._conn.execute(
+                "SELECT \"notnull\" FROM pragma_table_info('texts') WHERE name = 'text'"
+            ).fetchone()[0]
+            if text_not_null:
+                self._conn.executescript(f"BEGIN;{NULLABLE_TEXTS}COMMIT;")
+
+    def save(self, data: dict) -> int:
+        """Replaces the stored book with `data`; returns the bytes of section data actually rewritten."""
+        root = data.get("New item", data)
+        layout = "New item" if "New item" in data else "flat"
+        chapters = root.get("chapters", [])
+        # Everything outside the chapters, so the exported JSON keeps it
+        outer = {key: value for key, value in data.items() if key != "New item"} if layout == "New item" else {}
+        inner = {key: value for key, value in root.items() if key != "chapters"}
+        written = 0
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO book (key, value) VALUES (?, ?)",
+                [("layout", layout), ("outer", json.dumps(outer)), ("inner", json.dumps(inner))]
+            )
+            digests = {
+                (row[0], row[1]): row[2]
+                for row in self._conn.execute("SELECT chapter_index, section_index, digest FROM sections")
+            }
+            self._conn.execute("DELETE FROM chapters WHERE chapter_index >= ?", (len(chapters),))
+            for chapter_idx, chapter in enumerate(chapters):
+                values, fields, extra = _split(chapter, CHAPTER_COLUMNS, ("sections",))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO chapters VALUES (?, ?, ?, ?, ?, ?)",
+                    [chapter_idx, *values, fields, extra]
+                )
+                sections = chapter.get("sections", [])
+                for table in ("sections", "images", "texts"):
+                    self._conn.execute(
+                        f"DELETE FROM {table} WHERE chapter_index = ? AND section_index >= ?",
+                        (chapter_idx, len(sections))
+                    )
+                for section_idx, section in enumerate(sections):
+                    encoded = json.dumps(section, sort_keys=True)
+                    digest = hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+                    if digests.get((chapter_idx, section_idx)) == digest:
+                        continue
+                    self._write_section(chapter_idx, section_idx, section, digest)
+                    written += len(encoded)
+            for table in ("sections", "images", "texts"):
+                self._conn.execute(f"DELETE FROM {table} WHERE chapter_index >= ?", (len(chapters),))
+        return written
+
+    def _write_section(self, chapter_idx: int, section_idx: int, section: dict, digest: str):
+        key = (chapter_idx, section_idx)
+        image_paths = {path for image_type in IMAGE_FIELDS for path in section.get(image_type, [])}
+        record = dict(section)
+        for field in IMAGE_MAP_FIELDS:
+            leftover = {path: value for path, value in section.get(field, {}).items() if path not in image_paths}
+            if leftover:
+                record[field] = leftover
+            else:
+                record.pop(field, None)
+        # Field order from the section itself, so the derived fields come back where they were
+        values, fields, _ = _split(section, SECTION_COLUMNS, IMAGE_FIELDS + TEXT_FIELDS)
+        _, _, extra = _split(record, SECTION_COLUMNS, IMAGE_FIELDS + TEXT_FIELDS)
+        # The digest of the whole section lets the next save skip it with one comparison if nothing changed
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [*key, *values, fields, extra, digest]
+        )
+        self._conn.execute("DELETE FROM images WHERE chapter_index = ? AND section_index = ?", key)
+        self._conn.execute("DELETE FROM texts WHERE chapter_index = ? AND section_index = ?", key)
+        hashes = section.get("image_hashes", {})
+        overlaps = section.get("scroll_overlaps", {})
+        self._conn.executemany(
+            "INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (*key, image_type, position, path, hashes.get(path), overlaps.get(path, 0))
+                for image_type in IMAGE_FIELDS
+                for position, path in enumerate(section.get(image_type, []))
+            ]
+        )
+        self._conn.executemany(
+            "INSERT INTO texts VALUES (?, ?, ?, ?)",
+            [(*key, kind, section[kind]) for kind in TEXT_FIELDS if kind in section]
+        )
+
+    def export(self) -> dict:
+        """The whole book in the JSON layout it was saved from."""
+        with self._lock:
+            meta = dict(self._conn.execute("SELECT key, value FROM book"))
+            chapter_rows = self._conn.execute("SELECT * FROM chapters ORDER BY chapter_index").fetchall()
+            section_rows = self._conn.execute(
+                "SELECT * FROM sections ORDER BY chapter_index, section_index"
+            ).fetchall()
+            image_rows = self._conn.execute(
+                "SELECT chapter_index, section_index, image_type, path, hash, crop_top FROM images "
+                "ORDER BY chapter_index, section_index, image_type, position"
+            ).fetchall()
+            text_rows = self._conn.execute("SELECT chapter_index, section_index, kind, text FROM texts").fetchall()
+
+        images, image_maps, texts = {}, {}, {}
+        for chapter_idx, section_idx, image_type, path, image_hash, crop_top in image_rows:
+            images.setdefault((chapter_idx, section_idx), {}).setdefault(image_type, []).append(path)
+            maps = image_maps.setdefault((chapter_idx, section_idx), {field: {} for field in IMAGE_MAP_FIELDS})
+            if image_hash is not None:
+                maps["image_hashes"][path] = image_hash
+            if crop_top:
+                maps["scroll_overlaps"][path] = crop_top
+        for chapter_idx, section_idx, kind, text in text_rows:
+            texts.setdefault((chapter_idx, section_idx), {})[kind] = text
+
+        sections = {}
+        for row in section_rows:
+            key = (row[0], row[1])
+            tables = {image_type: [] for image_type in IMAGE_FIELDS}
+            tables.update(images.get(key, {}))
+            tables.update(texts.get(key, {}))
+            # Only added back to sections that had them; _join drops fields the section didn't have
+            extra = json.loads(row[7])
+            for field, rebuilt in image_maps.get(key, {field: {} for field in IMAGE_MAP_FIELDS}).items():
+                # Books saved before kept whole copies in the JSON; the rows win over them
+                tables[field] = dict(rebuilt, **{
+                    path: value for path, value in extra.get(field, {}).items() if path not in rebuilt
+                })
+            sections.setdefault(row[0], []).append(
+                _join(row[6], dict(zip(SECTION_COLUMNS, row[2:6])), row[7], tables)
+            )
+        chapters = [
+            _join(row[4], dict(zip(CHAPTER_COLUMNS, row[1:4])), row[5], {"sections": sections.get(row[0], [])})
+            for row in chapter_rows
+        ]
+
+        root = dict(json.loads(meta.get("inner", "{}")), chapters=chapters)
+        if meta.get("layout", "New item") == "New item":
+            return dict(json.loads(meta.get("outer", "{}")), **{"New item": root})
+        return root
+
+    # --- Queries ----------------------------------------------------------------------------------------
+
+    def chapters(self) -> List[dict]:
+        """chapter_index, chapter_id and chapter_name of every chapter, without their sections."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chapter_index, chapter_id, chapter_name FROM chapters ORDER BY chapter_index"
+            ).fetchall()
+        return [dict(zip(("chapter_index", "chapter_id", "chapter_name"), row)) for row in rows]
+
+    def sections(self, chapter_index: Optional[int] = None, status: Optional[str] = None) -> List[dict]:
+        """Section rows (no images or text), optionally only one chapter's or only those with `status`."""
+        query = "SELECT chapter_index, section_index, section_id, section_name, status FROM sections"
+        conditions, params = [], []
+        if chapter_index is not None:
+            conditions.append("chapter_index = ?")
+            params.append(chapter_index)
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY chapter_index, section_index", params).fetchall()
+        return [dict(zip(("chapter_index", "section_index", "section_id", "section_name", "status"), row))
+                for row in rows]
+
+    def find_section(self, section_id) -> Optional[Tuple[int, int]]:
+        """(chapter_index, section_index) of the section with this section_id, if there is one."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT chapter_index, section_index FROM sections WHERE section_id = ?", (section_id,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def images(self, chapter_index: int, section_index: int, image_type: str = "images") -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM images WHERE chapter_index = ? AND section_index = ? AND image_type = ? "
+                "ORDER BY position", (chapter_index, section_index, image_type)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def text(self, chapter_index: int, section_index: int, kind: str = "extracted-text") -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM texts WHERE chapter_index = ? AND section_index = ? AND kind = ?",
+                (chapter_index, section_index, kind)
+            ).fetchone()
+        return row[0] if row else None
+
+    def outline(self, kinds: Tuple[str, ...] = ("extracted-text",)) -> List[dict]:
+        """Chapters and sections with only their names and the given texts, in the legacy JSON layout.
+
+        For readers that would otherwise parse the whole book just to walk names and text.
+        """
+        placeholders = ", ".join("?" for _ in kinds)
+        with self._lock:
+            chapter_rows = self._conn.execute(
+                "SELECT chapter_index, chapter_name FROM chapters ORDER BY chapter_index"
+            ).fetchall()
+            section_rows = self._conn.execute(
+                "SELECT chapter_index, section_index, section_name FROM sections "
+                "ORDER BY chapter_index, section_index"
+            ).fetchall()
+            text_rows = self._conn.execute(
+                f"SELECT chapter_index, section_index, kind, text FROM texts WHERE kind IN ({placeholders})", kinds
+            ).fetchall()
+        texts = {}
+        for chapter_idx, section_idx, kind, text in text_rows:
+            texts.setdefault((chapter_idx, section_idx), {})[kind] = text
+        sections = {}
+        for chapter_idx, section_idx, section_name in section_rows:
+            sections.setdefault(chapter_idx, []).append(
+                dict({"section_name": section_name}, **texts.get((chapter_idx, section_idx), {}))
+            )
+        return [
+            {"chapter_name": chapter_name, "sections": sections.get(chapter_idx, [])}
+            for chapter_idx, chapter_name in chapter_rows
+        ]
+
+    def set_text(self, chapter_index: int, section_index: int, kind: str, text: Optional[str]):
+        """Stores one text of a section without touching the rest of the book."""
+        key = (chapter_index, section_index)
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT fields FROM sections WHERE chapter_index = ? AND section_index = ?", key
+            ).fetchone()
+            if row is None:
+                raise KeyError(f"No section {section_index} in chapter {chapter_index}")
+            fields = json.loads(row[0])
+            if kind not in fields:
+                fields.append(kind)
+            self._conn.execute("INSERT OR REPLACE INTO texts VALUES (?, ?, ?, ?)", (*key, kind, text))
+            # Cleared digest: the next save() rewrites this section rather than trusting a stale one
+            self._conn.execute(
+                "UPDATE sections SET fields = ?, digest = '' WHERE chapter_index = ? AND section_index = ?",
+                (json.dumps(fields), *key)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_store(path: str) -> BookStore:
+    """Opens an existing book store; unlike BookStore(), never creates an empty one."""
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+    try:
+        return BookStore(path)
+    except sqlite3.DatabaseError as e:
+        raise ValueError(f"Invalid book store {path}: {e}") from e
+
+
+def load_book(path: str) -> dict:
+    """Reads a book from a JSON file or a book store. Raises ValueError if it isn't one."""
+    if is_store_path(path):
+        store = open_store(path)
+        try:
+            return store.export()
+        finally:
+            store.close()
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_book(path: str, data: dict):
+    """Writes a whole book to a JSON file or a book store, without leaving a half-written file behind."""
+    if is_store_path(path):
+        store = BookStore(path)
+        try:
+            store.save(data)
+        finally:
+            store.close()
+        return
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(temp_path, path)
@@ -0,0 +1,120 @@
+import os
+import glob
+import argparse
+
+from book_store import load_book
+from book_backfill import book_chapters, section_needs_ocr
+from ocr_engine import ocr_config_key
+from ocr_cache import OCRCache, OCR_CACHE_PATH
+from image_storage import (
+    StorageManager, book_image_paths, find_orphans, clean_temp, remove_unused_objects,
+    STORAGE_MAX_WIDTH, TEMP_MAX_AGE_SECONDS, ORPHAN_GRACE_SECONDS
+)
+
+BOOK_DIRS = ['./json-book', './completed-json', './processed-json']
+
+
+def find_books(book_dirs):
+    return sorted(
+        path
+        for directory in book_dirs
+        for pattern in ('*.json', '*.db')
+        for path in glob.glob(os.path.join(directory, pattern))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Recompress and deduplicate the screenshots of finished sections, and delete temp files and, "
+                    "with --delete-orphans, screenshots no book refers to. Every image path in the books stays valid."
+    )
+    parser.add_argument("books", nargs="*",
+                        help=f"Books (.json or .db) whose finished sections are compacted (default: every book in "
+                             f"{', '.join(BOOK_DIRS)}). Screenshots of the books found there are always kept too")
+    parser.add_argument("--screenshots-dir", default='./screenshots-images-2', help="Screenshots folder")
+    parser.add_argument("--temp-dir", default='./temp_screenshots', help="Temp folder for name captures")
+    parser.add_argument("--max-width", type=int, default=STORAGE_MAX_WIDTH,
+                        help="Scale finished screenshots down to this width (default: 0, keep full size)")
+    parser.add_argument("--delete-orphans", action="store_true",
+                        help="Also delete screenshots none of these books refers to. Only safe when every book "
+                             "using the screenshots folder is among them; books kept elsewhere (ingest-book.py "
+                             "--output, convert-book.py) are not found on their own")
+    parser.add_argument("--grace-hours", type=float, default=ORPHAN_GRACE_SECONDS / 3600,
+                        help="Only delete unreferenced screenshots older than this (default: %(default)s)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be done")
+    args = parser.parse_args()
+
+    discovered = find_books(BOOK_DIRS)
+    books = args.books or discovered
+    if not books:
+        # With no book to go by, every screenshot would look unreferenced
+        parser.error("no books found; pass the books whose screenshots should be kept")
+    # Naming some books only narrows what is compacted; every book that can be found still keeps its screenshots
+    compacted = {os.path.abspath(path) for path in books}
+    all_books = sorted(compacted | {os.path.abspath(path) for path in discovered})
+
+    referenced = set()
+    finished = []
+    config_key = ocr_config_key()
+    screenshots_dir = os.path.abspath(args.screenshots_dir) + os.sep
+    for book_path in all_books:
+        data = load_book(book_path)
+        referenced |= book_image_paths(data)
+        if book_path not in compacted:
+            continue
+        for chapter in book_chapters(data):
+            for section in chapter.get("sections", []):
+                # Sections still waiting for OCR keep their screenshots untouched until it has run
+                if section.get("status") == "images testing in progress" or section_needs_ocr(section, config_key):
+                    continue
+                paths = [
+                    path for path in section.get("images", []) + section.get("code_images", [])
+                    if os.path.abspath(path).startswith(screenshots_dir) and os.path.isfile(path)
+                ]
+                finished.append((paths, section.get("scroll_overlaps", {})))
+    missing = sorted(path for path in referenced if not os.path.exists(path))
+    orphans = find_orphans(args.screenshots_dir, referenced, args.grace_hours * 3600)
+
+    print(f"{len(all_books)} books refer to {len(referenced)} images ({len(missing)} missing)")
+    print(f"{sum(len(paths) for paths, _ in finished)} images in finished sections of {len(compacted)} books, "
+          f"{len(orphans)} unreferenced screenshots")
+    if args.dry_run:
+        for path in orphans:
+            print(f"  would delete {path}" if args.delete_orphans else f"  unreferenced {path}")
+        return
+    if not args.delete_orphans:
+        if orphans:
+            print("Unreferenced screenshots were left in place; pass --delete-orphans to delete them")
+        orphans = []
+
+    # Results cached for the screenshots' old bytes follow them to the recompressed files
+    cache = OCRCache() if os.path.exists(OCR_CACHE_PATH) else None
+    storage = StorageManager(args.screenshots_dir, args.max_width, cache)
+    try:
+        for paths, scroll_overlaps in finished:
+            storage.compact(paths, scroll_overlaps)
+    finally:
+        if cache is not None:
+            cache.close()
+    orphan_bytes = 0
+    for path in orphans:
+        stat = os.stat(path)
+        # A screenshot that still shares its stored copy only frees space once the copy is removed below
+        if stat.st_nlink == 1:
+            orphan_bytes += stat.st_size
+        os.remove(path)
+    temp_bytes = clean_temp(args.temp_dir, TEMP_MAX_AGE_SECONDS)
+    object_bytes = remove_unused_objects(storage.objects_dir)
+
+    stats = storage.stats()
+    total = stats["bytes_reclaimed"] + orphan_bytes + temp_bytes + object_bytes
+    print(f"Recompressed {stats['transcoded']} images and linked {stats['linked']} duplicates "
+          f"({stats['bytes_reclaimed'] / 1024 / 1024:.1f} MB)")
+    print(f"Deleted {len(orphans)} unreferenced screenshots ({orphan_bytes / 1024 / 1024:.1f} MB), "
+          f"{temp_bytes / 1024 / 1024:.1f} MB of temp files and "
+          f"{object_bytes / 1024 / 1024:.1f} MB of unused stored copies")
+    print(f"Reclaimed {total / 1024 / 1024:.1f} MB in total")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import os
+import argparse
+
+from book_store import load_book, save_book, is_store_path
+from book_backfill import book_chapters
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a book between a JSON file and a SQLite book store (.db). The format of each "
+                    "file follows from its extension, so this both imports JSON and exports the legacy JSON."
+    )
+    parser.add_argument("source", help="Book to read (.json or .db)")
+    parser.add_argument("target", help="Book to write (.json or .db); a .db that exists is updated in place")
+    args = parser.parse_args()
+
+    if is_store_path(args.source) == is_store_path(args.target):
+        parser.error("source and target must be one .json file and one .db book store")
+    if not os.path.isfile(args.source):
+        parser.error(f"file not found: {args.source}")
+
+    data = load_book(args.source)
+    save_book(args.target, data)
+
+    chapters = book_chapters(data)
+    sections = sum(len(chapter.get("sections", [])) for chapter in chapters)
+    print(f"Wrote {len(chapters)} chapters and {sections} sections from {args.source} to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
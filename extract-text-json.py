@@ -1,18 +1,26 @@
 import json
 import re
 
+from book_store import open_store, is_store_path
+
 def extract_gpt_text(file_path, output_file):
     try:
-        # Open and load the JSON file
-        with open(file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
+        if is_store_path(file_path):
+            # A book store only reads the names and extracted text, not the whole book
+            store = open_store(file_path)
+            chapters = store.outline(("extracted-text",))
+            store.close()
+        else:
+            # Open and load the JSON file
+            with open(file_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+
+            # Navigate the JSON structure to extract the desired text
+            chapters = data.get("New item", {}).get("chapters", [])
 
         # Prepare to collect all extracted text
         collected_text = []
 
-        # Navigate the JSON structure to extract the desired text
-        chapters = data.get("New item", {}).get("chapters", [])
-
         for chapter in chapters:
             chapter_name = chapter.get("chapter_name", "Unknown Chapter")
             collected_text.append(f"--- {chapter_name} ---\n")
@@ -35,8 +43,8 @@ def extract_gpt_text(file_path, output_file):
 
     except FileNotFoundError:
         print("The file path provided does not exist. Please check and try again.")
-    except json.JSONDecodeError:
-        print("The file is not a valid JSON file. Please check the content.")
+    except ValueError:  # json.JSONDecodeError, or a .db file that isn't a book store
+        print("The file is not a valid JSON file or book store. Please check the content.")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 
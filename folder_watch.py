@@ -0,0 +1,107 @@
+import os
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+from typing import Callable, Optional
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp')
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+_libc = None
+
+
+def _inotify():
+    global _libc
+    if _libc is None:
+        if not hasattr(os, "uname") or os.uname().sysname != "Linux":
+            raise OSError("watching a folder needs inotify, which is only available on Linux")
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    return _libc
+
+
+class FolderWatcher:
+    """Calls on_image(path) for every image file written into a folder, as soon as it is complete.
+
+    inotify reports a file when its writer closes it (IN_CLOSE_WRITE) or when it is renamed into the
+    folder (IN_MOVED_TO), so half-written files are never picked up and nothing is polled. Files already
+    in the folder when watching starts are left alone. on_image runs on the watcher thread; if it blocks,
+    further events wait in the kernel's queue.
+    """
+
+    def __init__(self, directory: str, on_image: Callable[[str], None],
+                 extensions=IMAGE_EXTENSIONS, log: Callable[[str], None] = print):
+        self.directory = os.path.abspath(directory)
+        self.on_image = on_image
+        self.extensions = extensions
+        self.log = log
+        self.picked_up = 0
+        self._fd = None
+        self._wake_read, self._wake_write = None, None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if not os.path.isdir(self.directory):
+            raise FileNotFoundError(f"Not a folder: {self.directory}")
+        libc = _inotify()
+        fd = libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+        if libc.inotify_add_watch(fd, os.fsencode(self.directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, os.strerror(errno), self.directory)
+        self._fd = fd
+        self._wake_read, self._wake_write = os.pipe()
+        self._thread = threading.Thread(target=self._run, name="folder-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops watching; returns once files already reported have been handed to on_image."""
+        if self._thread is None:
+            return
+        os.write(self._wake_write, b"x")
+        self._thread.join()
+        self._thread = None
+        for fd in (self._fd, self._wake_read, self._wake_write):
+            os.close(fd)
+
+    def _run(self):
+        while True:
+            readable, _, _ = select.select([self._fd, self._wake_read], [], [])
+            if self._wake_read in readable:
+                return
+            data = os.read(self._fd, 64 * 1024)
+            offset = 0
+            while offset < len(data):
+                _, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + name_len]
+                offset += _EVENT_HEADER.size + name_len
+                if mask & IN_Q_OVERFLOW:
+                    self.log(f"Too many new files at once in {self.directory}; some were missed and must be added by hand")
+                elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    self.log(f"Stopped watching {self.directory}: the folder was moved or deleted")
+                    return
+                elif not mask & IN_ISDIR:
+                    self._handle(os.fsdecode(name.rstrip(b"\0")))
+
+    def _handle(self, name: str):
+        if name.startswith(".") or not name.lower().endswith(self.extensions):
+            return
+        self.picked_up += 1
+        try:
+            self.on_image(os.path.join(self.directory, name))
+        except Exception as e:
+            # One bad file must not stop the watcher
+            self.log(f"Could not add {name}: {e}")
@@ -0,0 +1,63 @@
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Side of the low-frequency DCT block kept for the hash; 16 gives a 256-bit hash, fine enough
+# to tell dense text pages apart
+HASH_SIZE = 16
+HIGHFREQ_FACTOR = 4
+# Images whose hashes differ in at most this many bits count as the same capture
+DUPLICATE_HASH_DISTANCE = int(os.environ.get("DUPLICATE_HASH_DISTANCE", "8"))
+# "flag" keeps the file under the section's duplicate_images, "skip" deletes it
+DUPLICATE_ACTION = os.environ.get("DUPLICATE_ACTION", "flag")
+
+_dct_matrices = {}
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis, so dct(x) == matrix @ x."""
+    if n not in _dct_matrices:
+        k = np.arange(n)[:, None]
+        i = np.arange(n)[None, :]
+        matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+        matrix[0] /= np.sqrt(2.0)
+        _dct_matrices[n] = matrix
+    return _dct_matrices[n]
+
+
+def perceptual_hash(img: Image.Image, hash_size: int = HASH_SIZE) -> str:
+    """DCT perceptual hash as a hex string."""
+    size = hash_size * HIGHFREQ_FACTOR
+    gray = np.asarray(img.convert("L").resize((size, size), Image.LANCZOS), dtype=np.float64)
+    dct = _dct_matrix(size)
+    low = (dct @ gray @ dct.T)[:hash_size, :hash_size].flatten()
+    # The DC term only encodes overall brightness, so leave it out of the median
+    bits = low > np.median(low[1:])
+    return np.packbits(bits).tobytes().hex()
+
+
+def perceptual_hash_file(image_path: str) -> str:
+    with Image.open(image_path) as img:
+        return perceptual_hash(img)
+
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    if len(hash_a) != len(hash_b):
+        return len(hash_a) * 4
+    return int(np.unpackbits(np.frombuffer(bytes.fromhex(hash_a), dtype=np.uint8)
+                             ^ np.frombuffer(bytes.fromhex(hash_b), dtype=np.uint8)).sum())
+
+
+def find_near_duplicate(image_hash: Optional[str], known_hashes: dict,
+                        max_distance: int = DUPLICATE_HASH_DISTANCE) -> Optional[Tuple[str, int]]:
+    """Returns (path, distance) of the closest known image within max_distance, if any."""
+    if not image_hash or not known_hashes:
+        return None
+    best = None
+    for path, known_hash in known_hashes.items():
+        distance = hamming_distance(image_hash, known_hash)
+        if distance <= max_distance and (best is None or distance < best[1]):
+            best = (path, distance)
+    return best
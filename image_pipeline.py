@@ -0,0 +1,231 @@
+import io
+import os
+import shutil
+import hashlib
+import threading
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Callable, Iterable, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+# Captures handed over in memory whose file is still being written, by path
+_pending_writes = {}
+_pending_lock = threading.Lock()
+
+
+def wait_for_files(paths: Iterable[str]):
+    """Blocks until every in-memory capture among these paths has been written to disk."""
+    with _pending_lock:
+        pending = [_pending_writes[path] for path in paths if path in _pending_writes]
+    for buffer in pending:
+        buffer._written.wait()
+
+
+def _normalized(img: Image.Image) -> Image.Image:
+    img = flatten_alpha(img)
+    return img if img.mode in ("L", "RGB") else img.convert("RGB")
+
+
+def flatten_alpha(img: Image.Image) -> Image.Image:
+    # Same as pytesseract: transparent pixels become white background
+    if "A" not in img.getbands():
+        return img
+    rgba = img.convert("RGBA")
+    background = Image.new("RGB", img.size, (255, 255, 255))
+    background.paste(rgba, mask=rgba.getchannel("A"))
+    return background
+
+
+class SharedPixels:
+    """Decoded pixels in a shared memory block, which OCR worker processes map by name instead of opening the file.
+
+    Only the name, shape and mode are pickled, so handing one to a worker costs nothing. The process that
+    created the block unlinks it with release(); workers only ever map and copy from it.
+    """
+
+    def __init__(self, name: str, shape: Tuple[int, ...], mode: str):
+        self.name = name
+        self.shape = shape
+        self.mode = mode
+        self._shm = None
+
+    @classmethod
+    def create(cls, img: Image.Image) -> "SharedPixels":
+        pixels = np.asarray(img)
+        shm = shared_memory.SharedMemory(create=True, size=max(pixels.nbytes, 1))
+        np.ndarray(pixels.shape, dtype=np.uint8, buffer=shm.buf)[...] = pixels
+        shared = cls(shm.name, pixels.shape, img.mode)
+        shared._shm = shm
+        return shared
+
+    def __getstate__(self):
+        return {"name": self.name, "shape": self.shape, "mode": self.mode}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _shm=None)
+
+    def load(self, crop_top: int = 0, crop_bottom: Optional[int] = None) -> Image.Image:
+        """Copies rows crop_top up to crop_bottom (default: the last row) of the image out of shared memory."""
+        height, width = self.shape[:2]
+        bottom = height if crop_bottom is None else crop_bottom
+        row_bytes = int(np.prod(self.shape[1:]))
+        shm = shared_memory.SharedMemory(name=self.name)
+        try:
+            view = shm.buf[crop_top * row_bytes:bottom * row_bytes]
+            try:
+                return Image.frombytes(self.mode, (width, bottom - crop_top), bytes(view))
+            finally:
+                view.release()
+        finally:
+            shm.close()
+
+    def release(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+class ImageBuffer:
+    """One screenshot, read from disk once and decoded once.
+
+    Verification and the content hash work on the file bytes in memory; hashing, scroll detection and
+    triage on the single decoded image. For OCR in another process the pixels move to shared memory
+    (share()), and release() frees them once OCR is done. Nothing is read until first needed, so a missing
+    or broken file raises in whichever step touches it first, like opening the path there would.
+
+    A buffer made with from_capture() starts out in memory only: its file is written by write_later(), and
+    until then wait_for_files() on its path blocks. move() and remove() work either way.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data = None
+        self._decoded = None
+        self._content_hash = None
+        self._shared = None
+        self.bytes_read = 0
+        self.unsaved = False
+        self._written = threading.Event()
+
+    @classmethod
+    def from_capture(cls, path: str, img: Image.Image) -> "ImageBuffer":
+        """A screenshot grabbed into memory, to be written to `path` later.
+
+        The PNG is encoded once, for the archival copy and the content hash. It uses fast compression, because
+        the storage manager recompresses finished screenshots anyway.
+        """
+        buffer = cls(path)
+        encoded = io.BytesIO()
+        img.save(encoded, format="PNG", compress_level=1)
+        buffer._data = encoded.getvalue()
+        buffer._decoded = _normalized(img)
+        buffer.unsaved = True
+        with _pending_lock:
+            _pending_writes[path] = buffer
+        return buffer
+
+    def move(self, new_path: str):
+        """Renames the screenshot; one still in memory is simply written under the new name."""
+        if self.unsaved:
+            with _pending_lock:
+                _pending_writes.pop(self.path, None)
+                _pending_writes[new_path] = self
+        elif os.path.abspath(self.path) != os.path.abspath(new_path):
+            # Also works for images added from a folder on another drive
+            shutil.move(self.path, new_path)
+        self.path = new_path
+
+    def remove(self):
+        """Deletes the screenshot; one still in memory is never written."""
+        if self.unsaved:
+            with _pending_lock:
+                _pending_writes.pop(self.path, None)
+            self.unsaved = False
+            self._written.set()
+        else:
+            os.remove(self.path)
+
+    def discard(self):
+        """Drops a capture still in memory, which then is never written; a file already on disk is left alone."""
+        if self.unsaved:
+            self.remove()
+
+    def write_later(self, submit: Callable[..., Future]) -> Optional[Future]:
+        """Writes an in-memory capture to self.path via `submit`, a background pool; None if it is on disk."""
+        if not self.unsaved:
+            return None
+        return submit(self._write)
+
+    def _write(self):
+        try:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(self._data)
+            os.replace(temp_path, self.path)
+            self.unsaved = False
+        finally:
+            with _pending_lock:
+                _pending_writes.pop(self.path, None)
+            self._written.set()
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            with open(self.path, 'rb') as f:
+                self._data = f.read()
+            self.bytes_read += len(self._data)
+        return self._data
+
+    @property
+    def content_hash(self) -> str:
+        """SHA-256 of the file, same as ocr_cache.hash_image_file."""
+        if self._content_hash is None:
+            self._content_hash = hashlib.sha256(self.data).hexdigest()
+        return self._content_hash
+
+    def verify(self):
+        """Checks the file's structure and checksums, from the bytes already in memory."""
+        with Image.open(io.BytesIO(self.data)) as img:
+            img.verify()
+
+    @property
+    def decoded(self) -> Image.Image:
+        """The decoded image, alpha flattened onto white and in L or RGB mode."""
+        if self._decoded is None:
+            with Image.open(io.BytesIO(self.data)) as img:
+                img = _normalized(img)
+                img.load()
+            self._decoded = img
+        return self._decoded
+
+    def load(self, crop_top: int = 0, crop_bottom: Optional[int] = None) -> Image.Image:
+        """Rows crop_top up to crop_bottom (default: the last row) of the decoded image, for OCR in this process."""
+        img = self.decoded
+        if not crop_top and crop_bottom is None:
+            return img
+        return img.crop((0, crop_top, img.width, img.height if crop_bottom is None else crop_bottom))
+
+    def share(self) -> Optional[SharedPixels]:
+        """Moves the decoded pixels to shared memory for an OCR worker; None if the image can't be decoded.
+
+        The in-process copy is dropped, so the pixels are only held once while they wait for OCR.
+        """
+        if self._shared is None:
+            try:
+                self._shared = SharedPixels.create(self.decoded)
+            except Exception:
+                # The worker opens the file itself and reports what is wrong with it
+                return None
+            self._decoded = None
+        return self._shared
+
+    def release(self):
+        """Frees the decoded pixels; the file bytes stay until the buffer itself is dropped."""
+        self._decoded = None
+        if self._shared is not None:
+            self._shared.release()
+            self._shared = None
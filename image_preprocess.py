@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+# Off by default; set OCR_PREPROCESS=1 to clean images up before OCR
+OCR_PREPROCESS = os.environ.get("OCR_PREPROCESS", "0") == "1"
+# Text whose x-height (height of lowercase letters) is already in this range is left alone;
+# anything smaller or larger is rescaled to TARGET_X_HEIGHT
+MIN_X_HEIGHT = 14
+MAX_X_HEIGHT = 32
+TARGET_X_HEIGHT = 20
+BINARIZE_BLOCK_SIZE = 31
+BINARIZE_OFFSET = 10
+BORDER_TOLERANCE = 8
+CROP_PADDING = 10
+MIN_SCALE = 0.5
+MAX_SCALE = 4.0
+
+
+def to_grayscale(img: Image.Image) -> np.ndarray:
+    """Luma conversion with any transparency composited onto white."""
+    if img.mode == "L":
+        return np.asarray(img, dtype=np.uint8)
+    rgba = np.asarray(img.convert("RGBA"))
+    # Fixed-point BT.601 weights (77 + 150 + 29 = 256) keep the maths in uint16
+    gray = rgba[..., 0].astype(np.uint16) * 77
+    gray += rgba[..., 1].astype(np.uint16) * 150
+    gray += rgba[..., 2].astype(np.uint16) * 29
+    gray >>= 8
+    alpha = rgba[..., 3]
+    if alpha.min() < 255:
+        weight = alpha.astype(np.float32) / 255.0
+        return (gray * weight + 255.0 * (1.0 - weight)).astype(np.uint8)
+    return gray.astype(np.uint8)
+
+
+def crop_uniform_borders(gray: np.ndarray, tolerance: int = BORDER_TOLERANCE,
+                         padding: int = CROP_PADDING) -> np.ndarray:
+    """Trims rows and columns at the edges that only contain the background colour."""
+    edges = np.concatenate([gray[0], gray[-1], gray[:, 0], gray[:, -1]])
+    background = np.median(edges)
+    content = np.abs(gray.astype(np.int16) - background) > tolerance
+    rows = np.flatnonzero(content.any(axis=1))
+    cols = np.flatnonzero(content.any(axis=0))
+    if rows.size == 0 or cols.size == 0:
+        return gray
+    top = max(rows[0] - padding, 0)
+    bottom = min(rows[-1] + padding + 1, gray.shape[0])
+    left = max(cols[0] - padding, 0)
+    right = min(cols[-1] + padding + 1, gray.shape[1])
+    return gray[top:bottom, left:right]
+
+
+def adaptive_binarize(gray: np.ndarray, block_size: int = BINARIZE_BLOCK_SIZE,
+                      offset: int = BINARIZE_OFFSET) -> np.ndarray:
+    """Mean-threshold binarisation over a sliding window, computed with an integral image."""
+    pad = block_size // 2
+    padded = np.pad(gray.astype(np.float64), pad, mode="edge")
+    integral = np.pad(padded.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+    h, w = gray.shape
+    window_sum = (
+        integral[block_size:block_size + h, block_size:block_size + w]
+        - integral[:h, block_size:block_size + w]
+        - integral[block_size:block_size + h, :w]
+        + integral[:h, :w]
+    )
+    local_mean = window_sum / (block_size * block_size)
+    return np.where(gray < local_mean - offset, 0, 255).astype(np.uint8)
+
+
+def _runs(mask: np.ndarray):
+    """Start/end indices of consecutive True runs in a 1-D mask."""
+    padded = np.concatenate([[False], mask, [False]])
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    return changes[::2], changes[1::2]
+
+
+def estimate_x_height(binary: np.ndarray) -> float:
+    """Median x-height of the text lines, from the horizontal ink projection."""
+    ink_per_row = (binary == 0).sum(axis=1)
+    starts, ends = _runs(ink_per_row > 0)
+    heights = []
+    for start, end in zip(starts, ends):
+        if end - start < 3:
+            continue
+        profile = ink_per_row[start:end]
+        # Rows inside the x-height band carry most of a line's ink
+        heights.append(int((profile >= profile.max() * 0.5).sum()))
+    return float(np.median(heights)) if heights else 0.0
+
+
+def rescale_to_x_height(gray: np.ndarray, x_height: float) -> np.ndarray:
+    """Resizes only when the text is outside the size range Tesseract handles well."""
+    if x_height <= 0 or MIN_X_HEIGHT <= x_height <= MAX_X_HEIGHT:
+        return gray
+    scale = min(max(TARGET_X_HEIGHT / x_height, MIN_SCALE), MAX_SCALE)
+    h, w = gray.shape
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return np.asarray(Image.fromarray(gray).resize(size, Image.LANCZOS), dtype=np.uint8)
+
+
+def preprocess_image(img: Image.Image) -> np.ndarray:
+    """Grayscale, crop, rescale and binarise a screenshot; returns black text on white."""
+    gray = to_grayscale(img)
+    # Dark-mode screenshots: make the text dark so binarisation treats it as ink
+    if np.median(gray) < 128:
+        gray = 255 - gray
+    gray = crop_uniform_borders(gray)
+    binary = adaptive_binarize(gray)
+    rescaled = rescale_to_x_height(gray, estimate_x_height(binary))
+    if rescaled is not gray:
+        binary = adaptive_binarize(rescaled)
+    return binary
@@ -0,0 +1,112 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from image_pipeline import wait_for_files, ImageBuffer
+
+# On by default; set SCROLL_STITCH=0 to always OCR whole screenshots
+SCROLL_STITCH = os.environ.get("SCROLL_STITCH", "1") == "1"
+# Column bins per row signature
+SIGNATURE_BINS = 32
+# Overlaps shorter than this are ignored
+MIN_OVERLAP_ROWS = 40
+# Mean absolute difference (0-255) below which two row signatures count as the same pixels
+MAX_SIGNATURE_DIFF = 2.0
+# A row whose bins vary less than this carries no text
+BLANK_ROW_TOLERANCE = 3.0
+# Overlaps made only of blank rows are not worth recording
+MIN_INK_ROWS = 5
+# Signatures of the latest screenshots are kept, so the next one is compared without decoding them again
+RECENT_SIGNATURES = 8
+
+_recent_signatures = OrderedDict()
+_recent_lock = threading.Lock()
+
+
+def row_signatures(img: Image.Image, bins: int = SIGNATURE_BINS) -> np.ndarray:
+    """Mean grayscale value of each row split into column bins, shape (height, bins)."""
+    gray = np.asarray(img.convert("L"), dtype=np.float32)
+    h, w = gray.shape
+    bins = min(bins, w)
+    usable = w - w % bins
+    return gray[:, :usable].reshape(h, bins, usable // bins).mean(axis=2)
+
+
+def row_signatures_file(image_path: str) -> np.ndarray:
+    with Image.open(image_path) as img:
+        return row_signatures(img)
+
+
+def _cached_signatures(image_path: str, buffer: Optional[ImageBuffer] = None) -> np.ndarray:
+    with _recent_lock:
+        if image_path in _recent_signatures:
+            _recent_signatures.move_to_end(image_path)
+            return _recent_signatures[image_path]
+    if buffer is None:
+        wait_for_files([image_path])
+    signatures = row_signatures(buffer.decoded) if buffer is not None else row_signatures_file(image_path)
+    with _recent_lock:
+        _recent_signatures[image_path] = signatures
+        while len(_recent_signatures) > RECENT_SIGNATURES:
+            _recent_signatures.popitem(last=False)
+    return signatures
+
+
+def find_vertical_overlap(previous: np.ndarray, current: np.ndarray,
+                          min_overlap: int = MIN_OVERLAP_ROWS,
+                          max_diff: float = MAX_SIGNATURE_DIFF) -> int:
+    """Rows at the top of `current` that repeat the bottom of `previous`, or 0.
+
+    Candidate overlaps are ranked with a correlation of the per-row means, then the
+    best ones are checked against the full row signatures.
+    """
+    if previous.shape[1] != current.shape[1]:
+        return 0
+    prev_means = previous.mean(axis=1).astype(np.float64)
+    curr_means = current.mean(axis=1).astype(np.float64)
+    max_overlap = min(len(prev_means), len(curr_means))
+    if max_overlap < min_overlap:
+        return 0
+
+    # Sum of squared differences between prev[-k:] and curr[:k] for every k at once:
+    # sum(prev^2) + sum(curr^2) - 2 * cross-correlation
+    ks = np.arange(1, max_overlap + 1)
+    prev_sq = np.cumsum(prev_means[::-1] ** 2)[:max_overlap]
+    curr_sq = np.cumsum(curr_means ** 2)[:max_overlap]
+    correlation = np.correlate(prev_means, curr_means, mode="full")
+    cross = correlation[len(correlation) - ks]
+    mse = np.maximum(prev_sq + curr_sq - 2 * cross, 0) / ks
+
+    candidates = ks[(ks >= min_overlap) & (mse <= max_diff ** 2)]
+    blank = np.ptp(current, axis=1) <= BLANK_ROW_TOLERANCE
+    # Prefer the largest overlap: small scrolls repeat most of the page
+    for k in candidates[::-1]:
+        if np.abs(previous[-k:] - current[:k]).mean() > max_diff:
+            continue
+        if (~blank[:k]).sum() < MIN_INK_ROWS:
+            return 0
+        return int(k)
+    return 0
+
+
+def stitch_cut_row(previous: np.ndarray, current: np.ndarray) -> int:
+    """Row of `current` where new content starts, moved up to a blank row so no text line is split."""
+    overlap = find_vertical_overlap(previous, current)
+    if overlap == 0:
+        return 0
+    blank_rows = np.flatnonzero(np.ptp(current[:overlap], axis=1) <= BLANK_ROW_TOLERANCE)
+    # The previous screenshot may have ended part-way through a line; start the new strip above it
+    return int(blank_rows[-1]) if blank_rows.size else 0
+
+
+def scroll_cut_row(previous_path: str, image_path: str, buffer: Optional[ImageBuffer] = None) -> int:
+    """Scroll overlap of `image_path` with the screenshot before it; `buffer`, if given, holds image_path decoded."""
+    try:
+        return stitch_cut_row(_cached_signatures(previous_path), _cached_signatures(image_path, buffer))
+    except Exception:
+        # Missing or unreadable images are OCR'd whole
+        return 0
@@ -0,0 +1,196 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from PIL import Image
+
+from ocr_cache import hash_image_file, OCRCache
+from image_pipeline import wait_for_files
+from ocr_layout import LAYOUT_SUFFIX
+
+# Finished sections' screenshots are recompressed and deduplicated in the background ("0" turns it off)
+STORAGE_COMPACT = os.environ.get("STORAGE_COMPACT", "1") != "0"
+# Finished screenshots wider than this are scaled down to it; 0 keeps them at full resolution (lossless)
+STORAGE_MAX_WIDTH = int(os.environ.get("STORAGE_MAX_WIDTH", "0"))
+# Name-capture images and other files in the temp folder older than this are deleted
+TEMP_MAX_AGE_SECONDS = int(os.environ.get("TEMP_MAX_AGE_SECONDS", "3600"))
+# Unreferenced screenshots younger than this are left alone, since a running capture may not have added them yet
+ORPHAN_GRACE_SECONDS = int(os.environ.get("ORPHAN_GRACE_SECONDS", "86400"))
+# Content-addressed copies of every compacted screenshot, inside the screenshots folder
+OBJECTS_DIRNAME = '.objects'
+
+
+def book_image_paths(data: dict) -> Set[str]:
+    """Absolute paths of every image a book refers to, flagged duplicates included."""
+    chapters = data.get("New item", data).get("chapters", [])
+    paths = set()
+    for chapter in chapters:
+        for section in chapter.get("sections", []):
+            paths.update(section.get("images", []))
+            paths.update(section.get("code_images", []))
+            paths.update(entry["path"] for entry in section.get("duplicate_images", []))
+    return {os.path.abspath(path) for path in paths}
+
+
+def transcode_image(path: str, max_width: int = STORAGE_MAX_WIDTH) -> int:
+    """Rewrites a PNG smaller, if it can be; returns the bytes saved.
+
+    An alpha channel that is fully opaque is dropped and the PNG is re-encoded with the best compression,
+    which leaves every pixel as it was. Only with max_width set are wider images also scaled down. The new
+    file replaces the old one atomically, and only when it is smaller.
+    """
+    with Image.open(path) as img:
+        if img.format != "PNG":
+            # Re-encoding a JPEG would lose detail, so other formats are left as captured
+            return 0
+        img.load()
+        if img.mode == "RGBA" and img.getchannel("A").getextrema() == (255, 255):
+            img = img.convert("RGB")
+        if max_width and img.width > max_width:
+            img = img.resize((max_width, round(img.height * max_width / img.width)), Image.LANCZOS)
+        temp_path = f"{path}.compact.tmp"
+        img.save(temp_path, format="PNG", optimize=True)
+    saved = os.path.getsize(path) - os.path.getsize(temp_path)
+    if saved <= 0:
+        os.remove(temp_path)
+        return 0
+    os.replace(temp_path, path)
+    return saved
+
+
+def store_object(path: str, objects_dir: str) -> int:
+    """Files the image under its content hash; returns the bytes freed if the same image was already stored.
+
+    The book's path stays where it is: it becomes a hard link to the stored object, so identical screenshots
+    share one copy on disk. Filesystems without hard links keep the file as it is.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    content_hash = hash_image_file(path)
+    object_path = os.path.join(objects_dir, content_hash[:2], content_hash + ext)
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    try:
+        os.link(path, object_path)
+        return 0
+    except FileExistsError:
+        pass
+    except OSError:
+        return 0
+    if os.path.samefile(path, object_path):
+        return 0
+    size = os.path.getsize(path)
+    temp_path = f"{path}.link.tmp"
+    try:
+        os.link(object_path, temp_path)
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return 0
+    return size
+
+
+def remove_unused_objects(objects_dir: str) -> int:
+    """Deletes stored objects no screenshot links to anymore; returns the bytes freed."""
+    freed = 0
+    for root, _, files in os.walk(objects_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            if stat.st_nlink == 1:
+                os.remove(path)
+                freed += stat.st_size
+    return freed
+
+
+def clean_temp(temp_dir: str, max_age: float = TEMP_MAX_AGE_SECONDS) -> int:
+    """Deletes files in the temp folder older than max_age seconds; returns the bytes freed."""
+    freed = 0
+    cutoff = time.time() - max_age
+    if not os.path.isdir(temp_dir):
+        return 0
+    for entry in os.scandir(temp_dir):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            freed += entry.stat().st_size
+            os.remove(entry.path)
+    return freed
+
+
+def find_orphans(screenshots_dir: str, referenced: Set[str], grace: float = ORPHAN_GRACE_SECONDS) -> List[str]:
+    """Files in the screenshots folder that no book refers to and that are older than the grace period.
+
+    An image's layout file goes with the image: it is kept while the image is referenced.
+    """
+    cutoff = time.time() - grace
+    orphans = []
+    for root, dirs, files in os.walk(screenshots_dir):
+        dirs[:] = [name for name in dirs if name != OBJECTS_DIRNAME]
+        for name in files:
+            path = os.path.abspath(os.path.join(root, name))
+            image_path = path[:-len(LAYOUT_SUFFIX)] if name.endswith(LAYOUT_SUFFIX) else path
+            if image_path not in referenced and os.path.getmtime(path) < cutoff:
+                orphans.append(path)
+    return sorted(orphans)
+
+
+class StorageManager:
+    """Compacts the screenshots of finished sections: transcodes them and deduplicates them by content.
+
+    compact() is meant to run on a background pool once a section's OCR is done. Every path the book
+    refers to keeps pointing at the same image; only how it is stored changes. Given the OCR cache, results
+    cached for a screenshot's old bytes are filed under its new ones when it is recompressed losslessly, so
+    resuming or re-importing the book still hits the cache. Problems are reported through `log`, which
+    runs on the background pool.
+    """
+
+    def __init__(self, screenshots_dir: str, max_width: int = STORAGE_MAX_WIDTH, cache: Optional[OCRCache] = None,
+                 log: Callable[[str], None] = print):
+        self.screenshots_dir = screenshots_dir
+        self.cache = cache
+        self.log = log
+        self.objects_dir = os.path.join(screenshots_dir, OBJECTS_DIRNAME)
+        self.max_width = max_width
+        self.lock = threading.Lock()
+        self.transcoded = 0
+        self.linked = 0
+        self.bytes_reclaimed = 0
+        self.errors = 0
+
+    def compact(self, paths: Iterable[str], scroll_overlaps: Optional[Dict[str, int]] = None):
+        """Compacts the given screenshots. Ones with a recorded scroll overlap are never scaled down, since
+        the overlap is a row number in the full-size image."""
+        scroll_overlaps = scroll_overlaps or {}
+        paths = list(paths)
+        wait_for_files(paths)
+        for path in paths:
+            max_width = 0 if path in scroll_overlaps else self.max_width
+            try:
+                old_hash = hash_image_file(path) if self.cache is not None else None
+                if old_hash is not None and max_width:
+                    with Image.open(path) as img:
+                        # Scaled down, the pixels change and the cached text no longer matches them
+                        if img.width > max_width:
+                            old_hash = None
+                saved = transcode_image(path, max_width)
+                if saved and old_hash is not None:
+                    self.cache.rekey(old_hash, hash_image_file(path))
+                freed = store_object(path, self.objects_dir)
+            except (OSError, ValueError, sqlite3.Error) as e:
+                self.log(f"Could not compact {path}: {e}")
+                with self.lock:
+                    self.errors += 1
+                continue
+            with self.lock:
+                self.transcoded += saved > 0
+                self.linked += freed > 0
+                self.bytes_reclaimed += saved + freed
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "transcoded": self.transcoded,
+                "linked": self.linked,
+                "bytes_reclaimed": self.bytes_reclaimed,
+                "errors": self.errors
+            }
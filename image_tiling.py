@@ -0,0 +1,57 @@
+import os
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from image_preprocess import to_grayscale
+
+# Images with more rows than this left to OCR are cut into strips that are OCR'd in parallel ("0" turns it off)
+TILE_MIN_HEIGHT = int(os.environ.get("TILE_MIN_HEIGHT", "4000"))
+# Strips are cut close to every this many rows
+TILE_TARGET_HEIGHT = int(os.environ.get("TILE_TARGET_HEIGHT", "1500"))
+# A pixel this far (0-255) from the background colour is ink
+INK_THRESHOLD = 48
+# Rows with no more ink pixels than this count as whitespace, so stray specks don't block a cut
+MAX_GAP_INK = 2
+# A cut needs at least this many whitespace rows, so it never lands between a letter and its accent
+MIN_GAP_ROWS = 4
+
+
+def whitespace_gaps(gray: np.ndarray, min_rows: int = MIN_GAP_ROWS) -> List[Tuple[int, int]]:
+    """(first, last + 1) of every run of at least min_rows whitespace rows, from the horizontal projection profile."""
+    background = np.median(gray)
+    profile = (np.abs(gray.astype(np.int16) - int(background)) > INK_THRESHOLD).sum(axis=1)
+    blank = np.concatenate([[0], (profile <= MAX_GAP_INK).astype(np.int8), [0]])
+    edges = np.flatnonzero(np.diff(blank))
+    return [(int(start), int(end)) for start, end in zip(edges[::2], edges[1::2]) if end - start >= min_rows]
+
+
+def tile_rows(img: Image.Image, target: int = TILE_TARGET_HEIGHT) -> List[Tuple[int, int]]:
+    """(top, bottom) rows of strips covering the whole image, each cut in the middle of a whitespace gap.
+
+    Each cut goes in the tallest gap within half a strip of where the next strip would ideally end, the
+    nearest one on a tie, since the tallest gaps are usually between paragraphs. Where there is no gap in
+    reach the strip just runs on to the next one, so a line of text is never split.
+    """
+    gray = to_grayscale(img)
+    height = gray.shape[0]
+    gaps = whitespace_gaps(gray)
+    tiles, top = [], 0
+    while height - top > target * 3 // 2:
+        ideal = top + target
+        reach = [(start, end) for start, end in gaps
+                 if top + target // 2 <= (start + end) // 2 <= ideal + target // 2]
+        if not reach:
+            later = [(start, end) for start, end in gaps if (start + end) // 2 > ideal + target // 2]
+            if not later:
+                break
+            reach = later[:1]
+        start, end = max(reach, key=lambda gap: (gap[1] - gap[0], -abs((gap[0] + gap[1]) // 2 - ideal)))
+        cut = (start + end) // 2
+        if height - cut < target // 2:
+            break
+        tiles.append((top, cut))
+        top = cut
+    tiles.append((top, height))
+    return tiles
@@ -0,0 +1,86 @@
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from image_preprocess import adaptive_binarize
+
+# On by default; set OCR_TRIAGE=0 to give every image the full Tesseract layout analysis
+OCR_TRIAGE = os.environ.get("OCR_TRIAGE", "1") == "1"
+# Images are measured at roughly this width
+TRIAGE_WIDTH = 480
+# Below this fraction of ink pixels an image is treated as blank and not OCR'd
+BLANK_INK_RATIO = 0.0003
+# Pages where fewer rows than this carry ink are scattered text, not paragraphs
+SPARSE_ROW_COVERAGE = 0.2
+
+# Tesseract page segmentation mode per profile; None keeps Tesseract's automatic layout analysis
+OCR_PROFILES = {
+    "default": {"psm": None},
+    "code": {"psm": 6},     # One uniform block of text, keeps lines in order
+    "sparse": {"psm": 11},  # Find as much text as possible in no particular order
+    "blank": None,          # Nothing to read; OCR is skipped
+}
+
+
+def triage_image(img: Image.Image, image_type: Optional[str] = None) -> dict:
+    """Measures text density and layout and picks an OCR profile for the image."""
+    gray = img.convert("L")
+    factor = max(1, gray.width // TRIAGE_WIDTH)
+    if factor > 1:
+        gray = gray.reduce(factor)
+    arr = np.asarray(gray)
+    if np.median(arr) < 128:
+        arr = 255 - arr
+    ink = adaptive_binarize(arr, block_size=15, offset=12) == 0
+    ink_ratio = float(ink.mean())
+    row_coverage = float(ink.any(axis=1).mean())
+
+    if ink_ratio < BLANK_INK_RATIO:
+        profile = "blank"
+    elif image_type == "code_images":
+        profile = "code"
+    elif row_coverage < SPARSE_ROW_COVERAGE:
+        profile = "sparse"
+    else:
+        profile = "default"
+    return {"profile": profile, "ink_ratio": round(ink_ratio, 4), "row_coverage": round(row_coverage, 3)}
+
+
+class OCRCostBaseline:
+    """Running cost of default-profile OCR per megapixel, used to estimate the time triage saves."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.megapixels = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, result: dict):
+        if result.get("profile") == "default" and result.get("megapixels"):
+            with self.lock:
+                self.seconds += result["seconds"]
+                self.megapixels += result["megapixels"]
+
+    def seconds_saved(self, result: dict) -> Optional[float]:
+        with self.lock:
+            if self.megapixels == 0:
+                return None
+            estimate = self.seconds / self.megapixels * result["megapixels"]
+        return round(max(estimate - result["seconds"], 0.0), 3)
+
+
+ocr_cost_baseline = OCRCostBaseline()
+
+
+def triage_record(result: dict) -> dict:
+    """The routing decision for one OCR result, as stored under a section's ocr_triage."""
+    # A cached result's seconds were observed when it was OCR'd; counting them again would skew the baseline
+    if not result.get("cached"):
+        ocr_cost_baseline.observe(result)
+    return {
+        "profile": result["profile"],
+        "seconds": round(result["seconds"], 3),
+        "seconds_saved": 0.0 if result["profile"] == "default" else ocr_cost_baseline.seconds_saved(result)
+    }
@@ -0,0 +1,348 @@
+import os
+import re
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from ocr_engine import create_ocr_engine, EagerOCRQueue, OCR_ENGINE, OCR_WORKERS
+from ocr_cache import CachedOCREngine
+from image_hash import perceptual_hash, find_near_duplicate
+from image_stitch import row_signatures, stitch_cut_row, SCROLL_STITCH
+from image_pipeline import ImageBuffer
+from image_triage import triage_record
+from book_store import load_book, save_book, book_suffix
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp')
+JSON_DIR = './json-book'
+# Section folders keep code screenshots in a subfolder with this name
+CODE_DIR_NAME = 'code'
+# Sections being OCR'd ahead of the one being written out, per worker
+SECTIONS_IN_FLIGHT_PER_WORKER = 2
+DONE_STATUS = "text extracted"
+UUID_NAME = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+
+def natural_key(name):
+    # chapter_2 sorts before chapter_10
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+
+def list_images(directory, order='auto'):
+    paths = [
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(directory, name))
+    ]
+    if order == 'auto':
+        # Captures are saved under random UUID names, so only their timestamps keep the capture order
+        names = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+        order = 'mtime' if names and all(UUID_NAME.match(name) for name in names) else 'name'
+    if order == 'mtime':
+        return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+    return sorted(paths, key=lambda path: natural_key(os.path.basename(path)))
+
+
+def subdirectories(directory):
+    # Hidden folders are never chapters or sections, e.g. the compacted screenshot store (.objects)
+    names = [name for name in os.listdir(directory)
+             if os.path.isdir(os.path.join(directory, name)) and name != CODE_DIR_NAME and not name.startswith('.')]
+    return [os.path.join(directory, name) for name in sorted(names, key=natural_key)]
+
+
+def plan_section(section_dir, order):
+    code_dir = os.path.join(section_dir, CODE_DIR_NAME)
+    return {
+        "section_name": os.path.basename(section_dir),
+        "section_path": section_dir,
+        "images": list_images(section_dir, order),
+        "code_images": list_images(code_dir, order) if os.path.isdir(code_dir) else []
+    }
+
+
+def plan_from_directory(root, order='auto'):
+    """Chapters are the folders under root and sections the folders under each chapter.
+
+    Images lying directly in a chapter folder become a section of their own, and a root
+    without chapter folders is imported as a single chapter.
+    """
+    chapter_dirs = subdirectories(root) or [root]
+    chapters = []
+    for chapter_dir in chapter_dirs:
+        sections = [plan_section(section_dir, order) for section_dir in subdirectories(chapter_dir)]
+        loose = plan_section(chapter_dir, order)
+        if loose["images"] or loose["code_images"]:
+            sections.insert(0, loose)
+        sections = [section for section in sections if section["images"] or section["code_images"]]
+        if sections:
+            chapters.append({
+                "chapter_name": os.path.basename(os.path.abspath(chapter_dir)),
+                "chapter_path": chapter_dir,
+                "sections": sections
+            })
+    return chapters
+
+
+def plan_from_manifest(manifest_path):
+    """Reads chapters and sections from a JSON manifest.
+
+    The manifest has the same shape as a book: {"chapters": [{"chapter_name", "sections": [{"section_name",
+    "images", "code_images"}]}]}, optionally under "New item". Relative paths are resolved against the
+    manifest's folder, so an existing book JSON can be re-imported as-is.
+    """
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    manifest = manifest.get("New item", manifest)
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+
+    def resolve(path):
+        return path if os.path.isabs(path) or os.path.exists(path) else os.path.join(base_dir, path)
+
+    chapters = []
+    for chapter_idx, chapter in enumerate(manifest.get("chapters", []), 1):
+        sections = []
+        for section_idx, section in enumerate(chapter.get("sections", []), 1):
+            images = [resolve(path) for path in section.get("images", [])]
+            code_images = [resolve(path) for path in section.get("code_images", [])]
+            section_path = section.get("section_path")
+            sections.append({
+                "section_name": section.get("section_name", f"section_{section_idx}"),
+                "section_path": resolve(section_path) if section_path else os.path.dirname((images + code_images + [''])[0]),
+                "images": images,
+                "code_images": code_images
+            })
+        chapters.append({
+            "chapter_name": chapter.get("chapter_name", f"chapter_{chapter_idx}"),
+            "chapter_path": chapter.get("chapter_path", ""),
+            "sections": sections
+        })
+    return chapters
+
+
+def source_images(section):
+    """Every image a finished section was built from, including the ones flagged as duplicates."""
+    duplicates = [duplicate["path"] for duplicate in section.get("duplicate_images", [])]
+    return sorted(section.get("images", []) + section.get("code_images", []) + duplicates)
+
+
+def build_book(plan, previous=None):
+    """Lays the plan out as a book, keeping sections a previous run already finished."""
+    previous_chapters = (previous or {}).get("New item", {}).get("chapters", [])
+    chapters = []
+    for chapter_idx, planned_chapter in enumerate(plan):
+        chapter_id = chapter_idx + 1
+        previous_sections = previous_chapters[chapter_idx]["sections"] if chapter_idx < len(previous_chapters) else []
+        sections = []
+        for section_idx, planned in enumerate(planned_chapter["sections"]):
+            done = previous_sections[section_idx] if section_idx < len(previous_sections) else None
+            if (done is not None and done.get("status") == DONE_STATUS
+                    and source_images(done) == sorted(planned["images"] + planned["code_images"])):
+                sections.append(done)
+                continue
+            sections.append({
+                "section_id": float(f"{chapter_id}.{section_idx + 1}"),
+                "section_name": planned["section_name"],
+                "section_path": planned["section_path"],
+                "images": planned["images"],
+                "code_images": planned["code_images"],
+                "status": "images testing in progress",
+                "errors": [],
+                "extracted-text": "",
+                "extracted-code": ""
+            })
+        chapters.append({
+            "chapter_id": chapter_id,
+            "chapter_name": planned_chapter["chapter_name"],
+            "chapter_path": planned_chapter["chapter_path"],
+            "sections": sections
+        })
+    return {"New item": {"chapters": chapters}}
+
+
+def cut_row_or_zero(previous, current):
+    # Unreadable images have no signatures and are OCR'd whole
+    if previous is None or current is None:
+        return 0
+    return stitch_cut_row(previous, current)
+
+
+def prepare_section(section, executor):
+    """Hashes the section's images, flags near-duplicates and works out scroll overlaps, like a live capture."""
+    planned = {image_type: section[image_type] for image_type in ("images", "code_images")}
+    all_paths = planned["images"] + planned["code_images"]
+
+    def analyse(path):
+        # One read and one decode gives both the hash and the rows compared for scroll overlaps
+        buffer = ImageBuffer(path)
+        try:
+            return perceptual_hash(buffer.decoded), row_signatures(buffer.decoded) if SCROLL_STITCH else None
+        except Exception:
+            return None, None
+
+    analysed = dict(zip(all_paths, executor.map(analyse, all_paths)))
+    hashes = {path: image_hash for path, (image_hash, _) in analysed.items()}
+    section["image_hashes"] = {}
+    section["duplicate_images"] = []
+    for image_type, paths in planned.items():
+        kept = []
+        for path in paths:
+            duplicate = find_near_duplicate(hashes[path], section["image_hashes"])
+            if duplicate is not None:
+                section["duplicate_images"].append({"path": path, "duplicate_of": duplicate[0], "distance": duplicate[1]})
+                continue
+            kept.append(path)
+            if hashes[path]:
+                section["image_hashes"][path] = hashes[path]
+        section[image_type] = kept
+
+    section["scroll_overlaps"] = {}
+    if SCROLL_STITCH:
+        for paths in (section["images"], section["code_images"]):
+            pairs = list(zip(paths, paths[1:]))
+            crops = executor.map(lambda pair: cut_row_or_zero(analysed[pair[0]][1], analysed[pair[1]][1]), pairs)
+            for (_, path), crop_top in zip(pairs, crops):
+                if crop_top:
+                    section["scroll_overlaps"][path] = crop_top
+    if not section["duplicate_images"]:
+        del section["duplicate_images"]
+
+
+def finish_section(section, ocr_queue):
+    """Collects the section's OCR results in capture order and fills in its text, like process_section."""
+    scroll_overlaps = section.get("scroll_overlaps", {})
+    image_paths, code_image_paths = section["images"], section["code_images"]
+    if OCR_ENGINE == "bulk":
+        results = list(ocr_queue.collect(image_paths + code_image_paths, scroll_overlaps))
+        image_results, code_results = results[:len(image_paths)], results[len(image_paths):]
+    else:
+        image_results = ocr_queue.collect(image_paths, scroll_overlaps, "images")
+        code_results = ocr_queue.collect(code_image_paths, scroll_overlaps, "code_images")
+
+    def extract_texts(results):
+        texts = []
+        for result in results:
+            if result["error"] is None:
+                texts.append(result["text"])
+                if "profile" in result:
+                    section.setdefault("ocr_triage", {})[result["path"]] = triage_record(result)
+                if "escalation" in result:
+                    section.setdefault("ocr_escalated", {})[result["path"]] = result["escalation"]
+            else:
+                section["errors"].append(f"Error extracting text from image {result['path']}: {result['error']}")
+        return "\n".join(texts)
+
+    section["extracted-text"] = extract_texts(image_results)
+    section["extracted-code"] = extract_texts(code_results)
+    triage = section.get("ocr_triage", {}).values()
+    section["ocr_seconds_saved"] = round(sum(entry["seconds_saved"] or 0 for entry in triage), 3)
+    section["status"] = "errors encountered" if section["errors"] else DONE_STATUS
+
+
+def save_checkpoint(book, json_file_path):
+    # Never leaves a truncated file behind; a book store only rewrites the sections finished since last time
+    save_book(json_file_path, book)
+
+
+def ingest(book, json_file_path, workers=OCR_WORKERS, checkpoint_seconds=30.0):
+    sections = [
+        (chapter, section)
+        for chapter in book["New item"]["chapters"]
+        for section in chapter["sections"]
+        if section.get("status") != DONE_STATUS
+    ]
+    total_images = sum(len(section["images"]) + len(section["code_images"]) for _, section in sections)
+    print(f"Importing {len(sections)} sections ({total_images} images) into {json_file_path}\n")
+
+    ocr_engine = CachedOCREngine(create_ocr_engine(workers=workers))
+    ocr_queue = EagerOCRQueue(ocr_engine)
+    in_flight = deque()
+    max_in_flight = max(1, workers * SECTIONS_IN_FLIGHT_PER_WORKER)
+    done_images = 0
+    start = last_checkpoint = time.perf_counter()
+
+    def finish_oldest():
+        nonlocal done_images, last_checkpoint
+        chapter, section = in_flight.popleft()
+        finish_section(section, ocr_queue)
+        done_images += len(source_images(section))
+        elapsed = time.perf_counter() - start
+        print(f"[{done_images}/{total_images} images, {done_images / elapsed:.1f}/sec] "
+              f"{chapter['chapter_name']} / {section['section_name']}: {section['status']}")
+        if time.perf_counter() - last_checkpoint >= checkpoint_seconds:
+            save_checkpoint(book, json_file_path)
+            last_checkpoint = time.perf_counter()
+
+    completed = False
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for chapter, section in sections:
+                prepare_section(section, executor)
+                if OCR_ENGINE == "eager":
+                    # Later sections are OCR'd while earlier ones are being written out
+                    for image_type in ("images", "code_images"):
+                        for path in section[image_type]:
+                            ocr_queue.enqueue(path, section["scroll_overlaps"].get(path, 0), image_type)
+                in_flight.append((chapter, section))
+                if len(in_flight) > max_in_flight:
+                    finish_oldest()
+            while in_flight:
+                finish_oldest()
+        completed = True
+    except KeyboardInterrupt:
+        print("\nInterrupted; finished sections are kept and the next run resumes from there.")
+    finally:
+        save_checkpoint(book, json_file_path)
+        ocr_engine.shutdown(wait=completed)
+
+    elapsed = time.perf_counter() - start
+    cache_stats = ocr_engine.cache.stats()
+    print(f"\nImported {done_images} images in {elapsed:.1f}s "
+          f"(OCR cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses)")
+    print(f"Saved book to {json_file_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build a book JSON from screenshots already on disk, without the interactive capture program."
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("directory", nargs="?",
+                        help="Folder with one subfolder per chapter and one per section inside each chapter, "
+                             "e.g. ./screenshots-images-2")
+    source.add_argument("--manifest", help="JSON file listing chapters, sections and their images instead")
+    parser.add_argument("--output", required=True,
+                        help=f"Name or path of the book JSON to write (names are saved under {JSON_DIR}); "
+                             f"a path ending in .db writes a SQLite book store")
+    parser.add_argument("--workers", type=int, default=OCR_WORKERS, help=f"OCR workers (default: {OCR_WORKERS})")
+    parser.add_argument("--order", choices=["auto", "name", "mtime"], default="auto",
+                        help="Image order within a section (default: by name, or by time for UUID-named captures)")
+    parser.add_argument("--checkpoint-seconds", type=float, default=30.0,
+                        help="Save progress at most this often (default: 30)")
+    args = parser.parse_args()
+
+    json_file_path = args.output
+    if os.path.dirname(json_file_path) == '':
+        os.makedirs(JSON_DIR, exist_ok=True)
+        json_file_path = os.path.join(JSON_DIR, json_file_path)
+    if not json_file_path.endswith(('.json', '.db')):
+        json_file_path += book_suffix()
+
+    plan = plan_from_manifest(args.manifest) if args.manifest else plan_from_directory(args.directory, args.order)
+    if not plan:
+        print("No images found to import.")
+        return
+
+    previous = None
+    if os.path.isfile(json_file_path):
+        try:
+            previous = load_book(json_file_path)
+            print(f"Resuming from {json_file_path}")
+        except ValueError:
+            print(f"Ignoring unreadable checkpoint {json_file_path}")
+
+    book = build_book(plan, previous)
+    ingest(book, json_file_path, args.workers, args.checkpoint_seconds)
+
+
+if __name__ == "__main__":
+    main()
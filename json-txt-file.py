@@ -2,6 +2,8 @@ import json
 import os
 import re
 
+from book_store import open_store, is_store_path
+
 def sanitize_filename(name):
     """Sanitize the filename by replacing spaces and special characters with dashes."""
     # Replace spaces and special characters with dashes
@@ -18,16 +20,22 @@ def count_words_and_characters(file_path):
     return len(words), len(content)
 
 def extract_chapters_to_files(json_file_path, output_directory):
-    # Read and parse the JSON file
-    with open(json_file_path, 'r', encoding='utf-8') as file:
-        data = json.load(file)
+    if is_store_path(json_file_path):
+        # A book store only reads the names and extracted text, not the whole book
+        store = open_store(json_file_path)
+        chapters = store.outline(("extracted-text",))
+        store.close()
+    else:
+        # Read and parse the JSON file
+        with open(json_file_path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+
+        # Get chapters from the JSON structure
+        chapters = data.get("New item", {}).get("chapters", [])
 
     # Ensure the output directory exists
     os.makedirs(output_directory, exist_ok=True)
 
-    # Get chapters from the JSON structure
-    chapters = data.get("New item", {}).get("chapters", [])
-
     # Iterate through each chapter
     for chapter in chapters:
         raw_chapter_name = chapter.get("chapter_name", "Unnamed Chapter")
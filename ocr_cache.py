@@ -0,0 +1,255 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import Future
+from typing import Iterator, List, Optional
+
+from image_pipeline import ImageBuffer
+from ocr_layout import has_layout, read_layout, write_layout, OCR_LAYOUT
+
+OCR_CACHE_DIR = './ocr-cache'
+OCR_CACHE_PATH = os.path.join(OCR_CACHE_DIR, 'ocr-cache.sqlite3')
+# Total size of cached text before least recently used entries are evicted
+OCR_CACHE_MAX_BYTES = int(os.environ.get("OCR_CACHE_MAX_MB", "256")) * 1024 * 1024
+# How an image was OCR'd, kept with its text so a cache hit still counts in a section's ocr_triage and
+# ocr_escalated; seconds is what the OCR took when it ran
+RESULT_FIELDS = ("profile", "ink_ratio", "row_coverage", "megapixels", "seconds", "escalation")
+
+
+def hash_image_file(image_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OCRCache:
+    """Persistent OCR results keyed by image content hash plus OCR configuration."""
+
+    def __init__(self, path: str = OCR_CACHE_PATH, max_bytes: int = OCR_CACHE_MAX_BYTES):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_results ("
+            " key TEXT PRIMARY KEY,"
+            " text TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " meta TEXT,"
+            " layout BLOB)"
+        )
+        # Caches created before results kept their triage profile and word layout
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(ocr_results)")]
+        if "meta" not in columns:
+            self.conn.execute("ALTER TABLE ocr_results ADD COLUMN meta TEXT")
+        if "layout" not in columns:
+            self.conn.execute("ALTER TABLE ocr_results ADD COLUMN layout BLOB")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_ocr_results_last_used ON ocr_results(last_used)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_results").fetchone()[0]
+
+    @staticmethod
+    def make_key(content_hash: str, config_key: str) -> str:
+        return f"{content_hash}:{config_key}"
+
+    def get(self, key: str) -> Optional[dict]:
+        """The cached result: its text, the RESULT_FIELDS it was stored with and, if it was stored with one,
+        its word layout under "layout"."""
+        with self.lock:
+            row = self.conn.execute("SELECT text, meta, layout FROM ocr_results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE ocr_results SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        hit = dict(json.loads(row[1]) if row[1] else {}, text=row[0])
+        if row[2] is not None:
+            hit["layout"] = json.loads(gzip.decompress(row[2]))
+        return hit
+
+    def put(self, key: str, result: dict, layout: Optional[dict] = None):
+        text = result["text"]
+        meta = json.dumps({field: result[field] for field in RESULT_FIELDS if field in result})
+        # Same encoding as the layout files, a few KB per full page
+        blob = gzip.compress(json.dumps(layout, separators=(",", ":")).encode("utf-8"), mtime=0) if layout else None
+        size = len(text.encode('utf-8')) + len(meta) + (len(blob) if blob else 0)
+        with self.lock:
+            previous = self.conn.execute("SELECT size FROM ocr_results WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ocr_results (key, text, size, last_used, meta, layout) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, text, size, time.time(), meta, blob)
+            )
+            self.total_bytes += size - (previous[0] if previous else 0)
+            self._evict()
+            # Committed per image so a crash mid-section keeps everything OCR'd so far
+            self.conn.commit()
+
+    def rekey(self, old_hash: str, new_hash: str) -> int:
+        """Files every result cached for the image content old_hash under new_hash too; returns how many.
+
+        For an image whose file was rewritten without changing its pixels, such as a lossless recompression.
+        The old entries stay, since other copies of the old file may still be around.
+        """
+        old_prefix, new_prefix = self.make_key(old_hash, ""), self.make_key(new_hash, "")
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT key, text, size, last_used, meta, layout FROM ocr_results WHERE key >= ? AND key < ?",
+                (old_prefix, old_hash + ";")
+            ).fetchall()
+            for key, text, size, last_used, meta, layout in rows:
+                new_key = new_prefix + key[len(old_prefix):]
+                previous = self.conn.execute("SELECT size FROM ocr_results WHERE key = ?", (new_key,)).fetchone()
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO ocr_results (key, text, size, last_used, meta, layout) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (new_key, text, size, last_used, meta, layout)
+                )
+                self.total_bytes += size - (previous[0] if previous else 0)
+            self._evict()
+            self.conn.commit()
+        return len(rows)
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            row = self.conn.execute(
+                "SELECT key, size FROM ocr_results ORDER BY last_used ASC LIMIT 1"
+            ).fetchone()
+            if row is None:
+                self.total_bytes = 0
+                return
+            self.conn.execute("DELETE FROM ocr_results WHERE key = ?", (row[0],))
+            self.total_bytes -= row[1]
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "bytes": self.total_bytes
+            }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class CachedOCREngine:
+    """Wraps an OCR engine so images already OCR'd with the same configuration are served from the cache."""
+
+    def __init__(self, engine, cache: Optional[OCRCache] = None):
+        self.engine = engine
+        self.cache = cache or OCRCache()
+
+    @property
+    def config_key(self) -> str:
+        return self.engine.config_key
+
+    @property
+    def workers(self) -> int:
+        return getattr(self.engine, "workers", 1)
+
+    @staticmethod
+    def _usable(image_path: str, hit: Optional[dict]) -> Optional[dict]:
+        """A cache hit with its layout written beside the image if the image has no layout file yet, e.g. the
+        same screenshot under a new path. Hits cached before layouts were kept can't give one, so their
+        images are OCR'd once more instead."""
+        if hit is None:
+            return None
+        layout = hit.pop("layout", None)
+        if not OCR_LAYOUT or has_layout(image_path):
+            return hit
+        if layout is None:
+            return None
+        try:
+            write_layout(image_path, layout)
+        except OSError:
+            # The text is still good; only rebuild-text.py goes without this image's layout
+            pass
+        return hit
+
+    @staticmethod
+    def _layout(image_path: str) -> Optional[dict]:
+        # The OCR run that just finished wrote it beside the image
+        return read_layout(image_path) if OCR_LAYOUT else None
+
+    def _key(self, image_path: str, crop_top: int = 0, image_type: Optional[str] = None,
+             buffer: Optional[ImageBuffer] = None) -> str:
+        config_key = self.config_key + (f":crop{crop_top}" if crop_top else "")
+        # Triage routes prose and code images to different profiles
+        if image_type:
+            config_key += f":{image_type}"
+        content_hash = buffer.content_hash if buffer is not None else hash_image_file(image_path)
+        return self.cache.make_key(content_hash, config_key)
+
+    def map(self, image_paths: List[str], crops: Optional[dict] = None,
+            image_type: Optional[str] = None) -> Iterator[dict]:
+        crops = crops or {}
+        keys = []
+        cached = {}
+        for idx, image_path in enumerate(image_paths):
+            try:
+                key = self._key(image_path, crops.get(image_path, 0), image_type)
+            except OSError:
+                # Unreadable files go to the engine so the error is reported the usual way
+                key = None
+            keys.append(key)
+            if key is not None:
+                hit = self._usable(image_path, self.cache.get(key))
+                if hit is not None:
+                    cached[idx] = hit
+
+        misses = [path for idx, path in enumerate(image_paths) if idx not in cached]
+        miss_results = iter(self.engine.map(misses, crops, image_type))
+        for idx, image_path in enumerate(image_paths):
+            if idx in cached:
+                yield dict(cached[idx], path=image_path, error=None, cached=True)
+                continue
+            result = next(miss_results)
+            if result["error"] is None and keys[idx] is not None:
+                self.cache.put(keys[idx], result, self._layout(image_path))
+            yield result
+
+    def submit(self, image_path: str, crop_top: int = 0, image_type: Optional[str] = None,
+               buffer: Optional[ImageBuffer] = None) -> Future:
+        try:
+            key = self._key(image_path, crop_top, image_type, buffer)
+        except OSError:
+            return self.engine.submit(image_path, crop_top, image_type, buffer)
+        hit = self._usable(image_path, self.cache.get(key))
+        if hit is not None:
+            future = Future()
+            future.set_result(dict(hit, path=image_path, error=None, cached=True))
+            return future
+
+        def store(done: Future):
+            if done.cancelled() or done.exception() is not None:
+                return
+            result = done.result()
+            if result["error"] is None:
+                self.cache.put(key, result, self._layout(image_path))
+
+        future = self.engine.submit(image_path, crop_top, image_type, buffer)
+        future.add_done_callback(store)
+        return future
+
+    def shutdown(self, wait: bool = True):
+        self.engine.shutdown(wait=wait)
+        # Every put is already committed; only close once nothing can still be writing
+        if wait:
+            self.cache.close()
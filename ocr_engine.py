@@ -0,0 +1,854 @@
+import io
+import os
+import time
+import heapq
+import shutil
+import itertools
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from multiprocessing import resource_tracker
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from PIL import Image
+import numpy as np
+import pytesseract
+
+from image_preprocess import preprocess_image, OCR_PREPROCESS
+from image_triage import triage_image, OCR_PROFILES, OCR_TRIAGE
+from image_pipeline import flatten_alpha, wait_for_files, ImageBuffer, SharedPixels
+from ocr_layout import (parse_tsv, split_tsv_pages, write_layout, layout_text, layout_lines, mean_confidence,
+                        place_words, stack_layouts, LEFT, TOP, WIDTH, HEIGHT, OCR_LAYOUT)
+from image_tiling import tile_rows, TILE_MIN_HEIGHT
+from session_metrics import session_metrics
+
+# Threads Tesseract may use inside each worker. One per worker keeps the pool
+# from oversubscribing the machine with OpenMP threads.
+OMP_THREADS_PER_WORKER = 1
+# libtesseract reads the limit once, when it is loaded, and worker processes inherit it from here whether
+# they are forked or spawned; setting it later only reaches tesseract CLI subprocesses
+os.environ.setdefault("OMP_THREAD_LIMIT", str(OMP_THREADS_PER_WORKER))
+
+try:
+    import tesserocr  # Optional: keeps Tesseract loaded in-process (pip install tesserocr)
+except ImportError:
+    tesserocr = None
+
+# Number of OCR worker processes; override with the OCR_WORKERS environment variable
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+OCR_LANG = os.environ.get("OCR_LANG", "eng")
+# "tesserocr" keeps a warm Tesseract instance per worker; "pytesseract" runs the tesseract CLI per image
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "tesserocr" if tesserocr is not None else "pytesseract")
+# "eager" OCRs each screenshot as it is captured; "bulk" OCRs a whole section per tesseract run when it is closed
+OCR_ENGINE = os.environ.get("OCR_ENGINE", "eager")
+# Scheduling classes, most urgent first: names the operator is waiting on, screenshots being captured, and
+# earlier sections filled in behind them
+OCR_PRIORITIES = ("interactive", "capture", "backfill")
+# Niceness added to OCR worker processes, so name reads in the main process get the CPU first ("0" turns it off)
+OCR_WORKER_NICE = int(os.environ.get("OCR_WORKER_NICE", "10"))
+# Latency samples kept per scheduling class
+OCR_LATENCY_SAMPLES = 1000
+# Lines Tesseract reads with a lower mean word confidence (0-100) than this are read again with a heavier
+# profile: upscaled, one line at a time ("0" turns it off)
+OCR_ESCALATE_CONFIDENCE = float(os.environ.get("OCR_ESCALATE_CONFIDENCE", "70"))
+# When more than this fraction of an image's lines are low, the whole image is read again upscaled instead
+ESCALATE_IMAGE_FRACTION = 0.5
+ESCALATE_SCALE = 2
+# Rows and columns of context kept around a line that is read again
+ESCALATE_LINE_PADDING = 4
+ESCALATE_LINE_PSM = 7
+
+# An image can be given as a file path, the encoded file contents, a PIL image or a NumPy array
+ImageInput = Union[str, bytes, bytearray, memoryview, Image.Image, np.ndarray]
+
+
+def _is_encoded_buffer(image) -> bool:
+    return isinstance(image, (bytes, bytearray, memoryview))
+
+
+class PytesseractBackend:
+    """Runs the tesseract CLI for each image. File paths are handed over as-is, so they are not re-encoded."""
+
+    name = "pytesseract"
+    # The CLI reads image files itself; giving it pixels would mean encoding them to a temporary file
+    reads_files = True
+
+    def __init__(self, lang: str = OCR_LANG):
+        self.lang = lang
+
+    def image_to_string(self, image: ImageInput, psm: Optional[int] = None) -> str:
+        if _is_encoded_buffer(image):
+            image = Image.open(io.BytesIO(image))
+        config = f"--psm {psm}" if psm is not None else ""
+        return pytesseract.image_to_string(image, lang=self.lang, config=config)
+
+    def image_to_layout(self, image: ImageInput, psm: Optional[int] = None) -> Tuple[str, str]:
+        """Text and TSV word data from a single tesseract run; the text is rebuilt from the words, the way
+        the CLI's text output lays them out."""
+        if _is_encoded_buffer(image):
+            image = Image.open(io.BytesIO(image))
+        config = f"--psm {psm}" if psm is not None else ""
+        tsv = pytesseract.image_to_data(image, lang=self.lang, config=config)
+        return layout_text(parse_tsv(tsv, form_feed=True)), tsv
+
+    def close(self):
+        pass
+
+
+class TesserocrBackend:
+    """Keeps one Tesseract instance with its language model loaded for the life of the thread."""
+
+    name = "tesserocr"
+    reads_files = False
+
+    def __init__(self, lang: str = OCR_LANG):
+        if tesserocr is None:
+            raise RuntimeError("The tesserocr backend needs the tesserocr package (pip install tesserocr)")
+        self.api = tesserocr.PyTessBaseAPI(lang=lang)
+
+    def _set_pixels(self, img: Image.Image):
+        # Raw pixels go straight into Tesseract; nothing is written out or re-encoded
+        img = flatten_alpha(img)
+        if img.mode not in ("L", "RGB"):
+            img = img.convert("RGB")
+        bytes_per_pixel = len(img.getbands())
+        self.api.SetImageBytes(img.tobytes(), img.width, img.height, bytes_per_pixel, img.width * bytes_per_pixel)
+
+    def _set_image(self, image: ImageInput, psm: Optional[int] = None):
+        self.api.SetPageSegMode(psm if psm is not None else tesserocr.PSM.AUTO)
+        if isinstance(image, str):
+            self.api.SetImageFile(image)
+        elif _is_encoded_buffer(image):
+            with Image.open(io.BytesIO(image)) as img:
+                self._set_pixels(img)
+        elif isinstance(image, np.ndarray):
+            self._set_pixels(Image.fromarray(image))
+        else:
+            self._set_pixels(image)
+
+    def image_to_string(self, image: ImageInput, psm: Optional[int] = None) -> str:
+        self._set_image(image, psm)
+        return self.api.GetUTF8Text()
+
+    def image_to_layout(self, image: ImageInput, psm: Optional[int] = None) -> Tuple[str, str]:
+        """Text and TSV word data; the image is recognised once and both come from that result."""
+        self._set_image(image, psm)
+        return self.api.GetUTF8Text(), self.api.GetTSVText(0)
+
+    def close(self):
+        self.api.End()
+
+
+OCR_BACKENDS = {
+    "pytesseract": PytesseractBackend,
+    "tesserocr": TesserocrBackend,
+}
+
+_thread_local = threading.local()
+
+
+def get_backend(name: Optional[str] = None):
+    """Returns this thread's long-lived OCR backend, creating it on first use."""
+    name = name or OCR_BACKEND
+    backends = getattr(_thread_local, "backends", None)
+    if backends is None:
+        backends = _thread_local.backends = {}
+    if name not in backends:
+        if name not in OCR_BACKENDS:
+            raise ValueError(f"Unknown OCR backend '{name}'. Choose from: {', '.join(OCR_BACKENDS)}")
+        backends[name] = OCR_BACKENDS[name]()
+    return backends[name]
+
+
+def ocr_config_key(backend: Optional[str] = None, preprocess: Optional[bool] = None,
+                   triage: Optional[bool] = None, lang: str = OCR_LANG, escalate: Optional[bool] = None) -> str:
+    """Identifies the OCR settings that produced a text, for caching."""
+    key = f"{backend or OCR_BACKEND}:{lang}"
+    if OCR_PREPROCESS if preprocess is None else preprocess:
+        key += ":preprocess"
+    if OCR_TRIAGE if triage is None else triage:
+        key += ":triage"
+    if OCR_ESCALATE_CONFIDENCE if escalate is None else escalate:
+        key += f":escalate{OCR_ESCALATE_CONFIDENCE:g}"
+    return key
+
+
+def _preprocessed(image: ImageInput) -> np.ndarray:
+    if isinstance(image, str):
+        with Image.open(image) as img:
+            return preprocess_image(img)
+    if _is_encoded_buffer(image):
+        with Image.open(io.BytesIO(image)) as img:
+            return preprocess_image(img)
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    return preprocess_image(image)
+
+
+def ocr_image(image: ImageInput, backend: Optional[str] = None, preprocess: Optional[bool] = None,
+              psm: Optional[int] = None) -> str:
+    if OCR_PREPROCESS if preprocess is None else preprocess:
+        image = _preprocessed(image)
+    return get_backend(backend).image_to_string(image, psm)
+
+
+def ocr_image_layout(image: ImageInput, backend: Optional[str] = None, preprocess: Optional[bool] = None,
+                     psm: Optional[int] = None) -> Tuple[str, str]:
+    """Like ocr_image, but also returns Tesseract's TSV word data."""
+    if OCR_PREPROCESS if preprocess is None else preprocess:
+        image = _preprocessed(image)
+    return get_backend(backend).image_to_layout(image, psm)
+
+
+def _ocr_pixels(image: ImageInput, preprocess: Optional[bool] = None) -> Image.Image:
+    """The image as the OCR backend was given it, so word boxes can be cut back out of it."""
+    if isinstance(image, str):
+        image = _load_strip(image)
+    if OCR_PREPROCESS if preprocess is None else preprocess:
+        return Image.fromarray(_preprocessed(image))
+    return flatten_alpha(image).convert("L")
+
+
+def _upscaled(img: Image.Image) -> Image.Image:
+    return img.resize((img.width * ESCALATE_SCALE, img.height * ESCALATE_SCALE), Image.LANCZOS)
+
+
+def _escalate(image: ImageInput, layout: dict, backend: Optional[str] = None, preprocess: Optional[bool] = None,
+              psm: Optional[int] = None) -> Optional[dict]:
+    """Reads the low-confidence lines of an OCR'd image again with a heavier profile; None if there are none.
+
+    Each low line is cut out with a little padding, upscaled and read as a single line. When most lines are
+    low, the whole image is read again upscaled instead. A new reading replaces the old one only if its
+    confidence is higher. The layout's words are updated in place; the returned record says what was done.
+    """
+    lines = layout_lines(layout)
+    confidences = [mean_confidence(line) for line in lines]
+    # None is a line without scored words; 0.0 is a real, and the worst, confidence
+    low = [line for line, conf in zip(lines, confidences) if conf is not None and conf < OCR_ESCALATE_CONFIDENCE]
+    if not low:
+        return None
+    start = time.perf_counter()
+    before = mean_confidence(layout["words"])
+    pixels = _ocr_pixels(image, preprocess)
+    ocr = get_backend(backend)
+    if len(low) > len(lines) * ESCALATE_IMAGE_FRACTION:
+        mode = "image"
+        _, tsv = ocr.image_to_layout(_upscaled(pixels), psm)
+        words = place_words(parse_tsv(tsv)["words"], ESCALATE_SCALE)
+        replaced = len(lines) if (mean_confidence(words) or 0) > (before or 0) else 0
+        if replaced:
+            layout["words"] = words
+    else:
+        mode = "lines"
+        reread = {}
+        for line in low:
+            box = (max(0, min(word[LEFT] for word in line) - ESCALATE_LINE_PADDING),
+                   max(0, min(word[TOP] for word in line) - ESCALATE_LINE_PADDING),
+                   min(pixels.width, max(word[LEFT] + word[WIDTH] for word in line) + ESCALATE_LINE_PADDING),
+                   min(pixels.height, max(word[TOP] + word[HEIGHT] for word in line) + ESCALATE_LINE_PADDING))
+            _, tsv = ocr.image_to_layout(_upscaled(pixels.crop(box)), ESCALATE_LINE_PSM)
+            words = place_words(parse_tsv(tsv)["words"], ESCALATE_SCALE, box[0], box[1], line[0][:3])
+            if (mean_confidence(words) or 0) > (mean_confidence(line) or 0):
+                reread[id(line)] = words
+        replaced = len(reread)
+        layout["words"] = [word for line in lines for word in reread.get(id(line), line)]
+    after = mean_confidence(layout["words"])
+    return {
+        "mode": mode,
+        "low_lines": len(low),
+        "replaced_lines": replaced,
+        "confidence_before": round(before, 1) if before is not None else None,
+        "confidence_after": round(after, 1) if after is not None else None,
+        "seconds": round(time.perf_counter() - start, 3)
+    }
+
+
+def _save_layout(image_path: str, layout: dict):
+    try:
+        write_layout(image_path, layout)
+    except OSError:
+        # The text is unaffected; the image's text just can't be rebuilt without OCR
+        pass
+
+
+def _load_strip(image_path: str, crop_top: int = 0, crop_bottom: Optional[int] = None) -> Image.Image:
+    with Image.open(image_path) as img:
+        if crop_top or crop_bottom is not None:
+            strip = img.crop((0, crop_top, img.width, img.height if crop_bottom is None else crop_bottom))
+        else:
+            strip = img.copy()
+        strip.load()
+    return strip
+
+
+def _ocr_task(image_path: str, backend: Optional[str] = None, preprocess: Optional[bool] = None,
+              triage: Optional[bool] = None, crop_top: int = 0, image_type: Optional[str] = None,
+              pixels: Optional[Union[SharedPixels, ImageBuffer]] = None, crop_bottom: Optional[int] = None) -> dict:
+    """Runs OCR on one image, skipping its first crop_top rows, and returns a result dict instead of raising.
+
+    With triage on, the image is routed to an OCR profile first and blank images are not OCR'd at all.
+    Given `pixels`, the image already decoded by the capturing process is used instead of the file.
+    Given crop_bottom, only the strip of rows above it is read, as one tile of a tall image: its layout is
+    returned under "layout" for joining with the other tiles instead of being saved.
+    """
+    start = time.perf_counter()
+    tile = crop_bottom is not None
+    try:
+        if pixels is not None:
+            image = pixels.load(crop_top, crop_bottom)
+        else:
+            image = _load_strip(image_path, crop_top, crop_bottom) if crop_top or tile else None
+        result = {"path": image_path, "text": None, "error": None}
+        psm = None
+        if OCR_TRIAGE if triage is None else triage:
+            if image is None:
+                image = _load_strip(image_path)
+            result.update(triage_image(image, image_type))
+            result["megapixels"] = image.width * image.height / 1e6
+            if result["profile"] == "blank":
+                result["text"] = ""
+                layout = parse_tsv("", crop_top)
+                layout["size"] = [image.width, image.height]
+                if tile:
+                    result["layout"] = layout
+                elif OCR_LAYOUT:
+                    _save_layout(image_path, layout)
+                result["seconds"] = time.perf_counter() - start
+                return result
+            psm = OCR_PROFILES[result["profile"]]["psm"]
+        # Whole images go to the tesseract CLI by path so they are never re-encoded, once the file is there:
+        # a capture still in memory is written on the io pool, atomically, and may not be yet
+        if image is None or (not crop_top and not tile and get_backend(backend).reads_files
+                             and os.path.exists(image_path)):
+            image = image_path
+        if OCR_LAYOUT or OCR_ESCALATE_CONFIDENCE or tile:
+            # Word boxes and confidences come from the same OCR run
+            result["text"], tsv = ocr_image_layout(image, backend, preprocess, psm)
+            layout = parse_tsv(tsv, crop_top, form_feed=result["text"].endswith("\f"))
+            escalation = _escalate(image, layout, backend, preprocess, psm) if OCR_ESCALATE_CONFIDENCE else None
+            if escalation is not None:
+                result["escalation"] = escalation
+                if escalation["replaced_lines"]:
+                    result["text"] = layout_text(layout)
+            if tile:
+                result["layout"] = layout
+            elif OCR_LAYOUT:
+                _save_layout(image_path, layout)
+        else:
+            result["text"] = ocr_image(image, backend, preprocess, psm)
+        result["seconds"] = time.perf_counter() - start
+        return result
+    except Exception as e:
+        return {"path": image_path, "text": None, "error": str(e)}
+
+
+def _join_tiles(image_path: str, crop_top: int, results: List[dict]) -> dict:
+    """The result for a tall image from the results of its tiles, in top-to-bottom order, as if OCR'd whole."""
+    for result in results:
+        if result["error"] is not None:
+            return {"path": image_path, "text": None, "error": result["error"]}
+    layout = stack_layouts([result["layout"] for result in results], crop_top)
+    if OCR_LAYOUT:
+        _save_layout(image_path, layout)
+    joined = {
+        "path": image_path,
+        "text": layout_text(layout),
+        "error": None,
+        "tiles": len(results),
+        # Work done rather than time waited, so the triage cost baseline stays per megapixel of OCR
+        "seconds": sum(result["seconds"] for result in results)
+    }
+    if "profile" in results[0]:
+        profiles = [result["profile"] for result in results if result["profile"] != "blank"]
+        joined["profile"] = max(set(profiles), key=profiles.count) if profiles else "blank"
+        joined["megapixels"] = sum(result["megapixels"] for result in results)
+    escalations = [result["escalation"] for result in results if "escalation" in result]
+    if escalations:
+        modes = {escalation["mode"] for escalation in escalations}
+        joined["escalation"] = {
+            "mode": modes.pop() if len(modes) == 1 else "mixed",
+            "low_lines": sum(escalation["low_lines"] for escalation in escalations),
+            "replaced_lines": sum(escalation["replaced_lines"] for escalation in escalations),
+            # Of the tile that read worst
+            "confidence_before": min((escalation["confidence_before"] for escalation in escalations
+                                      if escalation["confidence_before"] is not None), default=None),
+            "confidence_after": min((escalation["confidence_after"] for escalation in escalations
+                                     if escalation["confidence_after"] is not None), default=None),
+            "seconds": round(sum(escalation["seconds"] for escalation in escalations), 3)
+        }
+    return joined
+
+
+def _init_worker(omp_threads: int, backend: Optional[str], nice: int = 0):
+    # Inherited by every tesseract subprocess started from this worker. The in-process tesserocr backend was
+    # capped when ocr_engine was first imported, so for it omp_threads other than that has no effect
+    os.environ["OMP_THREAD_LIMIT"] = str(omp_threads)
+    # Background OCR gives way to the main process; an unprivileged process can't undo this, so it's set once
+    if nice and hasattr(os, "nice"):
+        os.nice(nice)
+    # Load the language model now rather than on the first image
+    get_backend(backend)
+
+
+class SerialOCREngine:
+    """OCRs images one at a time in the calling thread."""
+
+    workers = 1
+
+    def __init__(self, backend: Optional[str] = None, preprocess: Optional[bool] = None,
+                 triage: Optional[bool] = None):
+        self.backend = backend
+        self.preprocess = preprocess
+        self.triage = triage
+
+    @property
+    def config_key(self) -> str:
+        return ocr_config_key(self.backend, self.preprocess, self.triage)
+
+    def map(self, image_paths: List[str], crops: Optional[dict] = None,
+            image_type: Optional[str] = None) -> Iterator[dict]:
+        crops = crops or {}
+        for image_path in image_paths:
+            yield _ocr_task(image_path, self.backend, self.preprocess, self.triage,
+                            crops.get(image_path, 0), image_type)
+
+    def submit(self, image_path: str, crop_top: int = 0, image_type: Optional[str] = None,
+               buffer: Optional[ImageBuffer] = None) -> Future:
+        future = Future()
+        # Same process, so the decoded image is used as is rather than copied to shared memory
+        future.set_result(_ocr_task(image_path, self.backend, self.preprocess, self.triage, crop_top, image_type,
+                                    buffer))
+        return future
+
+    def shutdown(self, wait: bool = True):
+        pass
+
+
+class ProcessPoolOCREngine:
+    """Spreads OCR over a pool of worker processes, yielding results in input order.
+
+    Images taller than TILE_MIN_HEIGHT are cut into strips at whitespace gaps, and the strips are OCR'd on
+    several workers at once, so one long scroll capture no longer takes a single worker's whole run.
+    """
+
+    def __init__(self, workers: Optional[int] = None, omp_threads: int = OMP_THREADS_PER_WORKER,
+                 backend: Optional[str] = None, preprocess: Optional[bool] = None,
+                 triage: Optional[bool] = None, nice: int = OCR_WORKER_NICE):
+        self.workers = max(1, workers or OCR_WORKERS)
+        self.omp_threads = omp_threads
+        self.nice = nice
+        self.backend = backend
+        self.preprocess = preprocess
+        self.triage = triage
+        self._task = partial(_ocr_task, backend=backend, preprocess=preprocess, triage=triage)
+        self._executor = None
+
+    @property
+    def config_key(self) -> str:
+        return ocr_config_key(self.backend, self.preprocess, self.triage)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # The pool is started lazily so creating an engine costs nothing until OCR is needed
+        if self._executor is None:
+            # Workers must share this process's resource tracker, or each tracks the shared image blocks it
+            # maps and warns about them as leaked at exit even though this process unlinks them
+            resource_tracker.ensure_running()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.omp_threads, self.backend, self.nice)
+            )
+        return self._executor
+
+    def map(self, image_paths: List[str], crops: Optional[dict] = None,
+            image_type: Optional[str] = None) -> Iterator[dict]:
+        if not image_paths:
+            return iter(())
+        crops = crops or {}
+        if not crops and image_type is None and not TILE_MIN_HEIGHT:
+            return self._get_executor().map(self._task, image_paths)
+        futures = [self.submit(image_path, crops.get(image_path, 0), image_type) for image_path in image_paths]
+        return (future.result() for future in futures)
+
+    def _tiles(self, image_path: str, crop_top: int, buffer: Optional[ImageBuffer]) -> Optional[tuple]:
+        """Rows of the strips a tall image is OCR'd in, or None to OCR it whole. The buffer the image was
+        decoded into for finding them is passed on with them."""
+        try:
+            if buffer is not None:
+                height = buffer.decoded.height
+            else:
+                # Only the header is read; short images are never decoded here
+                with Image.open(image_path) as img:
+                    height = img.height
+            if height - crop_top <= TILE_MIN_HEIGHT:
+                return None
+            buffer = buffer or ImageBuffer(image_path)
+            tiles = tile_rows(buffer.load(crop_top))
+        except Exception:
+            # The worker opens the image itself and reports what is wrong with it
+            return None
+        if len(tiles) == 1:
+            return None
+        return [(crop_top + top, crop_top + bottom) for top, bottom in tiles], buffer
+
+    def submit(self, image_path: str, crop_top: int = 0, image_type: Optional[str] = None,
+               buffer: Optional[ImageBuffer] = None) -> Future:
+        tiled = self._tiles(image_path, crop_top, buffer) if TILE_MIN_HEIGHT else None
+        if tiled is not None:
+            tiles, tile_buffer = tiled
+            return self._submit_tiles(image_path, crop_top, image_type, tile_buffer, tiles, owned=buffer is None)
+        # With a buffer, the worker maps the already decoded pixels instead of reading and decoding the file
+        pixels = buffer.share() if buffer is not None else None
+        return self._get_executor().submit(self._task, image_path, crop_top=crop_top, image_type=image_type,
+                                           pixels=pixels)
+
+    def _submit_tiles(self, image_path: str, crop_top: int, image_type: Optional[str], buffer: ImageBuffer,
+                      tiles: List[tuple], owned: bool) -> Future:
+        # The image is decoded once, here, and every tile maps its rows from shared memory
+        pixels = buffer.share()
+        executor = self._get_executor()
+        futures = [executor.submit(self._task, image_path, crop_top=top, image_type=image_type, pixels=pixels,
+                                   crop_bottom=bottom)
+                   for top, bottom in tiles]
+        joined = Future()
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def tile_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            try:
+                joined.set_result(_join_tiles(image_path, crop_top, [future.result() for future in futures]))
+            except Exception as e:
+                joined.set_exception(e)
+            finally:
+                if owned:
+                    buffer.release()
+
+        for future in futures:
+            future.add_done_callback(tile_done)
+        return joined
+
+    def shutdown(self, wait: bool = True):
+        # wait=False drops queued images so a quitting program isn't held up by a large section
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+
+
+def _write_strip(image_path: str, crop_top: int, preprocess: bool, directory: str, idx: int) -> str:
+    """Writes the part of an image tesseract should read to a PNG, or returns the original path if it is unchanged."""
+    if not crop_top and not preprocess:
+        return image_path
+    image = _load_strip(image_path, crop_top)
+    if preprocess:
+        image = Image.fromarray(preprocess_image(image))
+    strip_path = os.path.join(directory, f"{idx}.png")
+    image.save(strip_path)
+    return strip_path
+
+
+def _ocr_bulk_task(image_paths: List[str], crops: dict, preprocess: bool, lang: str, omp_threads: int) -> List[dict]:
+    """OCRs a batch of images with a single tesseract run, reading them from a list file.
+
+    Tesseract ends every page of the text output with a form feed, which is how the text is split back
+    into one result per image. If the run fails or the page count doesn't match, each image is OCR'd on
+    its own so one bad file only costs its own result.
+    """
+    directory = tempfile.mkdtemp(prefix="ocr-bulk-")
+    try:
+        pages = []
+        try:
+            inputs = [_write_strip(image_path, crops.get(image_path, 0), preprocess, directory, idx)
+                      for idx, image_path in enumerate(image_paths)]
+            list_path = os.path.join(directory, "images.txt")
+            with open(list_path, "w") as f:
+                f.write("\n".join(inputs) + "\n")
+            output_base = os.path.join(directory, "output")
+            env = dict(os.environ, OMP_THREAD_LIMIT=str(omp_threads))
+            subprocess.run(
+                [pytesseract.pytesseract.tesseract_cmd, list_path, output_base, "-l", lang, "txt"]
+                + (["tsv"] if OCR_LAYOUT else []),
+                check=True, capture_output=True, env=env
+            )
+            with open(output_base + ".txt", encoding="utf-8") as f:
+                pages = f.read().split("\f")
+            if len(pages) == len(image_paths) + 1 and not pages[-1].strip():
+                pages.pop()
+            if OCR_LAYOUT and len(pages) == len(image_paths):
+                with open(output_base + ".tsv", encoding="utf-8") as f:
+                    layouts = split_tsv_pages(f.read())
+                # Every image starts a page in the TSV, even one with no text
+                if len(layouts) == len(image_paths):
+                    for image_path, tsv in zip(image_paths, layouts):
+                        _save_layout(image_path, parse_tsv(tsv, crops.get(image_path, 0), form_feed=True))
+        except (OSError, subprocess.CalledProcessError):
+            pages = []
+        if len(pages) == len(image_paths):
+            # Put back the page separator a single-image run ends with, so both engines give the same text
+            return [{"path": image_path, "text": text + "\f", "error": None}
+                    for image_path, text in zip(image_paths, pages)]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return [_ocr_task(image_path, "pytesseract", preprocess, False, crops.get(image_path, 0))
+            for image_path in image_paths]
+
+
+class BulkOCREngine:
+    """OCRs a batch of images with one tesseract run per worker instead of one run per image.
+
+    Only the tesseract CLI reads list files, so this always uses the pytesseract backend settings and
+    skips triage and confidence escalation: every image in a run gets the same page segmentation mode. For the same reason image
+    buffers are ignored and tesseract reads the files.
+    """
+
+    def __init__(self, workers: Optional[int] = None, omp_threads: int = OMP_THREADS_PER_WORKER,
+                 preprocess: Optional[bool] = None, lang: str = OCR_LANG):
+        self.workers = max(1, workers or OCR_WORKERS)
+        self.omp_threads = omp_threads
+        self.preprocess = OCR_PREPROCESS if preprocess is None else preprocess
+        self.lang = lang
+        # The OCR itself runs in tesseract processes, so threads are enough to drive them
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    @property
+    def config_key(self) -> str:
+        # Same CLI and settings as the pytesseract backend, so the text is interchangeable
+        return ocr_config_key("pytesseract", self.preprocess, False, self.lang, escalate=False)
+
+    def _batches(self, image_paths: List[str]) -> List[List[str]]:
+        # Contiguous, evenly sized batches keep the results in input order
+        count = min(self.workers, len(image_paths))
+        size, extra = divmod(len(image_paths), count)
+        batches, start = [], 0
+        for idx in range(count):
+            end = start + size + (1 if idx < extra else 0)
+            batches.append(image_paths[start:end])
+            start = end
+        return batches
+
+    def _run(self, batch: List[str], crops: dict) -> Future:
+        return self._executor.submit(_ocr_bulk_task, batch, crops, self.preprocess, self.lang, self.omp_threads)
+
+    def map(self, image_paths: List[str], crops: Optional[dict] = None,
+            image_type: Optional[str] = None) -> Iterator[dict]:
+        if not image_paths:
+            return
+        crops = crops or {}
+        futures = [self._run(batch, crops) for batch in self._batches(image_paths)]
+        for future in futures:
+            yield from future.result()
+
+    def submit(self, image_path: str, crop_top: int = 0, image_type: Optional[str] = None,
+               buffer: Optional[ImageBuffer] = None) -> Future:
+        future = Future()
+
+        def unwrap(done: Future):
+            try:
+                future.set_result(done.result()[0])
+            except Exception as e:
+                future.set_exception(e)
+
+        self._run([image_path], {image_path: crop_top}).add_done_callback(unwrap)
+        return future
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+def create_ocr_engine(engine: Optional[str] = None, workers: Optional[int] = None):
+    """The OCR engine selected with OCR_ENGINE: a process pool fed one image at a time, or bulk tesseract runs."""
+    engine = engine or OCR_ENGINE
+    if engine == "bulk":
+        return BulkOCREngine(workers=workers)
+    if engine == "eager":
+        return ProcessPoolOCREngine(workers=workers)
+    raise ValueError(f"Unknown OCR engine '{engine}'. Choose from: eager, bulk")
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class OCRLatency:
+    """Time from asking for OCR to having the text, per scheduling class, over the most recent jobs."""
+
+    def __init__(self, samples: int = OCR_LATENCY_SAMPLES):
+        self.lock = threading.Lock()
+        self.jobs = {priority: 0 for priority in OCR_PRIORITIES}
+        self.waits = {priority: deque(maxlen=samples) for priority in OCR_PRIORITIES}
+        self.totals = {priority: deque(maxlen=samples) for priority in OCR_PRIORITIES}
+
+    def record(self, priority: str, waited: float, total: float):
+        """waited is the time spent queued before the job reached a worker, total includes the OCR itself."""
+        with self.lock:
+            self.jobs[priority] += 1
+            self.waits[priority].append(waited)
+            self.totals[priority].append(total)
+
+    def summary(self) -> Dict[str, dict]:
+        """Median and p95 latency in milliseconds for every class that has run a job."""
+        with self.lock:
+            return {
+                priority: {
+                    "jobs": self.jobs[priority],
+                    "median_ms": _percentile(list(self.totals[priority]), 0.5) * 1000,
+                    "p95_ms": _percentile(list(self.totals[priority]), 0.95) * 1000,
+                    "wait_p95_ms": _percentile(list(self.waits[priority]), 0.95) * 1000
+                }
+                for priority in OCR_PRIORITIES if self.totals[priority]
+            }
+
+    def report(self) -> str:
+        """One line per class, e.g. "capture: 40 jobs, median 950 ms, p95 1800 ms (queued p95 120 ms)"."""
+        return "\n".join(
+            f"{priority}: {stats['jobs']} jobs, median {stats['median_ms']:.0f} ms, p95 {stats['p95_ms']:.0f} ms "
+            f"(queued p95 {stats['wait_p95_ms']:.0f} ms)"
+            for priority, stats in self.summary().items()
+        ) or "no OCR jobs yet"
+
+
+# Shared by everything that OCRs on behalf of the running program
+ocr_latency = OCRLatency()
+
+
+class EagerOCRQueue:
+    """Starts OCR for each image as soon as it is captured so closing a section only collects results.
+
+    Only as many images as the engine has workers are handed to it at a time. The rest wait here, most
+    urgent class first and in arrival order within a class, so a new screenshot overtakes a backlog of
+    earlier sections instead of queueing behind it. Jobs already on a worker are never interrupted.
+    """
+
+    def __init__(self, engine, max_in_flight: Optional[int] = None, latency: Optional[OCRLatency] = None):
+        self.engine = engine
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.max_in_flight = max_in_flight or getattr(engine, "workers", 1)
+        self.latency = latency or ocr_latency
+        self._queued = []
+        self._order = itertools.count()
+        self._in_flight = 0
+        # Set while one thread is handing jobs to the engine; everyone else leaves the freed slots to it
+        self._dispatching = False
+
+    def enqueue(self, image_path: str, crop_top: int = 0, image_type: Optional[str] = None,
+                buffer: Optional[ImageBuffer] = None, priority: str = "capture"):
+        """Queues an image for OCR. A buffer is OCR'd from memory and its pixels released once OCR is done."""
+        if priority not in OCR_PRIORITIES:
+            raise ValueError(f"Unknown OCR priority '{priority}'. Choose from: {', '.join(OCR_PRIORITIES)}")
+        with self.lock:
+            if image_path in self.pending:
+                return
+            future = Future()
+            self.pending[image_path] = future
+            job = (image_path, crop_top, image_type, buffer, priority, time.perf_counter(), future)
+            heapq.heappush(self._queued, (OCR_PRIORITIES.index(priority), next(self._order), job))
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hands queued jobs to the engine until every worker is busy or nothing is left.
+
+        A job that finishes during submit() (a cache hit, a serial engine, a shut-down engine) runs _finished
+        right here, which calls back into _dispatch. Only one call loops at a time and the others return at
+        once, so a long run of such jobs is dispatched iteratively instead of one stack frame deeper each.
+        """
+        with self.lock:
+            if self._dispatching:
+                return
+            self._dispatching = True
+        while True:
+            with self.lock:
+                # Checked and cleared under the lock that _finished frees slots under, so no slot is missed
+                if self._in_flight >= self.max_in_flight or not self._queued:
+                    self._dispatching = False
+                    return
+                image_path, crop_top, image_type, buffer, priority, queued_at, future = heapq.heappop(self._queued)[2]
+                # Discarded while it was waiting
+                if not future.set_running_or_notify_cancel():
+                    if buffer is not None:
+                        buffer.release()
+                    continue
+                self._in_flight += 1
+            started = time.perf_counter()
+            try:
+                # Outside the lock: a serial engine OCRs the image right here
+                submitted = self.engine.submit(image_path, crop_top, image_type, buffer)
+            except Exception as e:
+                # The engine was shut down
+                submitted = Future()
+                submitted.set_exception(e)
+            submitted.add_done_callback(partial(self._finished, future, buffer, priority, queued_at, started))
+
+    def _finished(self, future: Future, buffer: Optional[ImageBuffer], priority: str, queued_at: float,
+                  started: float, done: Future):
+        with self.lock:
+            self._in_flight -= 1
+        if buffer is not None:
+            buffer.release()
+        finished = time.perf_counter()
+        self.latency.record(priority, started - queued_at, finished - queued_at)
+        session_metrics.observe("ocr_queue_wait", started - queued_at)
+        session_metrics.observe("ocr_run", finished - started)
+        # Hand the freed worker its next image before waking whoever waits for this one
+        self._dispatch()
+        try:
+            future.set_result(done.result())
+        except Exception as e:
+            future.set_exception(e)
+
+    def collect(self, image_paths: List[str], crops: Optional[dict] = None,
+                image_type: Optional[str] = None) -> Iterator[dict]:
+        """Yields results in input order; images that were never enqueued are submitted now.
+
+        crops maps image paths to the number of rows at the top already covered by the previous image.
+        """
+        crops = crops or {}
+        with self.lock:
+            futures = [self.pending.pop(image_path, None) for image_path in image_paths]
+        # Images that were never enqueued go to the engine as one batch, once in-memory captures are on disk
+        missing = [image_path for future, image_path in zip(futures, image_paths) if future is None]
+        wait_for_files(missing)
+        batch = iter(self.engine.map(missing, crops, image_type))
+        for future, image_path in zip(futures, image_paths):
+            try:
+                yield future.result() if future is not None else next(batch)
+            except Exception as e:
+                # Worker crashes and cancelled futures still produce a result for the section
+                yield {"path": image_path, "text": None, "error": str(e)}
+
+    def discard(self, image_paths: List[str]):
+        """Drops queued images nobody is going to collect; ones already being OCR'd finish in the background."""
+        with self.lock:
+            for image_path in image_paths:
+                future = self.pending.pop(image_path, None)
+                if future is not None:
+                    future.cancel()
+
+    def pending_count(self) -> int:
+        with self.lock:
+            return sum(1 for future in self.pending.values() if not future.done())
+
+    def depth(self) -> dict:
+        """Images waiting for a worker and images being OCR'd right now."""
+        with self.lock:
+            return {"queued": len(self._queued), "in_flight": self._in_flight}
+
+
+def benchmark(engine, image_paths: List[str]) -> dict:
+    start = time.perf_counter()
+    results = list(engine.map(image_paths))
+    elapsed = time.perf_counter() - start
+    errors = sum(1 for result in results if result["error"])
+    return {
+        "images": len(image_paths),
+        "errors": errors,
+        "seconds": elapsed,
+        "images_per_sec": len(image_paths) / elapsed if elapsed > 0 else 0.0
+    }
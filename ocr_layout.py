@@ -0,0 +1,165 @@
+import os
+import gzip
+import json
+from statistics import median
+from typing import List, Optional
+
+# Word boxes are kept next to each OCR'd image so its text can be rebuilt without OCR ("0" turns it off)
+OCR_LAYOUT = os.environ.get("OCR_LAYOUT", "1") != "0"
+LAYOUT_SUFFIX = '.layout.json.gz'
+LAYOUT_VERSION = 1
+# Fields of a word entry: block, paragraph and line ids, box, confidence (0-100, -1 if none) and text
+BLOCK, PAR, LINE, LEFT, TOP, WIDTH, HEIGHT, CONF, TEXT = range(9)
+_TSV_COLUMNS = 12
+
+
+def layout_path(image_path: str) -> str:
+    return image_path + LAYOUT_SUFFIX
+
+
+def parse_tsv(tsv: str, crop_top: int = 0, form_feed: bool = False) -> dict:
+    """The words of one page of Tesseract's TSV output, with their boxes, confidences and line ids.
+
+    Boxes are in the image as it was OCR'd: after skipping crop_top rows, and after preprocessing scaled it.
+    form_feed records that the text output of the OCR run ended the page with one (the tesseract CLI does).
+    """
+    size, words = [0, 0], []
+    for row in tsv.splitlines():
+        cols = row.split("\t", _TSV_COLUMNS - 1)
+        # The CLI starts with a header row
+        if len(cols) < _TSV_COLUMNS or not cols[0].isdigit():
+            continue
+        level = int(cols[0])
+        if level == 1:
+            size = [int(cols[8]), int(cols[9])]
+        elif level == 5:
+            words.append([int(cols[2]), int(cols[3]), int(cols[4]), int(cols[6]), int(cols[7]), int(cols[8]),
+                          int(cols[9]), round(float(cols[10]), 1), cols[11]])
+    return {"version": LAYOUT_VERSION, "size": size, "crop_top": crop_top, "form_feed": form_feed, "words": words}
+
+
+def split_tsv_pages(tsv: str) -> List[str]:
+    """TSV output of a multi-image tesseract run, split into one TSV per image in page order."""
+    pages = {}
+    for row in tsv.splitlines():
+        cols = row.split("\t", 2)
+        if len(cols) > 1 and cols[1].isdigit():
+            pages.setdefault(int(cols[1]), []).append(row)
+    return ["\n".join(pages[page]) for page in sorted(pages)]
+
+
+def write_layout(image_path: str, layout: dict):
+    """Writes an image's layout beside it as gzipped JSON, replacing any earlier one atomically."""
+    path = layout_path(image_path)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(gzip.compress(json.dumps(layout, separators=(",", ":")).encode("utf-8"), mtime=0))
+    os.replace(temp_path, path)
+
+
+def read_layout(image_path: str) -> Optional[dict]:
+    """An image's layout, or None if it has none or it can't be read."""
+    try:
+        with gzip.open(layout_path(image_path), "rt", encoding="utf-8") as f:
+            layout = json.load(f)
+    except (OSError, EOFError, ValueError):
+        return None
+    return layout if layout.get("version") == LAYOUT_VERSION else None
+
+
+def has_layout(image_path: str) -> bool:
+    return os.path.exists(layout_path(image_path))
+
+
+def layout_lines(layout: dict) -> List[List[list]]:
+    """Words grouped into text lines, in reading order."""
+    lines, current = [], None
+    for word in layout["words"]:
+        key = (word[BLOCK], word[PAR], word[LINE])
+        if key != current:
+            lines.append([])
+            current = key
+        lines[-1].append(word)
+    return lines
+
+
+def mean_confidence(words: List[list]) -> Optional[float]:
+    """Confidence of a run of words, weighted by their length; None if none of them has one."""
+    scored = [(word[CONF], len(word[TEXT])) for word in words if word[CONF] >= 0 and word[TEXT]]
+    total = sum(length for _, length in scored)
+    return sum(conf * length for conf, length in scored) / total if total else None
+
+
+def place_words(words: List[list], scale: float, left: int = 0, top: int = 0,
+                ids: Optional[List[int]] = None) -> List[list]:
+    """Words read from a scaled-up crop, moved back to where they are in the image the crop came from.
+
+    ids gives them the block, paragraph and line ids of the line they replace.
+    """
+    placed = []
+    for word in words:
+        block, par, line = ids if ids is not None else word[BLOCK:LINE + 1]
+        placed.append([block, par, line, left + round(word[LEFT] / scale), top + round(word[TOP] / scale),
+                       round(word[WIDTH] / scale), round(word[HEIGHT] / scale), word[CONF], word[TEXT]])
+    return placed
+
+
+def stack_layouts(layouts: List[dict], crop_top: int = 0) -> dict:
+    """One layout for an image OCR'd as horizontal strips, from the strips' layouts in top-to-bottom order.
+
+    Each strip's boxes move down by the heights of the strips above it, in the scale it was OCR'd at.
+    Blocks are renumbered so no two strips share one, which keeps a paragraph break between strips in the text.
+    """
+    words, width, height, block_base = [], 0, 0, 0
+    for layout in layouts:
+        for word in layout["words"]:
+            words.append([word[BLOCK] + block_base, word[PAR], word[LINE], word[LEFT], word[TOP] + height,
+                          word[WIDTH], word[HEIGHT], word[CONF], word[TEXT]])
+        block_base += max((word[BLOCK] for word in layout["words"]), default=0)
+        width = max(width, layout["size"][0])
+        height += layout["size"][1]
+    return {"version": LAYOUT_VERSION, "size": [width, height], "crop_top": crop_top,
+            "form_feed": any(layout.get("form_feed") for layout in layouts), "words": words}
+
+
+def _page_end(layout: dict) -> str:
+    return "\f" if layout.get("form_feed") else ""
+
+
+def layout_text(layout: dict) -> str:
+    """The text exactly as Tesseract prints it: words joined by spaces, a blank line between paragraphs."""
+    out, paragraph = [], None
+    for line in layout_lines(layout):
+        if paragraph is not None and (line[0][BLOCK], line[0][PAR]) != paragraph:
+            out.append("")
+        paragraph = (line[0][BLOCK], line[0][PAR])
+        out.append(" ".join(word[TEXT] for word in line))
+    return ("\n".join(out) + "\n" if out else "") + _page_end(layout)
+
+
+def layout_code(layout: dict) -> str:
+    """The text with indentation, spacing and blank lines put back from where the words are, for code.
+
+    Assumes a monospaced font: one character is the median width of a character across all words, and
+    one line is the median distance between consecutive lines.
+    """
+    lines = layout_lines(layout)
+    chars = [word[WIDTH] / len(word[TEXT]) for line in lines for word in line if word[TEXT]]
+    if not chars:
+        return _page_end(layout)
+    char_width = median(chars) or 1
+    tops = [min(word[TOP] for word in line) for line in lines]
+    steps = [below - above for above, below in zip(tops, tops[1:]) if below > above]
+    line_pitch = median(steps) if steps else 0
+    margin = min(line[0][LEFT] for line in lines)
+
+    out = []
+    for idx, line in enumerate(lines):
+        if idx and line_pitch:
+            out.extend([""] * max(0, round((tops[idx] - tops[idx - 1]) / line_pitch) - 1))
+        text = " " * round((line[0][LEFT] - margin) / char_width) + line[0][TEXT]
+        for before, word in zip(line, line[1:]):
+            gap = word[LEFT] - (before[LEFT] + before[WIDTH])
+            text += " " * max(1, round(gap / char_width)) + word[TEXT]
+        out.append(text)
+    return "\n".join(out) + "\n" + _page_end(layout)
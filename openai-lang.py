@@ -3,6 +3,8 @@ import os
 from openai import OpenAI
 import copy
 
+from book_store import load_book, save_book
+
 # Initialize OpenAI client
 client = OpenAI()
 
@@ -10,17 +12,17 @@ def process_json_and_update_with_checks(file_path, middle_file):
     # Derive the path for the updated JSON file
     base_dir = os.path.dirname(file_path)
     base_name = os.path.basename(file_path)
-    updated_json_path = os.path.join(base_dir, base_name.replace(".json", "-gpt-written.json"))
+    # A book store stays a book store, so each save below only rewrites the section that changed
+    name, suffix = os.path.splitext(base_name)
+    updated_json_path = os.path.join(base_dir, f"{name}-gpt-written{suffix}")
 
     # Check if the updated JSON file already exists
     if os.path.exists(updated_json_path):
         print(f"Found existing processed file: {updated_json_path}. Resuming from where it left off.")
-        with open(updated_json_path, 'r') as f:
-            updated_data = json.load(f)
+        updated_data = load_book(updated_json_path)
     else:
         print(f"No processed file found. Starting fresh processing.")
-        with open(file_path, 'r') as f:
-            updated_data = json.load(f)
+        updated_data = load_book(file_path)
 
     # Open middle-answer file to save intermediate responses
     with open(middle_file, 'w') as middle_output:
@@ -78,8 +80,7 @@ def process_json_and_update_with_checks(file_path, middle_file):
                         section["gpt-processed-text"] = final_message
 
                         # Save the updated JSON in real-time
-                        with open(updated_json_path, 'w') as updated_file:
-                            json.dump(updated_data, updated_file, indent=4)
+                        save_book(updated_json_path, updated_data)
 
                         print(f"Finished processing: Chapter -> {chapter_name}, Section -> {section_name}")
 
@@ -0,0 +1,83 @@
+import os
+import time
+import argparse
+
+from book_store import load_book, save_book
+from book_backfill import book_chapters
+from ocr_layout import read_layout, layout_text, layout_code
+from book_journal import journal_path
+
+
+def rebuild_section(section, code_indent):
+    """The section's text and code rebuilt from its images' layout files, or None if any image has none."""
+    fields = {}
+    for field, images, render in (("extracted-text", section.get("images", []), layout_text),
+                                  ("extracted-code", section.get("code_images", []),
+                                   layout_code if code_indent else layout_text)):
+        layouts = [read_layout(path) for path in images]
+        if any(layout is None for layout in layouts):
+            return None
+        fields[field] = "\n".join(render(layout) for layout in layouts)
+    return fields
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild the extracted text and code of a book from the layout files OCR keeps beside each "
+                    "screenshot (word boxes, confidences and line ids), without running OCR again."
+    )
+    parser.add_argument("json_file", help="Book JSON (or .db book store) written by screenshot-book.py, ss.py, "
+                                          "ss-book-gen.py or ingest-book.py")
+    parser.add_argument("--code-indent", action="store_true",
+                        help="Put indentation and blank lines back into extracted-code from where the words are")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    args = parser.parse_args()
+
+    # Same as backfill-book.py: replaying a pending journal would later overwrite the rebuilt text
+    if not args.dry_run and os.path.exists(journal_path(args.json_file)):
+        parser.error(f"{journal_path(args.json_file)} exists: the book is open in a capture session or one "
+                     f"crashed with it open. Quit that session, or resume the book with 'existing' once so the "
+                     f"journal is replayed, then run this again")
+
+    start = time.perf_counter()
+    data = load_book(args.json_file)
+    rebuilt, unchanged, missing = {}, 0, []
+    for chapter_idx, chapter in enumerate(book_chapters(data)):
+        for section_idx, section in enumerate(chapter.get("sections", [])):
+            if not section.get("images") and not section.get("code_images"):
+                continue
+            fields = rebuild_section(section, args.code_indent)
+            if fields is None:
+                missing.append(f"{chapter['chapter_name']} / {section['section_name']}")
+            elif all(section.get(field) == value for field, value in fields.items()):
+                unchanged += 1
+            else:
+                rebuilt[(chapter_idx, section_idx)] = (section, fields)
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(rebuilt)} sections rebuilt, {unchanged} already up to date, in {elapsed * 1000:.0f} ms")
+    if missing:
+        print(f"{len(missing)} sections have images without layout files (OCR'd before they were kept, or "
+              f"failed); run backfill-book.py --all to OCR them again:")
+        for name in missing:
+            print(f"  {name}")
+    if args.dry_run or not rebuilt:
+        return
+
+    # Merge into the book as it is on disk now, skipping sections whose images changed in the meantime
+    on_disk = load_book(args.json_file)
+    disk_chapters = book_chapters(on_disk)
+    for (chapter_idx, section_idx), (section, fields) in rebuilt.items():
+        try:
+            disk_section = disk_chapters[chapter_idx]["sections"][section_idx]
+        except IndexError:
+            continue
+        if (disk_section.get("images", []) == section.get("images", [])
+                and disk_section.get("code_images", []) == section.get("code_images", [])):
+            disk_section.update(fields)
+    save_book(args.json_file, on_disk)
+    print(f"Saved {args.json_file}")
+
+
+if __name__ == "__main__":
+    main()
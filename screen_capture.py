@@ -0,0 +1,76 @@
+import os
+import sys
+import subprocess
+from typing import Optional, Tuple
+
+from PIL import ImageGrab
+
+from image_pipeline import ImageBuffer
+
+# "screencapture" (macOS, interactive region) or "x11" (Linux, in memory; works under Xvfb)
+CAPTURE_BACKEND = os.environ.get("CAPTURE_BACKEND", "screencapture" if sys.platform == "darwin" else "x11")
+# X display to grab for the x11 backend; defaults to $DISPLAY
+CAPTURE_DISPLAY = os.environ.get("CAPTURE_DISPLAY") or os.environ.get("DISPLAY")
+# Screen area the x11 backend grabs, as "left,top,right,bottom"; empty grabs the whole screen
+CAPTURE_REGION = os.environ.get("CAPTURE_REGION", "")
+
+
+class CaptureError(Exception):
+    """A screenshot could not be taken."""
+
+
+def parse_region(region: str) -> Optional[Tuple[int, int, int, int]]:
+    if not region:
+        return None
+    left, top, right, bottom = (int(value) for value in region.split(","))
+    return left, top, right, bottom
+
+
+class ScreencaptureBackend:
+    """macOS `screencapture -i`: the user selects a region and the PNG is written straight to disk."""
+
+    name = "screencapture"
+
+    def capture(self, target_path: str) -> Optional[ImageBuffer]:
+        try:
+            subprocess.run(['screencapture', '-i', target_path], check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise CaptureError(e) from e
+        # Nothing is written when the selection is cancelled with Esc
+        return ImageBuffer(target_path) if os.path.exists(target_path) else None
+
+
+class X11Backend:
+    """Grabs an X display with Pillow into memory, so the image goes to hashing and OCR without touching the disk.
+
+    The archival PNG is only written when the caller hands the buffer to a background pool (write_later()).
+    """
+
+    name = "x11"
+
+    def __init__(self, display: Optional[str] = CAPTURE_DISPLAY, region: str = CAPTURE_REGION):
+        self.display = display
+        self.bbox = parse_region(region)
+
+    def capture(self, target_path: str) -> Optional[ImageBuffer]:
+        if not self.display:
+            raise CaptureError("no X display; set DISPLAY or CAPTURE_DISPLAY (e.g. :99 for Xvfb)")
+        try:
+            img = ImageGrab.grab(bbox=self.bbox, xdisplay=self.display)
+        except OSError as e:
+            raise CaptureError(e) from e
+        return ImageBuffer.from_capture(target_path, img)
+
+
+CAPTURE_BACKENDS = {
+    ScreencaptureBackend.name: ScreencaptureBackend,
+    X11Backend.name: X11Backend,
+}
+
+
+def create_capture_backend(name: Optional[str] = None):
+    """The capture backend selected with CAPTURE_BACKEND."""
+    name = name or CAPTURE_BACKEND
+    if name not in CAPTURE_BACKENDS:
+        raise ValueError(f"Unknown capture backend '{name}'. Choose from: {', '.join(CAPTURE_BACKENDS)}")
+    return CAPTURE_BACKENDS[name]()
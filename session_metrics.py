@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+# Capture sessions write their metrics here while they run and at exit. A path ending in .prom gets the
+# Prometheus textfile format (for node_exporter's textfile collector), anything else JSON; empty turns it off
+METRICS_PATH = os.environ.get("METRICS_PATH", "./metrics/capture-session.json")
+# Seconds between two writes of the metrics file
+METRICS_INTERVAL_SECONDS = float(os.environ.get("METRICS_INTERVAL_SECONDS", "30"))
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = "capture_session"
+
+
+class Histogram:
+    """How many observed durations fell in each latency bucket, with their count, sum and maximum."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One more than there are bounds, for durations past the last one
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket the q-th quantile falls in (the maximum past the last bucket)."""
+        if not self.count:
+            return None
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return bound
+        return self.max
+
+    def snapshot(self) -> dict:
+        cumulative, running = {}, 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            cumulative[f"{bound:g}"] = running
+        cumulative["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": cumulative
+        }
+
+
+def to_prometheus(snapshot: dict) -> str:
+    """A snapshot in the Prometheus text exposition format."""
+    lines = [f"# TYPE {METRIC_PREFIX}_stage_seconds histogram"]
+    for stage, histogram in snapshot["stages"].items():
+        for bound, count in histogram["buckets"].items():
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'{METRIC_PREFIX}_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]}')
+        lines.append(f'{METRIC_PREFIX}_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+    for name, value in snapshot["counters"].items():
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name}_total counter")
+        lines.append(f"{METRIC_PREFIX}_{name}_total {value}")
+    for name, value in snapshot["gauges"].items():
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} gauge")
+        lines.append(f"{METRIC_PREFIX}_{name} {value}")
+    lines.append(f"# TYPE {METRIC_PREFIX}_uptime_seconds gauge")
+    lines.append(f"{METRIC_PREFIX}_uptime_seconds {snapshot['uptime_seconds']}")
+    return "\n".join(lines) + "\n"
+
+
+class SessionMetrics:
+    """Per-stage latency histograms, counters and queue-depth gauges for one capture session, kept in memory.
+
+    observe()/timer() and increment() are cheap and thread-safe, so any stage can record itself. Gauges
+    are read when a snapshot is taken. start() writes the metrics file every interval from a background
+    thread, and stop() writes it one last time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self.path: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.log: Callable[[str], None] = print
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram()
+            self.histograms[stage].observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Records how long the with-block took under `stage`, whether or not it raised."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def increment(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name: str, read: Callable[[], float]):
+        """Registers a value such as a queue depth, read every time the metrics are written."""
+        with self.lock:
+            self.gauges[name] = read
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            stages = {stage: histogram.snapshot() for stage, histogram in sorted(self.histograms.items())}
+            counters = dict(sorted(self.counters.items()))
+            gauges = dict(sorted(self.gauges.items()))
+        values = {}
+        for name, read in gauges.items():
+            try:
+                values[name] = read()
+            except Exception:
+                # A pool that has already shut down has no depth to report
+                continue
+        return {
+            "started": self.started,
+            "uptime_seconds": round(time.time() - self.started, 3),
+            "stages": stages,
+            "counters": counters,
+            "gauges": values
+        }
+
+    def write(self, path: Optional[str] = None):
+        """Writes a snapshot to the metrics file, replacing the previous one atomically."""
+        path = path or self.path
+        if not path:
+            return
+        snapshot = self.snapshot()
+        content = to_prometheus(snapshot) if path.endswith(".prom") else json.dumps(snapshot, indent=2)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+    def start(self, path: str = METRICS_PATH, interval: float = METRICS_INTERVAL_SECONDS,
+              log: Callable[[str], None] = print):
+        """Starts the periodic writes; a write that fails is reported through `log`, from the background thread."""
+        if not path or self._thread is not None:
+            return
+        self.path = path
+        self.log = log
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="session-metrics", daemon=True)
+        self._thread.start()
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.write()
+            except OSError as e:
+                self.log(f"Could not write metrics to {self.path}: {e}")
+
+    def stop(self):
+        """Stops the periodic writes and writes the final metrics; returns the path written, if any."""
+        if self._thread is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        try:
+            self.write()
+        except OSError as e:
+            self.log(f"Could not write metrics to {self.path}: {e}")
+            return None
+        return self.path
+
+
+# Shared by every stage of the running program
+session_metrics = SessionMetrics()
@@ -1,10 +1,24 @@
 import os
-import json
 import uuid
 import threading
-import subprocess  # For invoking screencapture command
-from PIL import Image  # For image verification
-import pytesseract  # For OCR
+from ocr_engine import create_ocr_engine, EagerOCRQueue, OCR_ENGINE, OCR_WORKERS, ocr_latency  # OCR backends and pool
+from ocr_cache import CachedOCREngine  # Skips OCR for screenshots seen before
+from image_hash import perceptual_hash, find_near_duplicate, DUPLICATE_ACTION  # Near-duplicate detection
+from image_pipeline import ImageBuffer  # Reads and decodes each screenshot once
+from image_stitch import scroll_cut_row, SCROLL_STITCH  # Skips rows repeated from the previous scroll
+from image_storage import StorageManager, STORAGE_COMPACT, clean_temp  # Compacts finished screenshots
+from screen_capture import create_capture_backend, CaptureError  # screencapture on macOS, X11 grab on Linux
+from folder_watch import FolderWatcher  # Adds images other tools save into a folder
+from title_ocr import TitleReader, latency_note  # Fast OCR for chapter and section names
+from image_triage import triage_record  # Records which OCR profile each image got
+from book_backfill import find_stale_sections, backfill_sections  # Fills in OCR that earlier runs never finished
+from task_executor import TaskExecutors  # Bounded thread pools for background work
+from book_persister import BookPersister  # Saves the JSON in the background
+from book_store import load_book, book_suffix  # Books saved as JSON or SQLite
+from session_metrics import session_metrics  # Stage latencies and queue depths for monitoring
+from book_journal import BookJournal, BOOK_JOURNAL, journal_path, recover_book  # Crash-safe change log
+from book_journal import (chapter_created, section_created, image_added, duplicate_flagged,  # Journal events
+                          scroll_overlap, image_verified, ocr_completed)
 
 # Base directory to store screenshots
 BASE_SCREENSHOTS_DIR = './screenshots-images-2'
@@ -13,6 +27,12 @@ JSON_DIR = './json-book'
 os.makedirs(JSON_DIR, exist_ok=True)
 TEMP_DIR = './temp_screenshots'
 os.makedirs(TEMP_DIR, exist_ok=True)
+# Name captures and other leftovers from earlier runs
+clean_temp(TEMP_DIR)
+# Takes the screenshots; see CAPTURE_BACKEND
+capture_backend = create_capture_backend()
+# Reads chapter and section names; warmed up when main() starts
+title_reader = TitleReader()
 
 
 class SharedState:
@@ -22,9 +42,23 @@ class SharedState:
         self.current_section_index = -1
         self.current_section_path = None
         self.lock = threading.Lock()
+        self.ocr_engine = CachedOCREngine(create_ocr_engine(workers=OCR_WORKERS))
+        # With OCR_ENGINE=eager, screenshots are OCR'd as they are added; process_section collects the results
+        self.ocr_queue = EagerOCRQueue(self.ocr_engine)
+        # Set when the program starts shutting down, so background backfill stops
+        self.closing = threading.Event()
+        # Background work runs on bounded pools instead of a new thread per screenshot or section
+        self.executors = TaskExecutors()
+        # Created once the JSON file is chosen; saves the book off the lock, coalescing changes
+        self.persister = None
+        # Recompresses and deduplicates each section's screenshots once its OCR is done
+        self.storage = StorageManager(BASE_SCREENSHOTS_DIR, cache=self.ocr_engine.cache) if STORAGE_COMPACT else None
 
 
 def process_section(shared_state, json_file_path, chapter_index, section_index):
+    # Screenshots still being added on the cpu pool must be in the section, with their scroll overlap
+    # recorded and their OCR queued, before it is read; otherwise they'd be OCR'd again, uncropped
+    shared_state.executors.wait_cpu()
     with shared_state.lock:
         section = shared_state.data["chapters"][chapter_index]["sections"][section_index]
         image_paths = section.get("images", [])
@@ -33,55 +67,115 @@ def process_section(shared_state, json_file_path, chapter_index, section_index):
         chapter_name = shared_state.data["chapters"][chapter_index]["chapter_name"]
         image_paths = list(image_paths)
         code_image_paths = list(code_image_paths)
+        scroll_overlaps = dict(section.get("scroll_overlaps", {}))
+        errors_before = len(section.get("errors", []))
 
     print_box(f"Processing Section: '{section_name}' in Chapter: '{chapter_name}'")
 
-    def extract_texts(image_list):
+    def extract_texts(results):
         texts = []
-        for image_path in image_list:
-            try:
-                with Image.open(image_path) as img:
-                    text = pytesseract.image_to_string(img)
-                    texts.append(text)
-            except Exception as e:
-                error_message = f"Error extracting text from image {image_path}: {e}"
+        # Results come back in capture order
+        for result in results:
+            if result["error"] is None:
+                texts.append(result["text"])
+                if "profile" in result:
+                    with shared_state.lock:
+                        section.setdefault("ocr_triage", {})[result["path"]] = triage_record(result)
+                if "escalation" in result:
+                    with shared_state.lock:
+                        section.setdefault("ocr_escalated", {})[result["path"]] = result["escalation"]
+            else:
+                error_message = f"Error extracting text from image {result['path']}: {result['error']}"
                 print(error_message)
                 with shared_state.lock:
                     section.setdefault("errors", []).append(error_message)
         return "\n".join(texts)
 
+    # In bulk mode the whole section goes through one tesseract run per worker; results are split back by position
+    if OCR_ENGINE == "bulk":
+        results = list(shared_state.ocr_queue.collect(image_paths + code_image_paths, scroll_overlaps))
+        image_results, code_results = results[:len(image_paths)], results[len(image_paths):]
+    else:
+        image_results = shared_state.ocr_queue.collect(image_paths, scroll_overlaps, "images")
+        code_results = shared_state.ocr_queue.collect(code_image_paths, scroll_overlaps, "code_images")
+
     # Extract text from images and code images
-    section["extracted-text"] = extract_texts(image_paths)
-    section["extracted-code"] = extract_texts(code_image_paths)
+    section["extracted-text"] = extract_texts(image_results)
+    section["extracted-code"] = extract_texts(code_results)
 
     with shared_state.lock:
+        triage = section.get("ocr_triage", {}).values()
+        section["ocr_seconds_saved"] = round(sum(entry["seconds_saved"] or 0 for entry in triage), 3)
+        ocr_succeeded = len(section.get("errors", [])) == errors_before
+        if ocr_succeeded:
+            # Lets a later backfill tell whether this text still matches the OCR settings
+            section["ocr_config"] = shared_state.ocr_engine.config_key
         # Save the updated JSON data to the file
-        with open(json_file_path, 'w') as f:
-            json.dump(shared_state.data, f, indent=4)
+        shared_state.persister.record(ocr_completed(chapter_index, section_index, section))
+
+    # OCR is done with these screenshots, so they can be recompressed and deduplicated
+    if shared_state.storage is not None and ocr_succeeded:
+        shared_state.executors.submit_io(
+            shared_state.storage.compact, image_paths + code_image_paths, scroll_overlaps
+        )
+
+    cache_stats = shared_state.ocr_engine.cache.stats()
+    save_stats = shared_state.persister.stats()
+    print_box(
+        f"Finished Processing Section: '{section_name}'\n"
+        f"OCR cache this session: {cache_stats['hits']} hits, {cache_stats['misses']} misses\n"
+        f"Estimated OCR time saved by triage: {section['ocr_seconds_saved']}s\n"
+        f"Images with low-confidence text read again: {len(section.get('ocr_escalated', {}))}\n"
+        f"Book saved {save_stats['writes']} times for {save_stats['changes']} changes "
+        f"({save_stats['bytes_per_sec'] / 1024:.1f} KB/s written)"
+    )
+
+
+def start_backfill(shared_state, json_file_path):
+    """OCRs earlier sections whose text is missing or stale in the background while capturing carries on."""
+    with shared_state.lock:
+        # The current section is still being captured; it is processed when it is closed
+        current = (shared_state.current_chapter_index, shared_state.current_section_index)
+        targets = find_stale_sections(shared_state.data, shared_state.ocr_engine.config_key, skip=current)
+    if not targets:
+        return
 
-    print_box(f"Finished Processing Section: '{section_name}'\n")
+    def save(chapter_index, section_index, section):
+        shared_state.persister.record(ocr_completed(chapter_index, section_index, section))
 
+    def run():
+        filled = backfill_sections(
+            shared_state.data, shared_state.lock, shared_state.ocr_queue, shared_state.ocr_engine.config_key,
+            targets, save, print, shared_state.closing
+        )
+        print_box(f"Backfilled OCR for {filled} of {len(targets)} earlier sections")
 
-def capture_screenshot_mac(target_path):
+    print_box(f"Filling in OCR for {len(targets)} earlier sections in the background...")
+    shared_state.executors.submit_io(run)
+
+
+def capture_screenshot(target_path):
     try:
-        subprocess.run(['screencapture', '-i', target_path], check=True)
-        return target_path
-    except subprocess.CalledProcessError as e:
+        with session_metrics.timer("capture"):
+            return capture_backend.capture(target_path)
+    except CaptureError as e:
+        session_metrics.increment("captures_failed")
         print(f"Failed to capture screenshot: {e}")
         return None
 
 
-def extract_text_from_image(image_path):
-    if not os.path.exists(image_path):
+def extract_name_from_image(buffer):
+    """The name in a name capture and the seconds it took to read, or (None, 0.0) if it can't be read."""
+    image_path = buffer.path
+    if not buffer.unsaved and not os.path.exists(image_path):
         print(f"Image file not found: {image_path}")
-        return None
+        return None, 0.0
     try:
-        with Image.open(image_path) as img:
-            text = pytesseract.image_to_string(img).strip()
-            return text
+        # Cropped to the text and read as one line, on a Tesseract instance kept warm for names
+        return title_reader.read(buffer.decoded)
     except Exception as e:
         print(f"Error extracting text from image {image_path}: {e}")
-        return None
+        return None, 0.0
 
 
 def get_name(prompt_instructions, capture_key, manual_key):
@@ -91,10 +185,14 @@ def get_name(prompt_instructions, capture_key, manual_key):
         if user_input == capture_key:
             unique_name = f"{uuid.uuid4()}.png"
             image_path = os.path.join(TEMP_DIR, unique_name)
-            if capture_screenshot_mac(image_path):
-                name = extract_text_from_image(image_path)
+            buffer = capture_screenshot(image_path)
+            if buffer is not None:
+                name, seconds = extract_name_from_image(buffer)
+                session_metrics.observe("name_ocr", seconds)
+                # Only the name is kept, not the capture it was read from
+                buffer.remove()
                 if name:
-                    print(f"\nExtracted name: '{name}'\n")
+                    print(f"\nExtracted name: '{name}' ({latency_note(seconds)})\n")
                     return name
                 else:
                     print("\nNo text extracted from image. Please try again.\n")
@@ -140,56 +238,120 @@ class ScreenshotHandler:
         self.shared_state = shared_state
         self.json_file_path = json_file_path
 
-    def add_image_to_section(self, file_path, image_type='images'):
+    def add_image_to_section(self, file_path, image_type='images', buffer=None):
+        # Read and decoded once, or already in memory from the capture backend; hashing, scroll detection,
+        # verification and OCR all use this buffer
+        if buffer is None:
+            buffer = ImageBuffer(file_path)
+        # Hashed before taking the lock; unreadable images still go through so verify_image reports them
+        try:
+            with session_metrics.timer("hash"):
+                image_hash = perceptual_hash(buffer.decoded)
+        except Exception:
+            image_hash = None
+
         with self.shared_state.lock:
             if self.shared_state.current_section_path is None:
                 print("No active section to add the image.")
+                buffer.discard()
                 return
+
+            chapter_index = self.shared_state.current_chapter_index
+            section_index = self.shared_state.current_section_index
+            section = self.shared_state.data["chapters"][chapter_index]["sections"][section_index]
+            duplicate = find_near_duplicate(image_hash, section.get("image_hashes", {}))
+            previous_images = section.get(image_type, [])
+            previous_image = previous_images[-1] if previous_images else None
+
+            if duplicate is not None and DUPLICATE_ACTION == "skip":
+                # Only delete our own captures, never an image file the user typed in
+                captured_dir = os.path.abspath(self.shared_state.current_section_path)
+                if os.path.dirname(os.path.abspath(file_path)) == captured_dir:
+                    buffer.remove()
+                print(f"\nSkipped duplicate of '{os.path.basename(duplicate[0])}' (distance {duplicate[1]})\n")
+                session_metrics.increment("duplicates_skipped")
+                return
+
             unique_name = f"{uuid.uuid4()}{os.path.splitext(file_path)[1]}"
             new_file_path = os.path.join(self.shared_state.current_section_path, unique_name)
             try:
-                if os.path.abspath(file_path) != os.path.abspath(new_file_path):
-                    os.rename(file_path, new_file_path)
+                with session_metrics.timer("move"):
+                    buffer.move(new_file_path)
             except Exception as e:
                 print(f"Error moving file: {e}")
+                buffer.discard()
                 return
 
-            chapter_index = self.shared_state.current_chapter_index
-            section_index = self.shared_state.current_section_index
-            section = self.shared_state.data["chapters"][chapter_index]["sections"][section_index]
-            section.setdefault(image_type, []).append(new_file_path)
-            section["status"] = "images testing in progress"
+            if duplicate is not None:
+                # Kept on disk for reference, but never OCR'd or sent to the LLM prompts
+                duplicate_entry = {
+                    "path": new_file_path,
+                    "duplicate_of": duplicate[0],
+                    "distance": duplicate[1]
+                }
+                section.setdefault("duplicate_images", []).append(duplicate_entry)
+                event = duplicate_flagged(chapter_index, section_index, duplicate_entry)
+                session_metrics.increment("duplicates_flagged")
+            else:
+                section.setdefault(image_type, []).append(new_file_path)
+                if image_hash:
+                    section.setdefault("image_hashes", {})[new_file_path] = image_hash
+                section["status"] = "images testing in progress"
+                event = image_added(chapter_index, section_index, image_type, new_file_path, image_hash)
+                session_metrics.increment("images_added")
+
+            self.shared_state.persister.record(event)
 
-            with open(self.json_file_path, 'w') as f:
-                json.dump(self.shared_state.data, f, indent=4)
+        # An in-memory capture's file is written in the background; nothing below needs it on disk
+        buffer.write_later(self.shared_state.executors.submit_io)
+
+        if duplicate is not None:
+            print(f"\nFlagged '{unique_name}' as a duplicate of '{os.path.basename(duplicate[0])}' "
+                  f"(distance {duplicate[1]})\n")
+            return
+
+        # A scrolled capture repeats the bottom of the previous one; only the new strip is OCR'd
+        with session_metrics.timer("scroll_detect"):
+            crop_top = scroll_cut_row(previous_image, new_file_path, buffer) if SCROLL_STITCH and previous_image else 0
+        if crop_top:
+            with self.shared_state.lock:
+                section.setdefault("scroll_overlaps", {})[new_file_path] = crop_top
+                self.shared_state.persister.record(
+                    scroll_overlap(chapter_index, section_index, new_file_path, crop_top)
+                )
+        if OCR_ENGINE == "eager":
+            self.shared_state.ocr_queue.enqueue(new_file_path, crop_top, image_type, buffer)
 
         image_type_display = "code image" if image_type == "code_images" else "image"
         print(f"\nAdded {image_type_display} '{unique_name}' to section '{section['section_name']}'\n")
-        threading.Thread(target=self.verify_image, args=(new_file_path, chapter_index, section_index)).start()
+        self.shared_state.executors.submit_io(self.verify_image, new_file_path, chapter_index, section_index, buffer)
 
-    def verify_image(self, image_path, chapter_index, section_index):
+    def verify_image(self, image_path, chapter_index, section_index, buffer):
         try:
-            with Image.open(image_path) as img:
-                img.verify()
+            with session_metrics.timer("verify"):
+                buffer.verify()
             print(f"Verified image: {os.path.basename(image_path)} - OK\n")
             with self.shared_state.lock:
                 section = self.shared_state.data["chapters"][chapter_index]["sections"][section_index]
                 if not section.get("errors"):
                     section["status"] = "images tested ok"
-                with open(self.json_file_path, 'w') as f:
-                    json.dump(self.shared_state.data, f, indent=4)
+                self.shared_state.persister.record(image_verified(chapter_index, section_index, image_path))
         except Exception as e:
+            session_metrics.increment("verify_errors")
             error_message = f"Error verifying image {image_path}: {e}"
             print(error_message)
             with self.shared_state.lock:
                 section = self.shared_state.data["chapters"][chapter_index]["sections"][section_index]
                 section.setdefault("errors", []).append(error_message)
                 section["status"] = "errors encountered"
-                with open(self.json_file_path, 'w') as f:
-                    json.dump(self.shared_state.data, f, indent=4)
+                self.shared_state.persister.record(
+                    image_verified(chapter_index, section_index, image_path, error_message)
+                )
 
 
 def main():
+    # Loads the name OCR model while the first prompts are answered
+    title_reader.start()
     welcome_message = (
         "Welcome to the Screenshot and OCR Program!\n"
         "Instructions:\n"
@@ -205,6 +367,8 @@ def main():
         "     - Type 'w' to capture a screenshot of code.\n"
         "     - Type 'n' to start a new section.\n"
         "     - Type 'c' to start a new chapter.\n"
+        "     - Type 'watch <folder>' to add every image saved into a folder to the current section.\n"
+        "     - Type 'unwatch' to stop watching the folder.\n"
         "     - Type 'exit' to quit the program.\n"
     )
     print_box(welcome_message)
@@ -216,7 +380,7 @@ def main():
 
     if choice == 'new':
         json_file_name = input("Enter the name for the new JSON file (without extension): ").strip()
-        json_file_path = os.path.join(JSON_DIR, json_file_name + '.json')
+        json_file_path = os.path.join(JSON_DIR, json_file_name + book_suffix())
         shared_state.data = {"chapters": []}
 
         chapter_name = get_chapter_name()
@@ -253,12 +417,15 @@ def main():
         if not os.path.isfile(json_file_path):
             print(f"File not found: {json_file_path}")
             return
-        with open(json_file_path, 'r') as f:
-            try:
-                shared_state.data = json.load(f)
-            except json.JSONDecodeError:
-                print("Invalid JSON file.")
-                return
+        try:
+            shared_state.data = load_book(json_file_path)
+        except ValueError:
+            print("Invalid book file.")
+            return
+        # Changes the last session journaled but never wrote into the JSON (it crashed or was killed)
+        recovered = recover_book(json_file_path, shared_state.data)
+        if recovered:
+            print(f"Recovered {recovered} unsaved changes from {journal_path(json_file_path)}")
         if not shared_state.data.get("chapters"):
             print("The JSON file has no chapters.")
             return
@@ -278,6 +445,20 @@ def main():
         print("Invalid choice. Please enter 'new' or 'existing'.")
         return
 
+    journal = BookJournal(json_file_path, reset=(choice == 'new')) if BOOK_JOURNAL else None
+    shared_state.persister = BookPersister(json_file_path, shared_state.lock, lambda: shared_state.data, journal=journal)
+    # Queue depths are read each time the metrics file is written
+    session_metrics.gauge("io_queue_depth", lambda: shared_state.executors.queue_depth()["io"])
+    session_metrics.gauge("cpu_queue_depth", lambda: shared_state.executors.queue_depth()["cpu"])
+    session_metrics.gauge("ocr_queued", lambda: shared_state.ocr_queue.depth()["queued"])
+    session_metrics.gauge("ocr_in_flight", lambda: shared_state.ocr_queue.depth()["in_flight"])
+    session_metrics.start()
+    if choice == 'new':
+        # The first chapter and section were set up before there was anything to record them in
+        shared_state.persister.mark_dirty()
+    if choice == 'existing':
+        start_backfill(shared_state, json_file_path)
+
     event_handler = ScreenshotHandler(shared_state, json_file_path)
     user_input_loop(shared_state, json_file_path, event_handler)
 
@@ -291,13 +472,17 @@ def user_input_loop(shared_state, json_file_path, event_handler):
         " - Type 'w' to capture a screenshot of code.\n"
         " - Type 'n' to start a new section.\n"
         " - Type 'c' to start a new chapter.\n"
+        " - Type 'watch <folder>' to add every image saved into a folder to the current section.\n"
+        " - Type 'unwatch' to stop watching the folder.\n"
         " - Type 'exit' to quit the program.\n"
     )
     print_box(command_instructions)
+    watcher = None
 
     try:
         while True:
-            user_input = input(f"Chapter '{shared_state.data['chapters'][shared_state.current_chapter_index]['chapter_name']}', Section '{shared_state.data['chapters'][shared_state.current_chapter_index]['sections'][shared_state.current_section_index]['section_name']}'\nEnter command: ").strip().lower()
+            raw_input = input(f"Chapter '{shared_state.data['chapters'][shared_state.current_chapter_index]['chapter_name']}', Section '{shared_state.data['chapters'][shared_state.current_chapter_index]['sections'][shared_state.current_section_index]['section_name']}'\nEnter command: ").strip()
+            user_input = raw_input.lower()
 
             if user_input in ['n', 'next']:
                 with shared_state.lock:
@@ -305,10 +490,9 @@ def user_input_loop(shared_state, json_file_path, event_handler):
                     prev_section_index = shared_state.current_section_index
 
                 if prev_section_index >= 0:
-                    threading.Thread(
-                        target=process_section,
-                        args=(shared_state, json_file_path, prev_chapter_index, prev_section_index)
-                    ).start()
+                    shared_state.executors.submit_io(
+                        process_section, shared_state, json_file_path, prev_chapter_index, prev_section_index
+                    )
 
                 section_name = get_section_name()
                 with shared_state.lock:
@@ -317,14 +501,18 @@ def user_input_loop(shared_state, json_file_path, event_handler):
                     section_dir = os.path.join(chapter_dir, f"section_{shared_state.current_section_index+1}")
                     os.makedirs(section_dir, exist_ok=True)
                     shared_state.current_section_path = section_dir
-                    shared_state.data["chapters"][shared_state.current_chapter_index]["sections"].append({
+                    section = {
                         "section_name": section_name,
                         "section_path": section_dir,
                         "images": [],
                         "code_images": [],
                         "status": "images testing in progress",
                         "errors": []
-                    })
+                    }
+                    shared_state.data["chapters"][shared_state.current_chapter_index]["sections"].append(section)
+                    shared_state.persister.record(section_created(
+                        shared_state.current_chapter_index, shared_state.current_section_index, section
+                    ))
                 print_box(f"Moved to New Section: '{section_name}'")
 
             elif user_input in ['c', 'chapter']:
@@ -333,10 +521,9 @@ def user_input_loop(shared_state, json_file_path, event_handler):
                     prev_section_index = shared_state.current_section_index
 
                 if prev_section_index >= 0:
-                    threading.Thread(
-                        target=process_section,
-                        args=(shared_state, json_file_path, prev_chapter_index, prev_section_index)
-                    ).start()
+                    shared_state.executors.submit_io(
+                        process_section, shared_state, json_file_path, prev_chapter_index, prev_section_index
+                    )
 
                 chapter_name = get_chapter_name()
                 with shared_state.lock:
@@ -344,11 +531,13 @@ def user_input_loop(shared_state, json_file_path, event_handler):
                     shared_state.current_section_index = -1
                     chapter_dir = os.path.join(BASE_SCREENSHOTS_DIR, f"chapter_{shared_state.current_chapter_index+1}")
                     os.makedirs(chapter_dir, exist_ok=True)
-                    shared_state.data["chapters"].append({
+                    chapter = {
                         "chapter_name": chapter_name,
                         "chapter_path": chapter_dir,
                         "sections": []
-                    })
+                    }
+                    shared_state.data["chapters"].append(chapter)
+                    shared_state.persister.record(chapter_created(shared_state.current_chapter_index, chapter))
 
                 section_name = get_section_name()
                 with shared_state.lock:
@@ -356,14 +545,18 @@ def user_input_loop(shared_state, json_file_path, event_handler):
                     section_dir = os.path.join(chapter_dir, f"section_{shared_state.current_section_index+1}")
                     os.makedirs(section_dir, exist_ok=True)
                     shared_state.current_section_path = section_dir
-                    shared_state.data["chapters"][-1]["sections"].append({
+                    section = {
                         "section_name": section_name,
                         "section_path": section_dir,
                         "images": [],
                         "code_images": [],
                         "status": "images testing in progress",
                         "errors": []
-                    })
+                    }
+                    shared_state.data["chapters"][-1]["sections"].append(section)
+                    shared_state.persister.record(section_created(
+                        shared_state.current_chapter_index, shared_state.current_section_index, section
+                    ))
                 print_box(f"Moved to New Chapter: '{chapter_name}'\nCurrent Section: '{section_name}'")
 
             elif user_input == 's':
@@ -373,8 +566,9 @@ def user_input_loop(shared_state, json_file_path, event_handler):
                         print("No active section to add the image.")
                         continue
                     image_path = os.path.join(shared_state.current_section_path, unique_name)
-                if capture_screenshot_mac(image_path):
-                    threading.Thread(target=event_handler.add_image_to_section, args=(image_path,)).start()
+                buffer = capture_screenshot(image_path)
+                if buffer is not None:
+                    shared_state.executors.submit_cpu(event_handler.add_image_to_section, image_path, 'images', buffer)
                 else:
                     print("Failed to capture the screenshot.")
 
@@ -385,16 +579,49 @@ def user_input_loop(shared_state, json_file_path, event_handler):
                         print("No active section to add the image.")
                         continue
                     image_path = os.path.join(shared_state.current_section_path, unique_name)
-                if capture_screenshot_mac(image_path):
-                    threading.Thread(
-                        target=event_handler.add_image_to_section,
-                        args=(image_path, 'code_images')
-                    ).start()
+                buffer = capture_screenshot(image_path)
+                if buffer is not None:
+                    shared_state.executors.submit_cpu(
+                        event_handler.add_image_to_section, image_path, 'code_images', buffer
+                    )
                 else:
                     print("Failed to capture the screenshot.")
 
+            elif user_input.startswith('watch '):
+                folder = os.path.abspath(os.path.expanduser(raw_input[len('watch '):].strip()))
+                screenshots_dir = os.path.abspath(BASE_SCREENSHOTS_DIR)
+                if os.path.commonpath([folder, screenshots_dir]) == screenshots_dir:
+                    # Added images are moved into the section folders, which would be picked up again
+                    print(f"Cannot watch a folder inside {BASE_SCREENSHOTS_DIR}.")
+                    continue
+                if watcher is not None:
+                    watcher.stop()
+                watcher = FolderWatcher(
+                    folder, lambda path: shared_state.executors.submit_cpu(event_handler.add_image_to_section, path)
+                )
+                try:
+                    watcher.start()
+                except OSError as e:
+                    print(f"Could not watch {folder}: {e}")
+                    watcher = None
+                    continue
+                print_box(f"Watching '{folder}'\nNew images saved there are added to the current section.")
+
+            elif user_input == 'unwatch':
+                if watcher is None:
+                    print("No folder is being watched.")
+                    continue
+                watcher.stop()
+                print(f"Stopped watching '{watcher.directory}' ({watcher.picked_up} images added).")
+                watcher = None
+
             elif user_input == 'exit':
                 print("Exiting the program.")
+                if watcher is not None:
+                    watcher.stop()
+                shared_state.closing.set()
+                # Screenshots still being added have to be in the final section before it is processed
+                shared_state.executors.drain_cpu()
                 with shared_state.lock:
                     prev_chapter_index = shared_state.current_chapter_index
                     prev_section_index = shared_state.current_section_index
@@ -402,22 +629,35 @@ def user_input_loop(shared_state, json_file_path, event_handler):
                     process_section(shared_state, json_file_path, prev_chapter_index, prev_section_index)
                 break
 
-            elif os.path.isfile(user_input):
-                threading.Thread(target=event_handler.add_image_to_section, args=(user_input,)).start()
+            elif os.path.isfile(raw_input):
+                shared_state.executors.submit_cpu(event_handler.add_image_to_section, raw_input)
 
             elif user_input == '':
                 continue
 
             else:
-                print(f"Invalid command or file not found: '{user_input}'")
+                print(f"Invalid command or file not found: '{raw_input}'")
 
     except KeyboardInterrupt:
         print("\nInterrupted by user.")
 
     finally:
-        with shared_state.lock:
-            with open(json_file_path, 'w') as f:
-                json.dump(shared_state.data, f, indent=4)
+        if watcher is not None:
+            watcher.stop()
+        shared_state.closing.set()
+        print(f"Finishing {sum(shared_state.executors.queue_depth().values())} background tasks...")
+        shared_state.executors.drain()
+        if shared_state.storage is not None:
+            storage_stats = shared_state.storage.stats()
+            print(f"Compacted screenshots: {storage_stats['transcoded']} recompressed, "
+                  f"{storage_stats['linked']} duplicates linked, "
+                  f"{storage_stats['bytes_reclaimed'] / 1024 / 1024:.1f} MB reclaimed")
+        print_box(f"OCR latency\n{ocr_latency.report()}")
+        shared_state.persister.close()
+        metrics_path = session_metrics.stop()
+        if metrics_path:
+            print(f"Session metrics written to {metrics_path}")
+        shared_state.ocr_engine.shutdown(wait=False)
         print("\nJSON file saved. Goodbye!\n")
 
 
@@ -1,16 +1,29 @@
 import os
-import json
 import uuid
 import threading
-import subprocess
-from typing import Optional, List
-from PIL import Image
-import pytesseract
+from typing import Iterable, Optional, Tuple
 from pynput import keyboard
 import queue
 import signal
 import time
 
+from ocr_engine import create_ocr_engine, EagerOCRQueue, OCR_ENGINE, OCR_WORKERS, ocr_latency
+from ocr_cache import CachedOCREngine
+from image_hash import perceptual_hash, find_near_duplicate, DUPLICATE_ACTION
+from image_pipeline import ImageBuffer
+from image_stitch import scroll_cut_row, SCROLL_STITCH
+from image_storage import StorageManager, STORAGE_COMPACT, clean_temp
+from screen_capture import create_capture_backend, CaptureError
+from title_ocr import TitleReader, latency_note
+from image_triage import triage_record
+from book_backfill import find_stale_sections, backfill_sections
+from task_executor import TaskExecutors
+from book_persister import BookPersister
+from book_store import load_book, book_suffix
+from session_metrics import session_metrics
+from book_journal import (BookJournal, BOOK_JOURNAL, journal_path, recover_book, chapter_created, section_created,
+                          image_added, duplicate_flagged, scroll_overlap, image_verified, ocr_completed)
+
 # Directories
 BASE_SCREENSHOTS_DIR = './screenshots-images-2'
 JSON_DIR = './json-book'
@@ -19,6 +32,13 @@ TEMP_DIR = './temp_screenshots'
 # Create necessary directories
 for directory in [BASE_SCREENSHOTS_DIR, JSON_DIR, TEMP_DIR]:
     os.makedirs(directory, exist_ok=True)
+# Name captures and other leftovers from earlier runs
+clean_temp(TEMP_DIR)
+
+# screencapture on macOS; an in-memory X11 grab on Linux (CAPTURE_BACKEND)
+capture_backend = create_capture_backend()
+# Reads chapter and section names; warmed up when main() starts
+title_reader = TitleReader()
 
 def plain_panel(message: str, title: str = "", style: str = ""):
     border = "=" * 60
@@ -38,6 +58,18 @@ class SharedState:
         self.lock = threading.Lock()
         self.command_queue = queue.Queue()
         self.running = True
+        # Results are cached by image content, so re-processing unchanged screenshots is nearly free
+        self.ocr_engine = CachedOCREngine(create_ocr_engine(workers=OCR_WORKERS))
+        # With OCR_ENGINE=eager, screenshots are OCR'd as they are captured; process_section collects the results
+        self.ocr_queue = EagerOCRQueue(self.ocr_engine)
+        # Set when the program starts shutting down, so background backfill stops
+        self.closing = threading.Event()
+        # Background work runs on bounded pools instead of a new thread per screenshot or section
+        self.executors = TaskExecutors()
+        # Created once the JSON file is chosen; saves the book off the lock, coalescing changes
+        self.persister = None
+        # Recompresses and deduplicates each section's screenshots once its OCR is done
+        self.storage = StorageManager(BASE_SCREENSHOTS_DIR, cache=self.ocr_engine.cache) if STORAGE_COMPACT else None
 
 class KeyboardListener:
     def __init__(self, shared_state: SharedState):
@@ -136,84 +168,147 @@ class ScreenshotHandler:
         self.shared_state = shared_state
         self.json_file_path = json_file_path
 
-    def add_image_to_section(self, file_path: str, image_type: str = 'images'):
+    def add_image_to_section(self, file_path: str, image_type: str = 'images',
+                             buffer: Optional[ImageBuffer] = None):
+        # Read and decoded once, or already in memory from the capture backend; hashing, scroll detection,
+        # verification and OCR all use this buffer
+        if buffer is None:
+            buffer = ImageBuffer(file_path)
+        # Hashed before taking the lock; unreadable images still go through so verify_image reports them
+        try:
+            with session_metrics.timer("hash"):
+                image_hash = perceptual_hash(buffer.decoded)
+        except Exception:
+            image_hash = None
+
         with self.shared_state.lock:
             if self.shared_state.current_section_path is None:
                 print("No active section to add the image.")
+                buffer.discard()
+                return
+
+            chapter_index = self.shared_state.current_chapter_index
+            section_index = self.shared_state.current_section_index
+            section = self.shared_state.data["New item"]["chapters"][chapter_index]["sections"][section_index]
+            duplicate = find_near_duplicate(image_hash, section.get("image_hashes", {}))
+            previous_images = section.get(image_type, [])
+            previous_image = previous_images[-1] if previous_images else None
+
+            if duplicate is not None and DUPLICATE_ACTION == "skip":
+                buffer.remove()
+                print(f"Skipped duplicate of '{os.path.basename(duplicate[0])}' (distance {duplicate[1]})")
+                session_metrics.increment("duplicates_skipped")
                 return
 
             unique_name = f"{uuid.uuid4()}{os.path.splitext(file_path)[1]}"
             new_file_path = os.path.join(self.shared_state.current_section_path, unique_name)
 
             try:
-                if os.path.abspath(file_path) != os.path.abspath(new_file_path):
-                    os.rename(file_path, new_file_path)
+                with session_metrics.timer("move"):
+                    buffer.move(new_file_path)
             except Exception as e:
                 print(f"Error moving file: {e}")
+                buffer.discard()
                 return
 
-            chapter_index = self.shared_state.current_chapter_index
-            section_index = self.shared_state.current_section_index
-            section = self.shared_state.data["New item"]["chapters"][chapter_index]["sections"][section_index]
-            section.setdefault(image_type, []).append(new_file_path)
-            section["status"] = "images testing in progress"
+            if duplicate is not None:
+                # Kept on disk for reference, but never OCR'd or sent to the LLM prompts
+                duplicate_entry = {
+                    "path": new_file_path,
+                    "duplicate_of": duplicate[0],
+                    "distance": duplicate[1]
+                }
+                section.setdefault("duplicate_images", []).append(duplicate_entry)
+                event = duplicate_flagged(chapter_index, section_index, duplicate_entry)
+                session_metrics.increment("duplicates_flagged")
+            else:
+                section.setdefault(image_type, []).append(new_file_path)
+                if image_hash:
+                    section.setdefault("image_hashes", {})[new_file_path] = image_hash
+                section["status"] = "images testing in progress"
+                event = image_added(chapter_index, section_index, image_type, new_file_path, image_hash)
+                session_metrics.increment("images_added")
+
+            self.shared_state.persister.record(event)
+
+        # An in-memory capture's file is written in the background; nothing below needs it on disk
+        buffer.write_later(self.shared_state.executors.submit_io)
+
+        if duplicate is not None:
+            plain_panel(
+                f"Flagged '{unique_name}' as a duplicate of '{os.path.basename(duplicate[0])}' (distance {duplicate[1]})",
+                title="Duplicate Flagged"
+            )
+            return
 
-            with open(self.json_file_path, 'w') as f:
-                json.dump(self.shared_state.data, f, indent=4)
+        # A scrolled capture repeats the bottom of the previous one; only the new strip is OCR'd
+        with session_metrics.timer("scroll_detect"):
+            crop_top = scroll_cut_row(previous_image, new_file_path, buffer) if SCROLL_STITCH and previous_image else 0
+        if crop_top:
+            with self.shared_state.lock:
+                section.setdefault("scroll_overlaps", {})[new_file_path] = crop_top
+                self.shared_state.persister.record(
+                    scroll_overlap(chapter_index, section_index, new_file_path, crop_top)
+                )
+        if OCR_ENGINE == "eager":
+            self.shared_state.ocr_queue.enqueue(new_file_path, crop_top, image_type, buffer)
 
         image_type_display = "code image" if image_type == "code_images" else "image"
         plain_panel(
             f"Added {image_type_display} '{unique_name}' to section '{section['section_name']}' (ID: {section['section_id']})",
             title="Image Added"
         )
-        threading.Thread(
-            target=self.verify_image,
-            args=(new_file_path, chapter_index, section_index)
-        ).start()
+        self.shared_state.executors.submit_io(self.verify_image, new_file_path, chapter_index, section_index, buffer)
 
-    def verify_image(self, image_path: str, chapter_index: int, section_index: int):
+    def verify_image(self, image_path: str, chapter_index: int, section_index: int, buffer: ImageBuffer):
         try:
-            with Image.open(image_path) as img:
-                img.verify()
+            with session_metrics.timer("verify"):
+                buffer.verify()
             print(f"Verified image: {os.path.basename(image_path)} - OK")
 
             with self.shared_state.lock:
                 section = self.shared_state.data["New item"]["chapters"][chapter_index]["sections"][section_index]
                 if not section.get("errors"):
                     section["status"] = "images tested ok"
-                with open(self.json_file_path, 'w') as f:
-                    json.dump(self.shared_state.data, f, indent=4)
+                self.shared_state.persister.record(image_verified(chapter_index, section_index, image_path))
         except Exception as e:
+            session_metrics.increment("verify_errors")
             error_message = f"Error verifying image {image_path}: {e}"
             print(error_message)
             with self.shared_state.lock:
                 section = self.shared_state.data["New item"]["chapters"][chapter_index]["sections"][section_index]
                 section.setdefault("errors", []).append(error_message)
                 section["status"] = "errors encountered"
-                with open(self.json_file_path, 'w') as f:
-                    json.dump(self.shared_state.data, f, indent=4)
+                self.shared_state.persister.record(
+                    image_verified(chapter_index, section_index, image_path, error_message)
+                )
 
-def capture_screenshot_mac(target_path: str) -> Optional[str]:
+def capture_screenshot(target_path: str) -> Optional[ImageBuffer]:
     try:
-        subprocess.run(['screencapture', '-i', target_path], check=True)
-        return target_path
-    except subprocess.CalledProcessError as e:
+        with session_metrics.timer("capture"):
+            return capture_backend.capture(target_path)
+    except CaptureError as e:
+        session_metrics.increment("captures_failed")
         print(f"Failed to capture screenshot: {e}")
         return None
 
-def extract_text_from_image(image_path: str) -> Optional[str]:
-    if not os.path.exists(image_path):
+def extract_name_from_image(buffer: ImageBuffer) -> Tuple[Optional[str], float]:
+    """The name in a name capture and the seconds it took to read, or (None, 0.0) if it can't be read."""
+    image_path = buffer.path
+    if not buffer.unsaved and not os.path.exists(image_path):
         print(f"Image file not found: {image_path}")
-        return None
+        return None, 0.0
     try:
-        with Image.open(image_path) as img:
-            text = pytesseract.image_to_string(img).strip()
-            return text
+        # Cropped to the text and read as one line, on a Tesseract instance kept warm for names
+        return title_reader.read(buffer.decoded)
     except Exception as e:
         print(f"Error extracting text from image {image_path}: {e}")
-        return None
+        return None, 0.0
 
 def process_section(shared_state: SharedState, json_file_path: str, chapter_index: int, section_index: int):
+    # Screenshots still being added on the cpu pool must be in the section, with their scroll overlap
+    # recorded and their OCR queued, before it is read; otherwise they'd be OCR'd again, uncropped
+    shared_state.executors.wait_cpu()
     with shared_state.lock:
         section = shared_state.data["New item"]["chapters"][chapter_index]["sections"][section_index]
         image_paths = section.get("images", [])
@@ -223,6 +318,8 @@ def process_section(shared_state: SharedState, json_file_path: str, chapter_inde
         chapter_name = shared_state.data["New item"]["chapters"][chapter_index]["chapter_name"]
         image_paths = list(image_paths)
         code_image_paths = list(code_image_paths)
+        scroll_overlaps = dict(section.get("scroll_overlaps", {}))
+        errors_before = len(section.get("errors", []))
 
     plain_panel(
         f"Processing Section: '{section_name}' (ID: {section_id})\nIn Chapter: '{chapter_name}'",
@@ -230,34 +327,64 @@ def process_section(shared_state: SharedState, json_file_path: str, chapter_inde
     )
     print(f"Found {len(image_paths)} images and {len(code_image_paths)} code images to process...")
 
-    def extract_texts(image_list: List[str], type_name: str) -> str:
+    def extract_texts(results: Iterable[dict], total: int, type_name: str) -> str:
         texts = []
-        total = len(image_list)
-        for idx, image_path in enumerate(image_list, 1):
-            print(f"Processing {type_name} {idx}/{total}: {os.path.basename(image_path)}")
-            try:
-                with Image.open(image_path) as img:
-                    text = pytesseract.image_to_string(img)
-                    texts.append(text)
-            except Exception as e:
-                error_message = f"Error extracting text from image {image_path}: {e}"
+        # Results come back in capture order
+        for idx, result in enumerate(results, 1):
+            print(f"Processed {type_name} {idx}/{total}: {os.path.basename(result['path'])}")
+            if result["error"] is None:
+                texts.append(result["text"])
+                if "profile" in result:
+                    with shared_state.lock:
+                        section.setdefault("ocr_triage", {})[result["path"]] = triage_record(result)
+                if "escalation" in result:
+                    with shared_state.lock:
+                        section.setdefault("ocr_escalated", {})[result["path"]] = result["escalation"]
+            else:
+                error_message = f"Error extracting text from image {result['path']}: {result['error']}"
                 print(error_message)
                 with shared_state.lock:
                     section.setdefault("errors", []).append(error_message)
         return "\n".join(texts)
 
+    # In bulk mode the whole section goes through one tesseract run per worker; results are split back by position
+    if OCR_ENGINE == "bulk":
+        results = list(shared_state.ocr_queue.collect(image_paths + code_image_paths, scroll_overlaps))
+        image_results, code_results = results[:len(image_paths)], results[len(image_paths):]
+    else:
+        image_results = shared_state.ocr_queue.collect(image_paths, scroll_overlaps, "images")
+        code_results = shared_state.ocr_queue.collect(code_image_paths, scroll_overlaps, "code_images")
+
     print("\nExtracting text from regular images...")
-    section["extracted-text"] = extract_texts(image_paths, "image")
+    section["extracted-text"] = extract_texts(image_results, len(image_paths), "image")
 
     print("\nExtracting text from code images...")
-    section["extracted-code"] = extract_texts(code_image_paths, "code image")
+    section["extracted-code"] = extract_texts(code_results, len(code_image_paths), "code image")
 
     with shared_state.lock:
-        with open(json_file_path, 'w') as f:
-            json.dump(shared_state.data, f, indent=4)
+        triage = section.get("ocr_triage", {}).values()
+        section["ocr_seconds_saved"] = round(sum(entry["seconds_saved"] or 0 for entry in triage), 3)
+        ocr_succeeded = len(section.get("errors", [])) == errors_before
+        if ocr_succeeded:
+            # Lets a later backfill tell whether this text still matches the OCR settings
+            section["ocr_config"] = shared_state.ocr_engine.config_key
+        shared_state.persister.record(ocr_completed(chapter_index, section_index, section))
+
+    # OCR is done with these screenshots, so they can be recompressed and deduplicated
+    if shared_state.storage is not None and ocr_succeeded:
+        shared_state.executors.submit_io(
+            shared_state.storage.compact, image_paths + code_image_paths, scroll_overlaps
+        )
 
+    cache_stats = shared_state.ocr_engine.cache.stats()
+    save_stats = shared_state.persister.stats()
     plain_panel(
-        f"Finished Processing Section: '{section_name}' (ID: {section_id})\nSaved results to JSON file: {json_file_path}",
+        f"Finished Processing Section: '{section_name}' (ID: {section_id})\nSaved results to JSON file: {json_file_path}\n"
+        f"OCR cache this session: {cache_stats['hits']} hits, {cache_stats['misses']} misses\n"
+        f"Estimated OCR time saved by triage: {section['ocr_seconds_saved']}s\n"
+        f"Images with low-confidence text read again: {len(section.get('ocr_escalated', {}))}\n"
+        f"Book saved {save_stats['writes']} times for {save_stats['changes']} changes "
+        f"({save_stats['bytes_per_sec'] / 1024:.1f} KB/s written)",
         title="Section Processing Completed"
     )
 
@@ -270,10 +397,14 @@ def get_name(shared_state: SharedState, capture_key: str, manual_key: str, promp
             if cmd == capture_key:
                 unique_name = f"{uuid.uuid4()}.png"
                 image_path = os.path.join(TEMP_DIR, unique_name)
-                if capture_screenshot_mac(image_path):
-                    name = extract_text_from_image(image_path)
+                buffer = capture_screenshot(image_path)
+                if buffer is not None:
+                    name, seconds = extract_name_from_image(buffer)
+                    session_metrics.observe("name_ocr", seconds)
+                    # Only the name is kept, not the capture it was read from
+                    buffer.remove()
                     if name:
-                        print(f"\nExtracted name: {name}")
+                        print(f"\nExtracted name: {name} ({latency_note(seconds)})")
                         return name
                     else:
                         print("\nNo text extracted from image. Please try again.")
@@ -286,24 +417,58 @@ def get_name(shared_state: SharedState, capture_key: str, manual_key: str, promp
         except queue.Empty:
             continue
 
+def start_backfill(shared_state: SharedState, json_file_path: str):
+    """OCRs earlier sections whose text is missing or stale in the background while capturing carries on."""
+    with shared_state.lock:
+        # The current section is still being captured; it is processed when it is closed
+        current = (shared_state.current_chapter_index, shared_state.current_section_index)
+        targets = find_stale_sections(shared_state.data, shared_state.ocr_engine.config_key, skip=current)
+    if not targets:
+        return
+
+    def save(chapter_index, section_index, section):
+        shared_state.persister.record(ocr_completed(chapter_index, section_index, section))
+
+    def run():
+        filled = backfill_sections(
+            shared_state.data, shared_state.lock, shared_state.ocr_queue, shared_state.ocr_engine.config_key,
+            targets, save, print, shared_state.closing
+        )
+        plain_panel(f"Backfilled OCR for {filled} of {len(targets)} earlier sections", title="Backfill")
+
+    plain_panel(f"Filling in OCR for {len(targets)} earlier sections in the background...", title="Backfill")
+    shared_state.executors.submit_io(run)
+
 def cleanup_and_quit(shared_state: SharedState, json_file_path: str, keyboard_listener: KeyboardListener):
     plain_panel("Initiating cleanup process...", title="Cleanup")
+    shared_state.closing.set()
+    # Screenshots still being added have to be in the final section before it is processed
+    shared_state.executors.drain_cpu()
     with shared_state.lock:
         prev_chapter_index = shared_state.current_chapter_index
         prev_section_index = shared_state.current_section_index
-        if prev_section_index >= 0:
-            plain_panel("Processing final section before quitting...", title="Final Section")
-            thread = threading.Thread(
-                target=process_section,
-                args=(shared_state, json_file_path, prev_chapter_index, prev_section_index)
-            )
-            thread.start()
-            thread.join(timeout=20)
-            if thread.is_alive():
-                print("Processing final section is taking too long. Proceeding with cleanup.")
-        print("Saving final state to JSON file...")
-        with open(json_file_path, 'w') as f:
-            json.dump(shared_state.data, f, indent=4)
+    if prev_section_index >= 0:
+        plain_panel(
+            f"Collecting OCR results for the final section ({shared_state.ocr_queue.pending_count()} images still queued)...",
+            title="Final Section"
+        )
+        # OCR has been running since each screenshot was taken, so this only waits for what is still queued
+        process_section(shared_state, json_file_path, prev_chapter_index, prev_section_index)
+    print(f"Finishing {shared_state.executors.queue_depth()['io']} background tasks...")
+    shared_state.executors.drain()
+    if shared_state.storage is not None:
+        storage_stats = shared_state.storage.stats()
+        print(f"Compacted screenshots: {storage_stats['transcoded']} recompressed, "
+              f"{storage_stats['linked']} duplicates linked, "
+              f"{storage_stats['bytes_reclaimed'] / 1024 / 1024:.1f} MB reclaimed")
+    plain_panel(ocr_latency.report(), title="OCR Latency")
+    print("Saving final state to JSON file...")
+    shared_state.persister.close()
+    metrics_path = session_metrics.stop()
+    if metrics_path:
+        print(f"Session metrics written to {metrics_path}")
+    print("Stopping OCR workers...")
+    shared_state.ocr_engine.shutdown()
     print("Stopping keyboard listener...")
     keyboard_listener.stop()
     plain_panel("Cleanup complete! Program terminated successfully.", title="Cleanup Completed")
@@ -313,10 +478,9 @@ def handle_section_creation(shared_state: SharedState, keyboard_listener: Keyboa
     prev_chapter_index = shared_state.current_chapter_index
     prev_section_index = shared_state.current_section_index
     if prev_section_index >= 0:
-        threading.Thread(
-            target=process_section,
-            args=(shared_state, json_file_path, prev_chapter_index, prev_section_index)
-        ).start()
+        shared_state.executors.submit_io(
+            process_section, shared_state, json_file_path, prev_chapter_index, prev_section_index
+        )
     keyboard_listener.set_context("name_capture")
     section_name = get_name(shared_state, 'd', 'dd', "Capture section name (d/dd)")
     keyboard_listener.set_context("main")
@@ -328,7 +492,7 @@ def handle_section_creation(shared_state: SharedState, keyboard_listener: Keyboa
         section_dir = os.path.join(chapter_dir, f"section_{shared_state.current_section_index+1}")
         os.makedirs(section_dir, exist_ok=True)
         shared_state.current_section_path = section_dir
-        shared_state.data["New item"]["chapters"][shared_state.current_chapter_index]["sections"].append({
+        section = {
             "section_id": section_id,
             "section_name": section_name,
             "section_path": section_dir,
@@ -338,17 +502,20 @@ def handle_section_creation(shared_state: SharedState, keyboard_listener: Keyboa
             "errors": [],
             "extracted-text": "",
             "extracted-code": ""
-        })
+        }
+        shared_state.data["New item"]["chapters"][shared_state.current_chapter_index]["sections"].append(section)
+        shared_state.persister.record(section_created(
+            shared_state.current_chapter_index, shared_state.current_section_index, section
+        ))
     plain_panel(f"Moved to New Section: '{section_name}' (ID: {section_id})", title="New Section")
 
 def handle_chapter_creation(shared_state: SharedState, keyboard_listener: KeyboardListener, json_file_path: str):
     prev_chapter_index = shared_state.current_chapter_index
     prev_section_index = shared_state.current_section_index
     if prev_section_index >= 0:
-        threading.Thread(
-            target=process_section,
-            args=(shared_state, json_file_path, prev_chapter_index, prev_section_index)
-        ).start()
+        shared_state.executors.submit_io(
+            process_section, shared_state, json_file_path, prev_chapter_index, prev_section_index
+        )
     keyboard_listener.set_context("name_capture")
     chapter_name = get_name(shared_state, 'a', 'aa', "Capture chapter name (a/aa)")
     keyboard_listener.set_context("main")
@@ -358,12 +525,14 @@ def handle_chapter_creation(shared_state: SharedState, keyboard_listener: Keyboa
         shared_state.current_section_index = -1
         chapter_dir = os.path.join(BASE_SCREENSHOTS_DIR, f"chapter_{chapter_id}")
         os.makedirs(chapter_dir, exist_ok=True)
-        shared_state.data["New item"]["chapters"].append({
+        chapter = {
             "chapter_id": chapter_id,
             "chapter_name": chapter_name,
             "chapter_path": chapter_dir,
             "sections": []
-        })
+        }
+        shared_state.data["New item"]["chapters"].append(chapter)
+        shared_state.persister.record(chapter_created(shared_state.current_chapter_index, chapter))
     keyboard_listener.set_context("name_capture")
     section_name = get_name(shared_state, 'd', 'dd', "Capture section name (d/dd)")
     keyboard_listener.set_context("main")
@@ -373,7 +542,7 @@ def handle_chapter_creation(shared_state: SharedState, keyboard_listener: Keyboa
         section_dir = os.path.join(chapter_dir, f"section_{shared_state.current_section_index+1}")
         os.makedirs(section_dir, exist_ok=True)
         shared_state.current_section_path = section_dir
-        shared_state.data["New item"]["chapters"][-1]["sections"].append({
+        section = {
             "section_id": section_id,
             "section_name": section_name,
             "section_path": section_dir,
@@ -383,13 +552,19 @@ def handle_chapter_creation(shared_state: SharedState, keyboard_listener: Keyboa
             "errors": [],
             "extracted-text": "",
             "extracted-code": ""
-        })
+        }
+        shared_state.data["New item"]["chapters"][-1]["sections"].append(section)
+        shared_state.persister.record(section_created(
+            shared_state.current_chapter_index, shared_state.current_section_index, section
+        ))
     plain_panel(
         f"Moved to New Chapter: '{chapter_name}' (ID: {chapter_id})\nCurrent Section: '{section_name}' (ID: {section_id})",
         title="New Chapter"
     )
 
 def main():
+    # Loads the name OCR model while the first prompts are answered
+    title_reader.start()
     plain_panel("Welcome to the Screenshot and OCR Program!\nThis version supports single-key commands (no need to press Enter)!",
                 title="Startup")
     choice = input("Create a new JSON file or use an existing one? (new/existing): ").strip().lower()
@@ -398,7 +573,7 @@ def main():
     keyboard_listener = None
     if choice == 'new':
         json_file_name = input("Enter the name for the new JSON file (without extension): ").strip()
-        json_file_path = os.path.join(JSON_DIR, f"{json_file_name}.json")
+        json_file_path = os.path.join(JSON_DIR, f"{json_file_name}{book_suffix()}")
         keyboard_listener = KeyboardListener(shared_state)
         keyboard_listener.start()
         keyboard_listener.set_context("name_capture")
@@ -442,12 +617,15 @@ def main():
         if not os.path.isfile(json_file_path):
             print(f"File not found: {json_file_path}")
             return
-        with open(json_file_path, 'r') as f:
-            try:
-                shared_state.data = json.load(f)
-            except json.JSONDecodeError:
-                print("Invalid JSON file.")
-                return
+        try:
+            shared_state.data = load_book(json_file_path)
+        except ValueError:
+            print("Invalid book file.")
+            return
+        # Changes the last session journaled but never wrote into the JSON (it crashed or was killed)
+        recovered = recover_book(json_file_path, shared_state.data)
+        if recovered:
+            print(f"Recovered {recovered} unsaved changes from {journal_path(json_file_path)}")
         if not shared_state.data.get("New item", {}).get("chapters"):
             print("The JSON file has no chapters or invalid format.")
             return
@@ -473,6 +651,20 @@ def main():
         print("Invalid choice. Please enter 'new' or 'existing'.")
         return
 
+    journal = BookJournal(json_file_path, reset=(choice == 'new')) if BOOK_JOURNAL else None
+    shared_state.persister = BookPersister(json_file_path, shared_state.lock, lambda: shared_state.data, journal=journal)
+    # Queue depths are read each time the metrics file is written
+    session_metrics.gauge("io_queue_depth", lambda: shared_state.executors.queue_depth()["io"])
+    session_metrics.gauge("cpu_queue_depth", lambda: shared_state.executors.queue_depth()["cpu"])
+    session_metrics.gauge("ocr_queued", lambda: shared_state.ocr_queue.depth()["queued"])
+    session_metrics.gauge("ocr_in_flight", lambda: shared_state.ocr_queue.depth()["in_flight"])
+    session_metrics.start()
+    if choice == 'new':
+        # The first chapter and section were set up before there was anything to record them in
+        shared_state.persister.mark_dirty()
+    if choice == 'existing':
+        start_backfill(shared_state, json_file_path)
+
     event_handler = ScreenshotHandler(shared_state, json_file_path)
 
     def signal_handler(signum, frame):
@@ -506,11 +698,9 @@ def main():
                             print("No active section to add the image.")
                             continue
                         image_path = os.path.join(shared_state.current_section_path, unique_name)
-                    if capture_screenshot_mac(image_path):
-                        threading.Thread(
-                            target=event_handler.add_image_to_section,
-                            args=(image_path,)
-                        ).start()
+                    buffer = capture_screenshot(image_path)
+                    if buffer is not None:
+                        shared_state.executors.submit_cpu(event_handler.add_image_to_section, image_path, 'images', buffer)
                     else:
                         print("Failed to capture the screenshot.")
                 elif cmd == 'w':
@@ -520,11 +710,11 @@ def main():
                             print("No active section to add the image.")
                             continue
                         image_path = os.path.join(shared_state.current_section_path, unique_name)
-                    if capture_screenshot_mac(image_path):
-                        threading.Thread(
-                            target=event_handler.add_image_to_section,
-                            args=(image_path, 'code_images')
-                        ).start()
+                    buffer = capture_screenshot(image_path)
+                    if buffer is not None:
+                        shared_state.executors.submit_cpu(
+                            event_handler.add_image_to_section, image_path, 'code_images', buffer
+                        )
                     else:
                         print("Failed to capture the screenshot.")
                 elif cmd == 'r':
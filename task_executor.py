@@ -0,0 +1,104 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, List
+
+# Threads for work that mostly waits on the disk or on OCR: moving files, verifying images, saving JSON,
+# collecting a section's results
+IO_WORKERS = int(os.environ.get("IO_WORKERS", "4"))
+# Threads for image analysis done in Python (hashing, scroll detection). NumPy and Pillow release the GIL
+# for most of it, but the OCR worker processes need the cores more.
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", "2"))
+# Tasks that may wait behind the running ones before submit() blocks the caller
+TASK_QUEUE_SIZE = int(os.environ.get("TASK_QUEUE_SIZE", "32"))
+
+
+class BoundedExecutor:
+    """A thread pool whose queue is capped: submit() blocks while it is full instead of piling up work."""
+
+    def __init__(self, name: str, workers: int, max_queue: int = TASK_QUEUE_SIZE):
+        self.name = name
+        self.workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(self.workers + max(0, max_queue))
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._futures = set()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        self._slots.acquire()
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release(None)
+            raise
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+            self._futures.discard(future)
+        self._slots.release()
+
+    def outstanding(self) -> List[Future]:
+        """Tasks submitted and not finished yet, as of now."""
+        with self._lock:
+            return list(self._futures)
+
+    def queue_depth(self) -> int:
+        """Tasks submitted and not finished yet, running ones included."""
+        with self._lock:
+            return self._pending
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+def _log_failure(future: Future):
+    # Without this, an exception in a background task would disappear silently
+    if not future.cancelled() and future.exception() is not None:
+        exc = future.exception()
+        print(f"Background task failed: {type(exc).__name__}: {exc}")
+
+
+class TaskExecutors:
+    """The program's background work: one pool for disk-bound tasks and one for image analysis."""
+
+    def __init__(self, io_workers: int = IO_WORKERS, cpu_workers: int = CPU_WORKERS,
+                 max_queue: int = TASK_QUEUE_SIZE):
+        self.io = BoundedExecutor("io", io_workers, max_queue)
+        self.cpu = BoundedExecutor("cpu", cpu_workers, max_queue)
+
+    def submit_io(self, fn: Callable, *args, **kwargs) -> Future:
+        future = self.io.submit(fn, *args, **kwargs)
+        future.add_done_callback(_log_failure)
+        return future
+
+    def submit_cpu(self, fn: Callable, *args, **kwargs) -> Future:
+        future = self.cpu.submit(fn, *args, **kwargs)
+        future.add_done_callback(_log_failure)
+        return future
+
+    def queue_depth(self) -> dict:
+        return {"io": self.io.queue_depth(), "cpu": self.cpu.queue_depth()}
+
+    def wait_cpu(self):
+        """Waits for the image analysis tasks submitted so far; ones submitted meanwhile don't hold it up.
+
+        Must not be called from the cpu pool itself.
+        """
+        wait(self.cpu.outstanding())
+
+    def drain_cpu(self):
+        """Waits for every image analysis task; they may still hand follow-up work to the io pool."""
+        self.cpu.shutdown(wait=True)
+
+    def drain(self):
+        """Finishes all queued work, image analysis first since it feeds the io pool."""
+        self.cpu.shutdown(wait=True)
+        self.io.shutdown(wait=True)
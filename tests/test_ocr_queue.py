@@ -0,0 +1,77 @@
+import os
+import sys
+from concurrent.futures import Future
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ocr_engine import EagerOCRQueue, OCRLatency
+
+
+class StubEngine:
+    """Records what it was given; jobs finish at once like cache hits, or when the test completes them."""
+
+    workers = 1
+
+    def __init__(self, synchronous=True, hold_first=False):
+        self.synchronous = synchronous
+        self.hold_first = hold_first
+        self.submitted = []
+        self.futures = []
+
+    def submit(self, image_path, crop_top=0, image_type=None, buffer=None):
+        self.submitted.append(image_path)
+        future = Future()
+        if self.synchronous and not (self.hold_first and len(self.submitted) == 1):
+            future.set_result({"path": image_path, "text": image_path, "error": None})
+        else:
+            self.futures.append(future)
+        return future
+
+    def map(self, image_paths, crops=None, image_type=None):
+        return [{"path": path, "text": path, "error": None} for path in image_paths]
+
+
+def test_synchronous_completions_do_not_recurse():
+    engine = StubEngine(hold_first=True)
+    queue = EagerOCRQueue(engine, latency=OCRLatency())
+    paths = [f"img-{idx}.png" for idx in range(5000)]
+    for path in paths:
+        queue.enqueue(path, priority="backfill")
+    # Everything but the first job waits behind it, then completes inside submit() one after another
+    assert queue.depth() == {"queued": len(paths) - 1, "in_flight": 1}
+    engine.futures[0].set_result({"path": paths[0], "text": paths[0], "error": None})
+    results = list(queue.collect(paths))
+    assert [result["text"] for result in results] == paths
+    assert queue.pending_count() == 0
+
+
+def test_higher_priority_jobs_overtake_queued_ones():
+    engine = StubEngine(synchronous=False)
+    queue = EagerOCRQueue(engine, latency=OCRLatency())
+    # Keeps the only worker busy while the rest queue up
+    queue.enqueue("running.png", priority="backfill")
+    queue.enqueue("backfill-1.png", priority="backfill")
+    queue.enqueue("capture-1.png", priority="capture")
+    queue.enqueue("backfill-2.png", priority="backfill")
+    queue.enqueue("interactive.png", priority="interactive")
+    queue.enqueue("capture-2.png", priority="capture")
+    assert engine.submitted == ["running.png"]
+    assert queue.depth() == {"queued": 5, "in_flight": 1}
+
+    while len(engine.futures) < 6:
+        future = engine.futures[len(engine.submitted) - 1]
+        future.set_result({"path": None, "text": "", "error": None})
+    engine.futures[-1].set_result({"path": None, "text": "", "error": None})
+
+    assert engine.submitted == ["running.png", "interactive.png", "capture-1.png", "capture-2.png",
+                                "backfill-1.png", "backfill-2.png"]
+    assert queue.depth() == {"queued": 0, "in_flight": 0}
+
+
+def test_unknown_priority_is_rejected():
+    queue = EagerOCRQueue(StubEngine(), latency=OCRLatency())
+    try:
+        queue.enqueue("img.png", priority="urgent")
+    except ValueError:
+        return
+    raise AssertionError("enqueue accepted an unknown priority")
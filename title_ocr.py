@@ -0,0 +1,81 @@
+import os
+import time
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from ocr_engine import OCR_BACKEND, OCR_BACKENDS, ocr_latency
+from image_preprocess import (to_grayscale, crop_uniform_borders, adaptive_binarize, estimate_x_height,
+                              rescale_to_x_height)
+
+# Name captures slower than this are reported as over target
+TITLE_LATENCY_TARGET_MS = int(os.environ.get("TITLE_LATENCY_TARGET_MS", "200"))
+# Page segmentation: one text line, or one block when a long name wraps onto several lines
+TITLE_PSM_LINE = 7
+TITLE_PSM_BLOCK = 6
+# Ink runs shorter than this many rows are underlines or specks, not text lines
+MIN_LINE_ROWS = 3
+
+
+def prepare_title(img: Image.Image) -> Tuple[np.ndarray, int]:
+    """Crops a name capture to its text and scales it to a size Tesseract reads well; returns it with its line count."""
+    gray = to_grayscale(img)
+    # Light text on a dark title bar becomes dark text on light
+    if np.median(gray) < 128:
+        gray = 255 - gray
+    gray = crop_uniform_borders(gray)
+    binary = adaptive_binarize(gray)
+    gray = rescale_to_x_height(gray, estimate_x_height(binary))
+    # Runs of rows with ink, from where each starts to where it ends
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], (binary == 0).any(axis=1).astype(np.int8), [0]])))
+    lines = int(((edges[1::2] - edges[::2]) >= MIN_LINE_ROWS).sum())
+    return gray, lines
+
+
+class TitleReader:
+    """Reads chapter and section names from name captures, on a Tesseract instance of its own kept warm.
+
+    start() loads the language model in the background while the operator is still answering prompts, so
+    the first name capture doesn't pay for it. The OCR worker processes are separate and run at a lower
+    priority, so a read here is the "interactive" class and never waits behind section OCR.
+    """
+
+    def __init__(self, backend: Optional[str] = None):
+        self.backend_name = backend or OCR_BACKEND
+        self._backend = None
+        self._lock = threading.Lock()
+
+    def _get_backend(self):
+        if self._backend is None:
+            self._backend = OCR_BACKENDS[self.backend_name]()
+            # One tiny read loads everything Tesseract initialises lazily
+            self._backend.image_to_string(Image.new("L", (32, 16), 255), TITLE_PSM_LINE)
+        return self._backend
+
+    def warm_up(self):
+        with self._lock:
+            self._get_backend()
+
+    def start(self):
+        threading.Thread(target=self.warm_up, name="title-ocr-warm-up", daemon=True).start()
+
+    def read(self, img: Image.Image) -> Tuple[str, float]:
+        """The name in a capture, on one line, and the seconds it took to read."""
+        start = time.perf_counter()
+        gray, lines = prepare_title(img)
+        psm = TITLE_PSM_LINE if lines <= 1 else TITLE_PSM_BLOCK
+        with self._lock:
+            text = self._get_backend().image_to_string(gray, psm)
+        seconds = time.perf_counter() - start
+        ocr_latency.record("interactive", 0.0, seconds)
+        return " ".join(text.split()), seconds
+
+
+def latency_note(seconds: float) -> str:
+    """e.g. "84 ms", or "312 ms, over the 200 ms target"."""
+    ms = seconds * 1000
+    if ms > TITLE_LATENCY_TARGET_MS:
+        return f"{ms:.0f} ms, over the {TITLE_LATENCY_TARGET_MS} ms target"
+    return f"{ms:.0f} ms"